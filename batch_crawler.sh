@@ -1,12 +1,16 @@
 #!/bin/bash
 
 # Batch crawler script for movie quotes
-# This script runs the crawler in batches until all movies are processed
+# This script runs every batch inside one long-lived crawler process
+# (crawler/run.py --continuous): the movie index is fetched once, batches are
+# fed into the running crawler with a pause between them, and a checkpoint is
+# written after each batch so an interrupted run resumes where it stopped.
 
 # Configuration
 BATCH_SIZE=100
-START_INDEX=0
+START_INDEX=""  # empty means resume from the last checkpoint (or 0)
 MAX_MOVIES=0  # 0 means no limit
+LETTERS="Z"
 DELAY=10      # Delay between batches in seconds
 
 # Parse command line arguments
@@ -28,6 +32,10 @@ while [[ $# -gt 0 ]]; do
       DELAY="$2"
       shift 2
       ;;
+    --letters)
+      LETTERS="$2"
+      shift 2
+      ;;
     *)
       echo "Unknown option: $1"
       exit 1
@@ -37,7 +45,8 @@ done
 
 echo "Starting batch crawler with:"
 echo "  Batch size: $BATCH_SIZE"
-echo "  Start index: $START_INDEX"
+echo "  Start index: ${START_INDEX:-checkpoint}"
+echo "  Letters: $LETTERS"
 echo "  Max movies: $MAX_MOVIES (0 = no limit)"
 echo "  Delay between batches: $DELAY seconds"
 echo ""
@@ -45,40 +54,29 @@ echo ""
 # Create output directory
 mkdir -p crawler/logs
 
-# Run batches until completion or error
-CURRENT_INDEX=$START_INDEX
-BATCH_NUMBER=1
+# Run all batches in a single crawler process
 LOG_FILE="crawler/logs/batch_crawler_$(date +%Y%m%d_%H%M%S).log"
 
 echo "Logging to: $LOG_FILE"
 echo "Starting batch crawler at $(date)" > "$LOG_FILE"
 
-while true; do
-    echo "Running batch #$BATCH_NUMBER (index $CURRENT_INDEX)" | tee -a "$LOG_FILE"
-    
-    # Run the crawler with the current batch
-    python3 run_crawler.py --batch-size "$BATCH_SIZE" --start-index "$CURRENT_INDEX" --max-movies "$MAX_MOVIES" --no-display 2>&1 | tee -a "$LOG_FILE"
-    
-    # Check if the crawler exited with an error
-    if [ $? -ne 0 ]; then
-        echo "Error running batch #$BATCH_NUMBER. Check the log file for details." | tee -a "$LOG_FILE"
-        echo "To resume, run: ./batch_crawler.sh --start-index $CURRENT_INDEX" | tee -a "$LOG_FILE"
-        exit 1
-    fi
-    
-    # Calculate next index
-    CURRENT_INDEX=$((CURRENT_INDEX + BATCH_SIZE))
-    BATCH_NUMBER=$((BATCH_NUMBER + 1))
-    
-    # Check if we've reached the max movies limit
-    if [ "$MAX_MOVIES" -gt 0 ] && [ "$CURRENT_INDEX" -ge "$MAX_MOVIES" ]; then
-        echo "Reached max movies limit ($MAX_MOVIES). Crawler completed successfully." | tee -a "$LOG_FILE"
-        break
-    fi
-    
-    echo "Waiting $DELAY seconds before starting next batch..." | tee -a "$LOG_FILE"
-    sleep "$DELAY"
-done
+CMD=(python3 crawler/run.py --continuous
+     --batch-size "$BATCH_SIZE"
+     --batch-delay "$DELAY"
+     --max-movies "$MAX_MOVIES"
+     --letters "$LETTERS")
+if [ -n "$START_INDEX" ]; then
+    CMD+=(--start-index "$START_INDEX")
+fi
+
+"${CMD[@]}" 2>&1 | tee -a "$LOG_FILE"
+
+# Check if the crawler exited with an error
+if [ "${PIPESTATUS[0]}" -ne 0 ]; then
+    echo "Error running the batch crawler. Check the log file for details." | tee -a "$LOG_FILE"
+    echo "To resume from the last checkpoint, run: ./batch_crawler.sh --letters $LETTERS" | tee -a "$LOG_FILE"
+    exit 1
+fi
 
 echo "Batch crawler completed at $(date)" | tee -a "$LOG_FILE"
-echo "All batches completed successfully!" | tee -a "$LOG_FILE"
\ No newline at end of file
+echo "All batches completed successfully!" | tee -a "$LOG_FILE"
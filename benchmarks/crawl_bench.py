@@ -0,0 +1,195 @@
+"""
+End-to-end crawl throughput benchmark against the local stand-in site.
+
+Starts benchmarks/fake_site.py in a separate process, runs MovieQuotesSpider
+over every letter it serves with the project settings (HTTP cache, job
+directory and item pipelines disabled), and reports movies/sec, quotes/sec,
+peak RSS and download latency percentiles.
+
+    python benchmarks/crawl_bench.py --movies-per-letter 300 --latency 0.05
+    python benchmarks/crawl_bench.py --set POLITENESS_MAX_RATE=50 --min-movies-per-sec 20
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import socket
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT_DIR)
+sys.path.append(os.path.join(ROOT_DIR, "crawler"))
+sys.path.append(os.path.join(ROOT_DIR, "benchmarks"))
+os.environ.setdefault('SCRAPY_SETTINGS_MODULE', 'crawler.settings')
+
+from scrapy import signals
+from scrapy.crawler import CrawlerProcess
+from scrapy.utils.project import get_project_settings
+from spiders.movie_quotes_spider import MovieQuotesSpider
+from fake_site import add_site_arguments, serve, site_options
+
+
+def _run_server(port, options):
+    server = serve(port=port, **options)
+    server.serve_forever()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"Stand-in site did not start on port {port}")
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+class BenchCollector:
+    """Collects per-response latency and item counts through Scrapy signals."""
+
+    def __init__(self, crawler):
+        self.latencies = []
+        self.statuses = {}
+        self.retries = 0
+        self.movies = 0
+        self.quotes = 0
+        self.started = None
+        self.finished = None
+        crawler.signals.connect(self.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(self.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(self.response_received, signal=signals.response_received)
+        crawler.signals.connect(self.item_scraped, signal=signals.item_scraped)
+
+    def spider_opened(self, spider):
+        self.started = time.perf_counter()
+
+    def spider_closed(self, spider):
+        self.finished = time.perf_counter()
+        # Downloader-level counts include responses consumed by the retry middleware
+        prefix = 'downloader/response_status_count/'
+        stats = spider.crawler.stats.get_stats()
+        self.statuses = {key[len(prefix):]: value for key, value in stats.items() if key.startswith(prefix)}
+        self.retries = stats.get('retry/count', 0)
+
+    def response_received(self, response, request, spider):
+        if 'download_latency' in request.meta:
+            self.latencies.append(request.meta['download_latency'])
+
+    def item_scraped(self, item, response, spider):
+        self.movies += 1
+        self.quotes += len(item.get('quotes', []))
+
+    def report(self):
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        latencies = sorted(self.latencies)
+        return {
+            'elapsed_sec': round(elapsed, 3),
+            'movies': self.movies,
+            'quotes': self.quotes,
+            'movies_per_sec': round(self.movies / elapsed, 2),
+            'quotes_per_sec': round(self.quotes / elapsed, 2),
+            'responses': len(latencies),
+            'statuses': dict(sorted(self.statuses.items())),
+            'retries': self.retries,
+            'latency_p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+            'latency_p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+            'latency_p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+            'latency_max_ms': round((latencies[-1] if latencies else 0.0) * 1000, 2),
+            'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        }
+
+
+def parse_overrides(pairs):
+    overrides = {}
+    for pair in pairs:
+        name, _, value = pair.partition('=')
+        try:
+            overrides[name] = json.loads(value)
+        except json.JSONDecodeError:
+            overrides[name] = value
+    return overrides
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark MovieQuotesSpider against a local stand-in site')
+    add_site_arguments(parser)
+    parser.add_argument('--extractor', default=None,
+                        help='Extraction engine to use (default: QUOTES_EXTRACTOR setting)')
+    parser.add_argument('--set', action='append', default=[], metavar='NAME=VALUE',
+                        help='Override a Scrapy setting, e.g. --set CONCURRENT_REQUESTS=32')
+    parser.add_argument('--min-movies-per-sec', type=float, default=0.0,
+                        help='Exit with an error if throughput falls below this (for CI)')
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+    args = parser.parse_args()
+
+    options = site_options(args)
+    port = free_port()
+    server = multiprocessing.get_context('spawn').Process(target=_run_server, args=(port, options), daemon=True)
+    server.start()
+    try:
+        wait_for_port(port)
+
+        settings = get_project_settings()
+        settings.set('HTTPCACHE_ENABLED', False, priority='cmdline')
+        settings.set('JOBDIR', None, priority='cmdline')
+        settings.set('ITEM_PIPELINES', {}, priority='cmdline')
+        settings.set('LOG_LEVEL', 'WARNING', priority='cmdline')
+        for name, value in parse_overrides(args.set).items():
+            settings.set(name, value, priority='cmdline')
+
+        process = CrawlerProcess(settings, install_root_handler=True)
+        crawler = process.create_crawler(MovieQuotesSpider)
+        collector = BenchCollector(crawler)
+        with tempfile.TemporaryDirectory() as state_dir:
+            spider_args = {
+                'base_url': f"http://127.0.0.1:{port}",
+                'letters': ','.join(options['letters']),
+                'batch_size': 0,
+                'state_dir': state_dir,
+            }
+            if args.extractor:
+                spider_args['extractor'] = args.extractor
+            process.crawl(crawler, **spider_args)
+            process.start()
+    finally:
+        server.terminate()
+        server.join()
+
+    report = collector.report()
+    report['site'] = options
+    report['settings_overrides'] = parse_overrides(args.set)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"Crawled {report['movies']} movies / {report['quotes']} quotes in {report['elapsed_sec']}s")
+        print(f"  movies/sec:   {report['movies_per_sec']}")
+        print(f"  quotes/sec:   {report['quotes_per_sec']}")
+        print(f"  latency p50/p95/p99/max (ms): {report['latency_p50_ms']} / {report['latency_p95_ms']} / "
+              f"{report['latency_p99_ms']} / {report['latency_max_ms']}")
+        print(f"  statuses:     {report['statuses']} ({report['retries']} retries)")
+        print(f"  peak RSS:     {report['peak_rss_mb']} MB")
+
+    if args.min_movies_per_sec and report['movies_per_sec'] < args.min_movies_per_sec:
+        print(f"FAIL: {report['movies_per_sec']} movies/sec is below {args.min_movies_per_sec}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
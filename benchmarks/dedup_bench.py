@@ -0,0 +1,145 @@
+"""
+Benchmark near-duplicate quote clustering (crawler/dedup.py).
+
+Builds synthetic corpora of increasing size from the words of
+ddl/quotes_sample.csv. A share of the quotes are variants of earlier ones
+(a word replaced or dropped, a speaker title added), the way re-crawls and
+remakes repeat dialogue. Each corpus is clustered with MinHash/LSH, and the
+benchmark reports quotes/sec, how many variants landed in their original's
+cluster (recall) and how many unrelated quotes were merged. The time per
+quote should stay flat as the corpus grows. --brute also times exhaustive
+pairwise signature comparison on the smaller corpora, which grows
+quadratically.
+
+    python benchmarks/dedup_bench.py --sizes 10000,100000,1000000
+    python benchmarks/dedup_bench.py --sizes 2000,4000,8000 --brute --json
+"""
+import argparse
+import csv
+import json
+import os
+import random
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_CSV = os.path.join(ROOT_DIR, "ddl", "quotes_sample.csv")
+sys.path.append(ROOT_DIR)
+
+from crawler.dedup import THRESHOLD, cluster_quotes, signature, similarity
+from crawler.search import tokenize
+
+SPEAKERS = ["Del Gue", "Jeremiah Johnson", "William Stryker", "Dr. Sam Brant", "Bear Claw", "Detective"]
+TITLES = ["Colonel", "Dr.", "Old", "Young"]
+BRUTE_LIMIT = 10000
+
+
+def load_vocabulary(path):
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        words = [word for row in csv.DictReader(f) for word in tokenize(row.get('quote_text') or '')]
+    return sorted(set(words))
+
+
+def make_corpus(size, vocabulary, variant_share, rng):
+    """
+    Return (texts, sources): sources[i] is the index of the quote that
+    quote i is a variant of, or None for an original quote.
+    """
+    texts = []
+    sources = []
+    for i in range(size):
+        if texts and rng.random() < variant_share:
+            # Variants of variants count as variants of the original
+            source = rng.randrange(len(texts))
+            if sources[source] is not None:
+                source = sources[source]
+            speaker, words = texts[source].split(': ', 1)
+            words = words.split()
+            edit = rng.random()
+            if edit < 0.4:
+                words[rng.randrange(len(words))] = rng.choice(vocabulary)
+            elif edit < 0.8:
+                del words[rng.randrange(len(words))]
+            else:
+                speaker = f"{rng.choice(TITLES)} {speaker}"
+            texts.append(f"{speaker}: {' '.join(words)}")
+            sources.append(source)
+        else:
+            words = rng.choices(vocabulary, k=rng.randint(12, 40))
+            texts.append(f"{rng.choice(SPEAKERS)}: {' '.join(words)}")
+            sources.append(None)
+    return texts, sources
+
+
+def score(clusters, sources):
+    """(recall of variants, share of originals merged into another original's cluster)."""
+    variants = [(i, source) for i, source in enumerate(sources) if source is not None]
+    found = sum(clusters[i] == clusters[source] for i, source in variants)
+    originals = [i for i, source in enumerate(sources) if source is None]
+    merged = len(originals) - len({clusters[i] for i in originals})
+    return (found / len(variants) if variants else 1.0), merged / len(originals)
+
+
+def brute_force(texts):
+    signatures = [signature(text) for text in texts]
+    pairs = 0
+    for i, a in enumerate(signatures):
+        for b in signatures[:i]:
+            if similarity(a, b) >= THRESHOLD:
+                pairs += 1
+    return pairs
+
+
+def bench(size, vocabulary, variant_share, seed, brute):
+    texts, sources = make_corpus(size, vocabulary, variant_share, random.Random(seed))
+    start = time.perf_counter()
+    clusters = cluster_quotes(texts)
+    elapsed = time.perf_counter() - start
+    recall, merged = score(clusters, sources)
+    result = {
+        'quotes': size,
+        'clusters': len(set(clusters)),
+        'elapsed_sec': round(elapsed, 3),
+        'quotes_per_sec': round(size / elapsed, 1),
+        'usec_per_quote': round(elapsed / size * 1e6, 2),
+        'variant_recall': round(recall, 4),
+        'originals_merged': round(merged, 5),
+    }
+    if brute and size <= BRUTE_LIMIT:
+        start = time.perf_counter()
+        brute_force(texts)
+        result['brute_force_sec'] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark MinHash/LSH near-duplicate clustering')
+    parser.add_argument('--sizes', default='10000,50000,200000',
+                        help='Comma-separated corpus sizes in quotes (default: 10000,50000,200000)')
+    parser.add_argument('--variant-share', type=float, default=0.2,
+                        help='Share of quotes that are variants of earlier ones (default: 0.2)')
+    parser.add_argument('--seed', type=int, default=1, help='Random seed (default: 1)')
+    parser.add_argument('--brute', action='store_true',
+                        help=f'Also time exhaustive pairwise comparison (corpora up to {BRUTE_LIMIT} quotes)')
+    parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+    args = parser.parse_args()
+
+    vocabulary = load_vocabulary(SAMPLE_CSV)
+    results = [bench(int(size), vocabulary, args.variant_share, args.seed, args.brute)
+               for size in args.sizes.split(',')]
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+
+    print(f"{len(vocabulary)} words, {args.variant_share:.0%} variants, threshold {THRESHOLD}\n")
+    print(f"{'quotes':>10} {'clusters':>10} {'sec':>8} {'quotes/s':>10} {'us/quote':>9} "
+          f"{'recall':>7} {'merged':>8} {'brute sec':>10}")
+    for r in results:
+        brute = f"{r['brute_force_sec']:>10}" if 'brute_force_sec' in r else f"{'-':>10}"
+        print(f"{r['quotes']:>10} {r['clusters']:>10} {r['elapsed_sec']:>8} {r['quotes_per_sec']:>10} "
+              f"{r['usec_per_quote']:>9} {r['variant_recall']:>7.1%} {r['originals_merged']:>8.3%} {brute}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,220 @@
+"""
+Benchmark the bulk ETL load on synthetic corpora (benchmarks/synth_corpus.py).
+
+For every corpus size a corpus is generated (or reused from --corpus-dir)
+and loaded into a throwaway database the way
+``claude3-7-quotes-etl.py load --bulk`` loads it: results files are read
+record by record, batches go through the storage's staging load and every
+batch is committed with its load manifest offset. Each size runs in a fresh
+process so its peak RSS is its own. The report gives records, quotes and
+staged rows (movies, quotes and speaker turns) per second, peak RSS, and the
+time spent in each phase. Peak RSS includes the pages of a memory-mapped
+SQLite file; the peak anonymous RSS (heap, sampled after every batch on
+Linux) is what the loader itself holds. Phases:
+
+    checksum   file checksums for the load manifest
+    parse      reading and decoding records (crawler.readers)
+    title      title and URL parsing (crawler.db.parse_movies)
+    transform  splitting quotes into turns and hashing them (crawler.db.staging_rows)
+    insert     the storage's batch load and manifest update
+    commit     committing each batch
+    dedup      near-duplicate clustering afterwards (with --dedup)
+
+The embedded SQLite backend needs nothing. For PostgreSQL, --dsn names a
+server where the benchmark may create and drop a scratch database.
+
+    python benchmarks/etl_bench.py --sizes 100000,1000000
+    python benchmarks/etl_bench.py --sizes 1000000 --backend postgres --dsn "dbname=postgres" --json
+"""
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT_DIR)
+sys.path.append(os.path.join(ROOT_DIR, "benchmarks"))
+
+from crawler.db import file_checksum, parse_movies, staging_rows
+from crawler.readers import iter_movie_records, result_files
+from crawler.storage import PostgresStorage, SqliteStorage
+from synth_corpus import FORMATS, write_corpus
+
+PHASES = ('checksum', 'parse', 'title', 'transform', 'insert', 'commit', 'dedup')
+
+
+def anonymous_rss_mb():
+    """Resident anonymous memory of this process in MB, or None off Linux."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('RssAnon:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+class PhaseTimer:
+    def __init__(self):
+        self.seconds = dict.fromkeys(PHASES, 0.0)
+
+    def __call__(self, phase, func, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        self.seconds[phase] += time.perf_counter() - start
+        return result
+
+
+def scratch_database(dsn, name):
+    """Create database name on the server dsn points to; return its DSN."""
+    import psycopg2
+    from psycopg2.extensions import make_dsn
+
+    admin = psycopg2.connect(dsn)
+    admin.autocommit = True
+    with admin.cursor() as cur:
+        cur.execute(f'DROP DATABASE IF EXISTS "{name}"')
+        cur.execute(f'CREATE DATABASE "{name}"')
+    admin.close()
+    return make_dsn(dsn, dbname=name)
+
+
+def drop_database(dsn, name):
+    import psycopg2
+
+    admin = psycopg2.connect(dsn)
+    admin.autocommit = True
+    with admin.cursor() as cur:
+        cur.execute(f'DROP DATABASE IF EXISTS "{name}"')
+    admin.close()
+
+
+def load(storage, corpus_dir, batch_size, dedup):
+    """Load a corpus like the bulk ETL, timing each phase."""
+    timer = PhaseTimer()
+    records = movies = quotes = rows = 0
+    peak_anon = None
+    started = time.perf_counter()
+    for path in result_files(corpus_dir):
+        checksum = timer('checksum', file_checksum, path)
+        reader = iter_movie_records(path)
+        loaded = 0
+        while True:
+            batch = timer('parse', list, itertools.islice(reader, batch_size))
+            if not batch:
+                break
+            parsed = timer('title', parse_movies, batch)
+            staged = timer('transform', staging_rows, parsed)
+            batch_movies, batch_quotes = timer('insert', storage.load_movie_rows, staged, 'etl')
+            loaded += len(batch)
+            timer('insert', storage.record_load_progress, os.path.abspath(path), checksum, loaded)
+            timer('commit', storage.commit)
+            records += len(batch)
+            movies += batch_movies
+            quotes += batch_quotes
+            rows += sum(len(table) for table in staged)
+            anon = anonymous_rss_mb()
+            if anon is not None:
+                peak_anon = max(peak_anon or 0, anon)
+        storage.record_load_progress(os.path.abspath(path), checksum, loaded, completed=True)
+        storage.commit()
+    if dedup:
+        timer('dedup', storage.dedup_stored_quotes)
+        storage.commit()
+    elapsed = time.perf_counter() - started
+    load_elapsed = elapsed - timer.seconds['dedup']
+    return {
+        'records': records,
+        'movies': movies,
+        'quotes': quotes,
+        'staged_rows': rows,
+        'elapsed_sec': round(elapsed, 3),
+        'records_per_sec': round(records / load_elapsed, 1),
+        'quotes_per_sec': round(quotes / load_elapsed, 1),
+        'rows_per_sec': round(rows / load_elapsed, 1),
+        'peak_anon_rss_mb': None if peak_anon is None else round(peak_anon, 1),
+        'phases_sec': {phase: round(seconds, 3) for phase, seconds in timer.seconds.items()},
+    }
+
+
+def run(backend, dsn, corpus_dir, batch_size, dedup, mmap_size):
+    """Load a corpus into a scratch database; runs in its own process."""
+    with tempfile.TemporaryDirectory() as scratch_dir:
+        if backend == 'sqlite':
+            storage = SqliteStorage(os.path.join(scratch_dir, "quotes.sqlite3"), mmap_size)
+        else:
+            name = f"etl_bench_{os.getpid()}"
+            storage = PostgresStorage(scratch_database(dsn, name))
+        try:
+            storage.create_schema()
+            result = load(storage, corpus_dir, batch_size, dedup)
+        finally:
+            storage.close()
+            if backend == 'postgres':
+                drop_database(dsn, name)
+    result['peak_rss_mb'] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    return result
+
+
+def bench(size, args, work_dir):
+    corpus_dir = os.path.join(args.corpus_dir or work_dir, f"{size}-{args.format}-{args.seed}")
+    if not result_files(corpus_dir):
+        start = time.perf_counter()
+        corpus = write_corpus(corpus_dir, size, args.quotes_per_movie, args.format, seed=args.seed)
+        print(f"Generated {corpus['quotes']} quotes ({corpus['bytes'] / 1e6:.1f} MB) "
+              f"in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+    with multiprocessing.get_context('spawn').Pool(1) as pool:
+        result = pool.apply(run, (args.backend, args.dsn, corpus_dir, args.batch_size, args.dedup,
+                                  args.mmap_size))
+    return {'size': size, 'corpus_mb': round(sum(map(os.path.getsize, result_files(corpus_dir))) / 1e6, 1),
+            **result}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the bulk ETL load on synthetic corpora')
+    parser.add_argument('--sizes', default='100000,1000000',
+                        help='Comma-separated corpus sizes in quotes (default: 100000,1000000)')
+    parser.add_argument('--backend', choices=('sqlite', 'postgres'), default='sqlite',
+                        help='Storage to load into (default: sqlite)')
+    parser.add_argument('--dsn', default=os.environ.get('POSTGRES_DSN'),
+                        help='PostgreSQL server to create the scratch database on (default: POSTGRES_DSN)')
+    parser.add_argument('--batch-size', type=int, default=1000, help='Records per batch (default: 1000)')
+    parser.add_argument('--quotes-per-movie', type=int, default=10,
+                        help='Average quotes per movie (default: 10)')
+    parser.add_argument('--format', choices=FORMATS, default='json', help='Results file format (default: json)')
+    parser.add_argument('--corpus-dir', default=None,
+                        help='Keep generated corpora here and reuse them on later runs (default: a temp dir)')
+    parser.add_argument('--mmap-size', type=int, default=1 << 30,
+                        help='SQLite mmap_size in bytes, 0 to read through the page cache only (default: 1 GiB)')
+    parser.add_argument('--dedup', action='store_true', help='Also time near-duplicate clustering')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed (default: 0)')
+    parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+    args = parser.parse_args()
+    if args.backend == 'postgres' and not args.dsn:
+        parser.error('--backend postgres needs --dsn or POSTGRES_DSN')
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        results = [bench(int(size), args, work_dir) for size in args.sizes.split(',')]
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+
+    print(f"{args.backend}, batches of {args.batch_size}, {args.format} files\n")
+    print(f"{'quotes':>10} {'MB':>7} {'sec':>8} {'records/s':>10} {'quotes/s':>10} {'rows/s':>10} {'RSS MB':>7} {'anon MB':>8}  "
+          + ' '.join(f"{phase:>9}" for phase in PHASES))
+    for r in results:
+        print(f"{r['quotes']:>10} {r['corpus_mb']:>7} {r['elapsed_sec']:>8} {r['records_per_sec']:>10} "
+              f"{r['quotes_per_sec']:>10} {r['rows_per_sec']:>10} {r['peak_rss_mb']:>7} "
+              f"{r['peak_anon_rss_mb'] if r['peak_anon_rss_mb'] is not None else '-':>8}  "
+              + ' '.join(f"{r['phases_sec'][phase]:>9}" for phase in PHASES))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,207 @@
+"""
+Local stand-in for quotes.net.
+
+Serves synthetic /allmovies/<letter> index pages and /movies/... pages whose
+quotes are /mquote/ links, at a configurable scale, with injected latency,
+server errors and 403s. Quote texts are drawn from crawler/results/ so pages
+look like the real thing.
+
+    python benchmarks/fake_site.py --port 8800 --movies-per-letter 500 --latency 0.05
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT_DIR, "benchmarks"))
+
+from pages import render_index_page, render_movie_page
+
+MOVIE_PATH = re.compile(r"^/movies/([a-z])_synthetic_movie_(\d+)_\((\d{4})\)_(\d+)$")
+FALLBACK_QUOTES = [
+    "Narrator: It was a dark and stormy night.",
+    "Alice: Where are we going?Bob: Somewhere the crawler can't follow.",
+    "[a door slams]Detective: Nobody leaves this room.",
+]
+
+
+def load_quote_pool(limit=5000):
+    """Collect real quote texts from crawler/results to fill synthetic pages."""
+    pool = []
+    results_dir = os.path.join(ROOT_DIR, "crawler", "results")
+    if os.path.isdir(results_dir):
+        decoder = json.JSONDecoder()
+        for name in sorted(os.listdir(results_dir)):
+            if not name.endswith(".json"):
+                continue
+            with open(os.path.join(results_dir, name), 'r', encoding='utf-8') as f:
+                try:
+                    movies, _ = decoder.raw_decode(f.read())
+                except json.JSONDecodeError:
+                    continue
+            for movie in movies:
+                pool.extend(quote['text'] for quote in movie.get('quotes', []))
+                if len(pool) >= limit:
+                    return pool
+    return pool or FALLBACK_QUOTES
+
+
+class FakeSite:
+    """Deterministic synthetic catalogue: same parameters, same pages."""
+
+    def __init__(self, letters="ABC", movies_per_letter=100, quotes_per_movie=10,
+                 latency=0.0, jitter=0.0, error_rate=0.0, forbidden_rate=0.0, seed=0):
+        self.letters = letters
+        self.movies_per_letter = movies_per_letter
+        self.quotes_per_movie = quotes_per_movie
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.forbidden_rate = forbidden_rate
+        self.seed = seed
+        self.quote_pool = load_quote_pool()
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+
+    def movie_path(self, letter, number):
+        year = 1950 + (number % 70)
+        movie_id = (ord(letter) * 100000) + number
+        return f"/movies/{letter.lower()}_synthetic_movie_{number}_({year})_{movie_id}"
+
+    def index_page(self, letter):
+        paths = [self.movie_path(letter, number) for number in range(self.movies_per_letter)]
+        return render_index_page(letter, paths)
+
+    def movie_page(self, path):
+        match = MOVIE_PATH.match(path)
+        if not match:
+            return None
+        letter, number, year, movie_id = match.groups()
+        rng = random.Random(zlib.crc32(path.encode('utf-8')) ^ self.seed)
+        count = rng.randint(0, 2 * self.quotes_per_movie)
+        quotes = [rng.choice(self.quote_pool) for _ in range(count)]
+        title = f"{letter} synthetic movie {number} ({year}) {movie_id}"
+        return render_movie_page(title, f"https://www.quotes.net{path}", quotes)
+
+    def fault(self):
+        """Pick an injected fault (403/500) for this request, or None."""
+        with self.lock:
+            self.requests += 1
+            roll = self.random.random()
+        if roll < self.forbidden_rate:
+            return 403
+        if roll < self.forbidden_rate + self.error_rate:
+            return 500
+        return None
+
+    def delay(self):
+        if self.latency or self.jitter:
+            with self.lock:
+                delay = max(0.0, self.random.gauss(self.latency, self.jitter))
+            time.sleep(delay)
+
+
+def make_handler(site):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            site.delay()
+            path = unquote(self.path.split('?', 1)[0])
+
+            fault = site.fault()
+            if fault:
+                return self.send_body(fault, f"<html><body><h1>Error {fault}</h1></body></html>")
+
+            if path.startswith('/allmovies/'):
+                letter = path.rsplit('/', 1)[-1].upper()
+                if letter in site.letters:
+                    return self.send_body(200, site.index_page(letter))
+            elif path.startswith('/movies/'):
+                page = site.movie_page(path)
+                if page is not None:
+                    return self.send_body(200, page)
+            self.send_body(404, "<html><body><h1>Not Found</h1></body></html>")
+
+        def send_body(self, status, text):
+            body = text.encode('utf-8')
+            self.send_response(status)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(port=8800, host="127.0.0.1", **site_options):
+    """Create the stand-in server (call serve_forever() on the result)."""
+    site = FakeSite(**site_options)
+    server = ThreadingHTTPServer((host, port), make_handler(site))
+    server.daemon_threads = True
+    return server
+
+
+def add_site_arguments(parser):
+    parser.add_argument('--letters', default="ABC",
+                        help='Letters that have an index page (default: ABC)')
+    parser.add_argument('--movies-per-letter', type=int, default=100,
+                        help='Movies linked from each index page (default: 100)')
+    parser.add_argument('--quotes-per-movie', type=int, default=10,
+                        help='Average quotes per movie page (default: 10)')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Mean response latency in seconds (default: 0)')
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help='Standard deviation of the latency in seconds (default: 0)')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='Fraction of requests answered with HTTP 500 (default: 0)')
+    parser.add_argument('--forbidden-rate', type=float, default=0.0,
+                        help='Fraction of requests answered with HTTP 403 (default: 0)')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Seed for the synthetic catalogue and fault injection (default: 0)')
+
+
+def site_options(args):
+    return {
+        'letters': args.letters.upper(),
+        'movies_per_letter': args.movies_per_letter,
+        'quotes_per_movie': args.quotes_per_movie,
+        'latency': args.latency,
+        'jitter': args.jitter,
+        'error_rate': args.error_rate,
+        'forbidden_rate': args.forbidden_rate,
+        'seed': args.seed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve a synthetic quotes.net for crawler benchmarks')
+    parser.add_argument('--host', default="127.0.0.1", help='Address to bind (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8800, help='Port to listen on (default: 8800)')
+    add_site_arguments(parser)
+    args = parser.parse_args()
+
+    server = serve(port=args.port, host=args.host, **site_options(args))
+    print(f"Serving synthetic quotes.net on http://{args.host}:{args.port}/allmovies/{args.letters[0].upper()}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+HTML rendering of quotes.net-style pages from crawled results.
+
+Used to build the parser fixtures and to serve the local stand-in site. The
+markup mirrors the live site: quotes are ``/mquote/`` links whose text nodes
+concatenate to the stored quote text (speaker names in ``<b>``, turns split by
+``<br>``), surrounded by navigation, sidebar and script chrome.
+"""
+import html
+import re
+import zlib
+
+# Quote text is stored with speaker turns glued together ("...universe.Dr. Sam Brant: ...")
+TURN_BOUNDARY = re.compile(r"(?<=[.!?\]])(?=[A-Z\[])")
+SPEAKER = re.compile(r"^([^:\[\]]{1,60}):( .*)$", re.S)
+
+NAV_LETTERS = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>{title} Quotes - Quotes.net</title>
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<link rel="stylesheet" href="/static/css/site.css">
+<script>window.dataLayer = window.dataLayer || []; function gtag(){{dataLayer.push(arguments);}}</script>
+</head>
+<body>
+<div id="header"><a href="/" class="logo">Quotes.net</a>
+<form action="/search" method="get"><input type="text" name="q"><button>Search</button></form></div>
+<ul class="nav">{nav}</ul>
+<div id="content">
+{content}
+</div>
+<div id="sidebar"><h3>Popular Movies</h3><ul>{sidebar}</ul></div>
+<div id="footer"><p>&copy; Quotes.net</p><a href="/privacy">Privacy</a> <a href="/terms">Terms</a></div>
+<script src="/static/js/site.js" async></script>
+</body>
+</html>
+"""
+
+
+def _nav():
+    return ''.join(f'<li><a href="/allmovies/{letter}">{letter}</a></li>' for letter in NAV_LETTERS)
+
+
+def _sidebar(count=15):
+    return ''.join(f'<li><a href="/popular/{i}">Popular movie #{i}</a></li>' for i in range(1, count + 1))
+
+
+def render_quote_markup(text):
+    """Render quote text so that its XPath string() equals the original text."""
+    parts = []
+    for turn in TURN_BOUNDARY.split(text):
+        match = SPEAKER.match(turn)
+        if match:
+            parts.append(f"<b>{html.escape(match.group(1))}:</b>{html.escape(match.group(2))}")
+        elif turn.startswith('['):
+            parts.append(f"<i>{html.escape(turn)}</i>")
+        else:
+            parts.append(html.escape(turn))
+    return '<br>'.join(parts)
+
+
+def quote_id(movie_url, position):
+    """Deterministic /mquote/ id for a quote."""
+    return zlib.crc32(f"{movie_url}#{position}".encode('utf-8')) % 10_000_000
+
+
+def render_movie_page(title, movie_url, quotes):
+    """Render a movie page for a title and a list of quote texts."""
+    blocks = []
+    for position, text in enumerate(quotes):
+        blocks.append(
+            '<div class="quote"><blockquote>'
+            f'<a href="/mquote/{quote_id(movie_url, position)}">{render_quote_markup(text)}</a>'
+            '</blockquote><div class="share"><a href="#" class="fb">Share</a>'
+            '<a href="#" class="tw">Tweet</a><span class="rating">Rate this quote</span></div></div>'
+        )
+    content = f"<h1>{html.escape(title)}</h1>\n<div class=\"quotes\">\n" + '\n'.join(blocks) + "\n</div>"
+    return PAGE_TEMPLATE.format(title=html.escape(title), nav=_nav(), content=content, sidebar=_sidebar())
+
+
+def render_index_page(letter, movie_paths):
+    """Render an /allmovies/<letter> index page linking to movie paths."""
+    links = ''.join(
+        f'<li><a href="{html.escape(path)}">{html.escape(path.rsplit("/", 1)[-1].replace("_", " "))}</a></li>'
+        for path in movie_paths
+    )
+    content = f"<h1>Movies starting with {letter}</h1>\n<ul class=\"movies\">{links}</ul>"
+    return PAGE_TEMPLATE.format(title=f"Movies - {letter}", nav=_nav(), content=content, sidebar=_sidebar())
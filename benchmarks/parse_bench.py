@@ -0,0 +1,143 @@
+"""
+Benchmark the movie page extraction engines.
+
+Runs every engine in crawler/extractors.py over the HTML fixtures in
+benchmarks/fixtures/, checks that they all produce the same title and quotes
+(and match the expected output stored next to each fixture), and reports
+pages/sec and per-page parse time.
+
+    python benchmarks/parse_bench.py --iterations 20
+    python benchmarks/parse_bench.py --make-fixtures   # rebuild fixtures from crawler/results
+"""
+import argparse
+import glob
+import json
+import os
+import statistics
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES_DIR = os.path.join(ROOT_DIR, "benchmarks", "fixtures")
+sys.path.append(os.path.join(ROOT_DIR, "crawler"))
+sys.path.append(os.path.join(ROOT_DIR, "benchmarks"))
+
+from scrapy.http import HtmlResponse
+from extractors import EXTRACTORS, get_extractor
+from pages import render_movie_page
+
+# Movies picked from crawler/results/ to cover small, large and multi-speaker pages
+FIXTURE_MOVIES = [
+    ("movies-X.json", 0),
+    ("movies-X.json", 1),
+    ("movies-Z.json", 0),
+    ("movies-Q.json", 5),
+    ("movies-Q.json", 13),
+    ("movies-Y.json", 0),
+    ("movies-UV.json", 1),
+    ("movies-UV.json", 3),
+]
+
+
+def make_fixtures():
+    """Render fixture pages (plus expected output) from crawled results."""
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+    for filename, position in FIXTURE_MOVIES:
+        with open(os.path.join(ROOT_DIR, "crawler", "results", filename), 'r', encoding='utf-8') as f:
+            decoder = json.JSONDecoder()
+            movies, _ = decoder.raw_decode(f.read())
+        movie = movies[position]
+        quotes = [quote['text'] for quote in movie['quotes']]
+        slug = movie['url'].rsplit('/', 1)[-1]
+        with open(os.path.join(FIXTURES_DIR, f"{slug}.html"), 'w', encoding='utf-8') as f:
+            f.write(render_movie_page(movie['title'], movie['url'], quotes))
+        with open(os.path.join(FIXTURES_DIR, f"{slug}.expected.json"), 'w', encoding='utf-8') as f:
+            json.dump({'url': movie['url'], 'title': movie['title'], 'quotes': quotes}, f, indent=1)
+        print(f"Wrote fixture {slug} ({len(quotes)} quotes)")
+
+
+def load_fixtures():
+    fixtures = []
+    for path in sorted(glob.glob(os.path.join(FIXTURES_DIR, "*.html"))):
+        with open(path, 'rb') as f:
+            body = f.read()
+        with open(path[:-len(".html")] + ".expected.json", 'r', encoding='utf-8') as f:
+            expected = json.load(f)
+        fixtures.append((expected['url'], body, expected))
+    return fixtures
+
+
+def check_output(fixtures):
+    """Every engine must reproduce the expected title and quotes exactly."""
+    ok = True
+    for name in EXTRACTORS:
+        extractor = get_extractor(name)
+        for url, body, expected in fixtures:
+            title, quotes = extractor.extract(HtmlResponse(url, body=body, encoding='utf-8'))
+            if (title or '').strip() != expected['title'] or quotes != expected['quotes']:
+                print(f"MISMATCH: {name} on {url}")
+                ok = False
+    return ok
+
+
+def bench(name, fixtures, iterations):
+    extractor = get_extractor(name)
+    timings = []
+    quotes = 0
+    for _ in range(iterations):
+        for url, body, _ in fixtures:
+            # A fresh response per page, as in a crawl (parsel caches the selector per response)
+            response = HtmlResponse(url, body=body, encoding='utf-8')
+            start = time.perf_counter()
+            _, extracted = extractor.extract(response)
+            timings.append(time.perf_counter() - start)
+            quotes += len(extracted)
+    total = sum(timings)
+    timings.sort()
+    return {
+        'engine': name,
+        'pages': len(timings),
+        'quotes': quotes,
+        'pages_per_sec': len(timings) / total,
+        'mean_ms': statistics.mean(timings) * 1000,
+        'p50_ms': timings[len(timings) // 2] * 1000,
+        'p95_ms': timings[int(len(timings) * 0.95) - 1] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the movie page extraction engines')
+    parser.add_argument('--iterations', type=int, default=20,
+                        help='Number of passes over the fixtures per engine (default: 20)')
+    parser.add_argument('--make-fixtures', action='store_true',
+                        help='Rebuild the HTML fixtures from crawler/results and exit')
+    parser.add_argument('--json', action='store_true',
+                        help='Print the results as JSON')
+    args = parser.parse_args()
+
+    if args.make_fixtures:
+        make_fixtures()
+        return 0
+
+    fixtures = load_fixtures()
+    if not fixtures:
+        print(f"No fixtures found in {FIXTURES_DIR}; run with --make-fixtures")
+        return 1
+    if not check_output(fixtures):
+        return 1
+
+    results = [bench(name, fixtures, args.iterations) for name in EXTRACTORS]
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+
+    print(f"{len(fixtures)} fixtures x {args.iterations} iterations\n")
+    print(f"{'engine':<8} {'pages/s':>10} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9}")
+    for result in results:
+        print(f"{result['engine']:<8} {result['pages_per_sec']:>10.1f} {result['mean_ms']:>9.3f} "
+              f"{result['p50_ms']:>9.3f} {result['p95_ms']:>9.3f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
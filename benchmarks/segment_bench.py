@@ -0,0 +1,111 @@
+"""
+Benchmark the dialogue segmentation engine.
+
+Checks crawler/dialogue.py against a few hand-written quotes, then segments
+every quote of ddl/quotes_sample.csv (or any CSV with a quote_text column)
+repeatedly and reports quotes/sec, turns/sec, MB/sec and how many turns got
+a speaker.
+
+    python benchmarks/segment_bench.py --iterations 50
+    python benchmarks/segment_bench.py --csv my_quotes.csv --json
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_CSV = os.path.join(ROOT_DIR, "ddl", "quotes_sample.csv")
+sys.path.append(os.path.join(ROOT_DIR, "crawler"))
+
+from dialogue import segment_quote, segment_quotes
+
+# (quote text, expected (speaker, line, stage_direction) turns)
+CASES = [
+    ("Dr. James Xavier: I'm blind...Dr. Sam Brant: My dear friend.",
+     [("Dr. James Xavier", "I'm blind...", None), ("Dr. Sam Brant", "My dear friend.", None)]),
+    ("[a door slams]Detective: Nobody leaves this room.",
+     [(None, None, "a door slams"), ("Detective", "Nobody leaves this room.", None)]),
+    ("Del Gue: [to Jeremiah] Just one thing though: does this buckskin fit?",
+     [("Del Gue", "Just one thing though: does this buckskin fit?", "to Jeremiah")]),
+    ("Peter Syme: But he's hung upFreeman: Doesn't matter.Lawson, the Fugitive: Yes.",
+     [("Peter Syme", "But he's hung up", None), ("Freeman", "Doesn't matter.", None),
+      ("Lawson, the Fugitive", "Yes.", None)]),
+    ("Happy people don't have dead grass",
+     [(None, "Happy people don't have dead grass", None)]),
+]
+
+
+def check_cases():
+    ok = True
+    for text, expected in CASES:
+        turns = [(turn.speaker, turn.line, turn.stage_direction) for turn in segment_quote(text)]
+        if turns != expected:
+            print(f"MISMATCH: {text!r}\n  got      {turns}\n  expected {expected}")
+            ok = False
+    return ok
+
+
+def load_quotes(path):
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        return [row['quote_text'] for row in csv.DictReader(f) if row.get('quote_text')]
+
+
+def bench(texts, iterations):
+    turns = 0
+    with_speaker = 0
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for _, turn in segment_quotes(texts):
+            turns += 1
+            if turn.speaker is not None:
+                with_speaker += 1
+    elapsed = time.perf_counter() - start
+    quotes = len(texts) * iterations
+    megabytes = sum(len(text.encode('utf-8')) for text in texts) * iterations / 1e6
+    return {
+        'quotes': quotes,
+        'turns': turns,
+        'elapsed_sec': round(elapsed, 4),
+        'quotes_per_sec': round(quotes / elapsed, 1),
+        'turns_per_sec': round(turns / elapsed, 1),
+        'mb_per_sec': round(megabytes / elapsed, 2),
+        'turns_per_quote': round(turns / quotes, 2),
+        'speaker_coverage': round(with_speaker / turns, 4) if turns else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the dialogue segmentation engine')
+    parser.add_argument('--csv', default=SAMPLE_CSV,
+                        help='CSV file with a quote_text column (default: ddl/quotes_sample.csv)')
+    parser.add_argument('--iterations', type=int, default=50,
+                        help='Number of passes over the quotes (default: 50)')
+    parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+    args = parser.parse_args()
+
+    if not check_cases():
+        return 1
+    texts = load_quotes(args.csv)
+    if not texts:
+        print(f"No quotes found in {args.csv}")
+        return 1
+
+    result = bench(texts, args.iterations)
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return 0
+
+    print(f"{len(texts)} quotes x {args.iterations} iterations from {args.csv}\n")
+    print(f"  quotes/sec:       {result['quotes_per_sec']}")
+    print(f"  turns/sec:        {result['turns_per_sec']}")
+    print(f"  MB/sec:           {result['mb_per_sec']}")
+    print(f"  turns per quote:  {result['turns_per_quote']}")
+    print(f"  speaker coverage: {result['speaker_coverage']:.1%} of turns")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,159 @@
+"""
+Generate synthetic crawler results files for ETL benchmarks.
+
+Movies are written the way the crawler writes them: one movies-<letter>
+file per index letter, each holding records with a "title (year) id"
+title, a quotes.net movie URL and a list of quotes. Quotes are dialogue
+glued together as on the site ("Speaker: line.Other speaker: line."),
+with one to four turns and an occasional [stage direction]. The words and
+speaker names come from ddl/quotes_sample.csv. A share of the movies repeat
+a quote, as the live site sometimes does, so the loader's dedup path runs
+too. Output is deterministic for a given seed.
+
+    python benchmarks/synth_corpus.py --quotes 1000000 --out /tmp/corpus
+    python benchmarks/synth_corpus.py --quotes 100000 --format jsonl --out /tmp/corpus-jsonl
+"""
+import argparse
+import csv
+import json
+import os
+import random
+import string
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_CSV = os.path.join(ROOT_DIR, "ddl", "quotes_sample.csv")
+sys.path.append(ROOT_DIR)
+
+from crawler.dialogue import segment_quote
+
+FALLBACK_SPEAKERS = ["Del Gue", "Jeremiah Johnson", "William Stryker", "Dr. Sam Brant", "Bear Claw"]
+STAGE_DIRECTIONS = ["laughs", "sighs", "to himself", "pause", "door slams", "whispering", "on phone"]
+LETTERS = string.ascii_uppercase
+FORMATS = ('json', 'jsonl')
+
+
+def load_sample(path):
+    """Words and speaker names of the sample quotes."""
+    words = set()
+    speakers = set()
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            for row in csv.DictReader(f):
+                for turn in segment_quote(row.get('quote_text') or ''):
+                    if turn.speaker:
+                        speakers.add(turn.speaker)
+                    words.update(word.strip('.,!?;:"()[]') for word in (turn.line or '').split())
+    words.discard('')
+    return sorted(words) or ["well", "you", "know", "what", "they", "say"], sorted(speakers) or FALLBACK_SPEAKERS
+
+
+class CorpusGenerator:
+    """Deterministic synthetic movies: same parameters, same records."""
+
+    def __init__(self, quotes_per_movie=10, repeat_share=0.02, seed=0, sample_path=SAMPLE_CSV):
+        self.quotes_per_movie = quotes_per_movie
+        self.repeat_share = repeat_share
+        self.random = random.Random(seed)
+        self.words, self.speakers = load_sample(sample_path)
+        self.initials = {letter: [word for word in self.words if word[0].upper() == letter] for letter in LETTERS}
+
+    def line(self):
+        words = self.random.choices(self.words, k=self.random.randint(3, 24))
+        words[0] = words[0].capitalize()
+        return ' '.join(words) + self.random.choice('..!?')
+
+    def quote(self):
+        parts = []
+        if self.random.random() < 0.1:
+            parts.append(f"[{self.random.choice(STAGE_DIRECTIONS)}]")
+        for _ in range(self.random.choice((1, 1, 2, 2, 3, 4))):
+            speaker = self.random.choice(self.speakers)
+            direction = f"[{self.random.choice(STAGE_DIRECTIONS)}] " if self.random.random() < 0.05 else ''
+            parts.append(f"{speaker}: {direction}{self.line()}")
+        return ''.join(parts)
+
+    def movie(self, letter, movie_id):
+        first = self.random.choice(self.initials[letter] or [letter])
+        words = [first] + self.random.choices(self.words, k=self.random.randint(0, 3))
+        title = ' '.join(word.lower() for word in words)
+        year = self.random.randint(1920, 2024)
+        slug = title.lower().replace(' ', '_')
+        quotes = [{'text': self.quote()} for _ in range(self.random.randint(0, 2 * self.quotes_per_movie))]
+        if quotes and self.random.random() < self.repeat_share:
+            quotes.append(dict(self.random.choice(quotes)))
+        return {
+            'title': f"{title} ({year}) {movie_id}",
+            'url': f"https://www.quotes.net/movies/{slug}_({year})_{movie_id}",
+            'quotes': quotes,
+        }
+
+    def movies(self, quotes):
+        """Yield (letter, record) until at least quotes quotes were generated."""
+        generated = 0
+        movie_id = 1000
+        while generated < quotes:
+            letter = self.random.choice(LETTERS)
+            movie_id += self.random.randint(1, 7)
+            movie = self.movie(letter, movie_id)
+            generated += len(movie['quotes'])
+            yield letter, movie
+
+
+def write_corpus(out_dir, quotes, quotes_per_movie=10, file_format='json', repeat_share=0.02, seed=0):
+    """
+    Write a corpus of at least quotes quotes into out_dir.
+
+    Returns:
+        dict: files, movies, quotes and bytes written
+    """
+    if file_format not in FORMATS:
+        raise ValueError(f"Unknown format {file_format!r}, expected one of {', '.join(FORMATS)}")
+    os.makedirs(out_dir, exist_ok=True)
+    generator = CorpusGenerator(quotes_per_movie, repeat_share, seed)
+    files = {}
+    movies = written = 0
+    try:
+        for letter, movie in generator.movies(quotes):
+            f = files.get(letter)
+            line = json.dumps(movie, ensure_ascii=False)
+            if f is None:
+                f = files[letter] = open(os.path.join(out_dir, f"movies-{letter}.{file_format}"), 'w',
+                                         encoding='utf-8')
+                if file_format == 'json':
+                    f.write('[\n')
+            elif file_format == 'json':
+                f.write(',\n')
+            f.write(line if file_format == 'json' else line + '\n')
+            movies += 1
+            written += len(movie['quotes'])
+    finally:
+        for f in files.values():
+            if file_format == 'json':
+                f.write('\n]\n')
+            f.close()
+    size = sum(os.path.getsize(f.name) for f in files.values())
+    return {'files': len(files), 'movies': movies, 'quotes': written, 'bytes': size}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate synthetic crawler results files')
+    parser.add_argument('--out', required=True, help='Directory to write the results files to')
+    parser.add_argument('--quotes', type=int, default=1000000, help='Quotes to generate (default: 1000000)')
+    parser.add_argument('--quotes-per-movie', type=int, default=10,
+                        help='Average quotes per movie (default: 10)')
+    parser.add_argument('--format', choices=FORMATS, default='json',
+                        help='JSON arrays as the crawler writes them, or JSON Lines (default: json)')
+    parser.add_argument('--repeat-share', type=float, default=0.02,
+                        help='Share of movies that list one quote twice (default: 0.02)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed (default: 0)')
+    args = parser.parse_args()
+
+    summary = write_corpus(args.out, args.quotes, args.quotes_per_movie, args.format, args.repeat_share, args.seed)
+    print(f"Wrote {summary['movies']} movies and {summary['quotes']} quotes in {summary['files']} files "
+          f"({summary['bytes'] / 1e6:.1f} MB) to {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
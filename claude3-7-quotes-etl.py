@@ -1,85 +1,58 @@
-import json
 import os
-import glob
-import sys
-import re
+import time
+import argparse
+import threading
+import itertools
+import multiprocessing
 import psycopg2
 from psycopg2.extras import execute_values
 
-def create_schema_and_tables(conn):
-    """Create the necessary schema and tables if they don't exist."""
-    with conn.cursor() as cur:
-        # Create schema
-        cur.execute("CREATE SCHEMA IF NOT EXISTS quotesnet;")
-        
-        # Create movies table with additional columns for year and movie_id
-        cur.execute("""
-        CREATE TABLE quotesnet.movies (
-            id SERIAL PRIMARY KEY,
-            title TEXT NOT NULL,
-            year INTEGER,
-            movie_id INTEGER,
-            url TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        );
-        """)
-        
-        # Create quotes table with foreign key reference to movies
-        cur.execute("""
-        CREATE TABLE IF NOT EXISTS quotesnet.quotes (
-            id SERIAL PRIMARY KEY,
-            movie_id INTEGER REFERENCES quotesnet.movies(id),
-            quote_text TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        );
-        """)
-        
-        # Create indexes for better performance
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_movie_title ON quotesnet.movies(title);")
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_movie_year ON quotesnet.movies(year);")
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_movie_movie_id ON quotesnet.movies(movie_id);")
-        cur.execute("CREATE INDEX IF NOT EXISTS idx_quote_movie_id ON quotesnet.quotes(movie_id);")
-        
-        conn.commit()
+from crawler.db import (
+    file_checksum, load_movies, parse_movie_title, parse_movie_url, record_load_progress,
+    segment_stored_quotes, update_stats
+)
+from crawler.readers import iter_movie_records, result_files
+from crawler.storage import PostgresStorage, open_storage
 
-def parse_movie_title(raw_title):
+def manifest_offset(storage, file_path, checksum, reload=False):
     """
-    Parse a raw movie title in the format "title (year) movie_id"
-    Returns a tuple of (title, year, movie_id)
+    Number of leading records of a file that the load manifest says are loaded,
+    or None when the whole file is. A file whose checksum changed is loaded again
+    from the start; quotes already stored are dropped by their content hash.
     """
-    # Regular expression to match the pattern: title (year) movie_id
-    pattern = r"(.*)\s*\((\d{4})(?:/[ivxlcdm]+)?\)\s*(\d+)$"
-    match = re.match(pattern, raw_title)
-    
-    if match:
-        title = match.group(1).strip()
-        year = int(match.group(2))
-        movie_id = int(match.group(3))
-        return title, year, movie_id
-    else:
-        # If the pattern doesn't match, return the original title and None for year and movie_id
-        return raw_title, None, None
-
-def process_json_files(conn, json_dir_path):
-    """Process all JSON files in the specified directory and insert data into the database."""
-    # Get all JSON files in the directory
-    json_files = glob.glob(os.path.join(json_dir_path, "*.json"))
+    state = None if reload else storage.get_load_state(file_path)
+    if state is None or state[0] != checksum:
+        return 0
+    _, records_loaded, completed = state
+    return None if completed else records_loaded
+
+def process_json_files(conn, json_dir_path, reload=False):
+    """Process all results files in the specified directory and insert data into the database."""
+    # Get all results files in the directory (JSON arrays or JSON Lines)
+    json_files = result_files(json_dir_path)
     
     if not json_files:
-        print(f"No JSON files found in {json_dir_path}")
+        print(f"No results files found in {json_dir_path}")
         return
     
     with conn.cursor() as cur:
         # Process each JSON file
         for json_file in json_files:
             print(f"Processing file: {json_file}")
+            file_path = os.path.abspath(json_file)
+            checksum = file_checksum(json_file)
+            if manifest_offset(PostgresStorage(conn=conn), file_path, checksum, reload) is None:
+                print(f"Skipping already loaded file: {json_file}")
+                continue
             
+            # Changes to the summary tables, applied in the file's transaction
+            movie_changes = []
+            quote_counts = []
+            records = 0
             try:
-                with open(json_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    
-                # Process each movie entry in the JSON file
-                for movie_entry in data:
+                # Process each movie entry in the file, read one at a time
+                for movie_entry in iter_movie_records(json_file):
+                    records += 1
                     raw_title = movie_entry.get('title')
                     url = movie_entry.get('url')
                     quotes_data = movie_entry.get('quotes', [])
@@ -88,8 +61,9 @@ def process_json_files(conn, json_dir_path):
                         print(f"Skipping entry without title in file {json_file}")
                         continue
                     
-                    # Parse the title to extract title, year, and movie_id
+                    # Parse the title to extract title, year, and movie_id (the URL's id wins)
                     title, year, movie_id = parse_movie_title(raw_title)
+                    movie_id = parse_movie_url(url) or movie_id
                     
                     # Insert or get movie ID
                     cur.execute(
@@ -102,11 +76,21 @@ def process_json_files(conn, json_dir_path):
                         db_movie_id = result[0]
                         print(f"Movie '{title}' already exists with ID {db_movie_id}")
                     else:
+                        # A conflicting row only has its title replaced; its old title
+                        # comes back too so the summary tables can move it
                         cur.execute(
-                            "INSERT INTO quotesnet.movies (title, year, movie_id, url) VALUES (%s, %s, %s, %s) RETURNING id",
-                            (title, year, movie_id, url)
+                            "WITH old AS (SELECT title, year FROM quotesnet.movies WHERE movie_id = %s) "
+                            "INSERT INTO quotesnet.movies (title, year, movie_id, url) VALUES (%s, %s, %s, %s) "
+                            "ON CONFLICT (movie_id) DO UPDATE SET title = EXCLUDED.title "
+                            "RETURNING id, (xmax = 0), (SELECT title FROM old), (SELECT year FROM old)",
+                            (movie_id, title, year, movie_id, url)
                         )
-                        db_movie_id = cur.fetchone()[0]
+                        db_movie_id, inserted, old_title, old_year = cur.fetchone()
+                        if inserted:
+                            movie_changes.append((title[:1].upper(), year, 1))
+                        else:
+                            movie_changes.append((title[:1].upper(), old_year, 1))
+                            movie_changes.append((old_title[:1].upper(), old_year, -1))
                         print(f"Inserted movie '{title}' ({year}, {movie_id}) with DB ID {db_movie_id}")
                     
                     # Insert quotes for this movie
@@ -114,65 +98,244 @@ def process_json_files(conn, json_dir_path):
                         quote_values = [(db_movie_id, quote.get('text')) for quote in quotes_data if quote.get('text')]
                         
                         if quote_values:
-                            execute_values(
+                            inserted = execute_values(
                                 cur,
-                                "INSERT INTO quotesnet.quotes (movie_id, quote_text) VALUES %s",
-                                quote_values
+                                "INSERT INTO quotesnet.quotes (movie_id, quote_text) VALUES %s "
+                                "ON CONFLICT (movie_id, content_hash) DO NOTHING RETURNING id",
+                                quote_values, fetch=True
                             )
+                            quote_counts.append((db_movie_id, len(inserted)))
                             print(f"Inserted {len(quote_values)} quotes for movie '{title}'")
                 
+                update_stats(cur, movie_changes, quote_counts)
+                record_load_progress(conn, file_path, checksum, records, completed=True)
                 conn.commit()
                 print(f"Successfully processed file: {json_file}")
                 
-            except json.JSONDecodeError:
-                print(f"Error: Invalid JSON format in file {json_file}")
-                conn.rollback()
             except Exception as e:
                 print(f"Error processing file {json_file}: {str(e)}")
                 conn.rollback()
 
-def display_info(conn):
-    """Display information about the database tables."""
-    with conn.cursor() as cur:
-        # Get total counts
-        cur.execute("SELECT COUNT(*) FROM quotesnet.movies")
-        total_movies = cur.fetchone()[0]
-        
-        cur.execute("SELECT COUNT(*) FROM quotesnet.quotes")
-        total_quotes = cur.fetchone()[0]
-        
-        print("\n=== Database Information ===")
-        print(f"Total Movies: {total_movies}")
-        print(f"Total Quotes: {total_quotes}")
-        
-        # Get movie counts grouped by first letter
-        cur.execute("""
-        SELECT 
-            UPPER(LEFT(title, 1)) AS first_letter,
-            COUNT(*) AS count
-        FROM quotesnet.movies
-        GROUP BY first_letter
-        ORDER BY first_letter
-        """)
-        
-        letter_counts = cur.fetchall()
-        
-        print("\n=== Movies by First Letter ===")
-        for letter, count in letter_counts:
-            print(f"{letter} = {count}")
-        
-        # Get average quotes per movie
-        cur.execute("""
-        SELECT AVG(quote_count) FROM (
-            SELECT movie_id, COUNT(*) as quote_count
-            FROM quotesnet.quotes
-            GROUP BY movie_id
-        ) AS subquery
-        """)
-        
-        avg_quotes = cur.fetchone()[0]
-        if avg_quotes:
-            print(f"\nAverage Quotes per Movie: {avg_quotes:.2f}")
+    # Split the new quotes into speaker turns (quotesnet.quote_lines)
+    segmented = segment_stored_quotes(conn)
+    print(f"Segmented {segmented} quotes into speaker turns")
+    cluster_new_quotes(PostgresStorage(conn=conn))
+
+def cluster_new_quotes(storage):
+    """Cluster the newly loaded quotes with their near-duplicates."""
+    start = time.perf_counter()
+    clustered = storage.dedup_stored_quotes()
+    print(f"Clustered {clustered} quotes by near-duplicate text in {time.perf_counter() - start:.2f}s")
+
+def iter_batches(records, batch_size):
+    """Group an iterable of records into lists of at most batch_size."""
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def print_file_throughput(json_file, records, movies, quotes, elapsed):
+    rate = records / elapsed if elapsed > 0 else 0
+    print(f"Loaded {json_file}: {records} records, {movies} new movies, {quotes} quotes "
+          f"in {elapsed:.2f}s ({rate:.0f} records/s)")
+
+def bulk_load_json_files(storage, json_dir_path, batch_size=1000, reload=False):
+    """
+    Stream all JSON files in the directory into the storage in batches.
+
+    Records are read one at a time and loaded in batches of batch_size. In
+    PostgreSQL each batch is copied into unlogged staging tables, its movies
+    are upserted on movie_id in one statement and its quotes moved across in
+    another. Every batch is committed together with the file's offset in the
+    load manifest. Re-runs skip loaded files and resume partially loaded ones.
+    """
+    json_files = result_files(json_dir_path)
+
+    if not json_files:
+        print(f"No results files found in {json_dir_path}")
+        return
+
+    total_movies = total_quotes = 0
+    started = time.perf_counter()
+    for json_file in json_files:
+        file_path = os.path.abspath(json_file)
+        checksum = file_checksum(json_file)
+        offset = manifest_offset(storage, file_path, checksum, reload)
+        if offset is None:
+            print(f"Skipping already loaded file: {json_file}")
+            continue
+        if offset:
+            print(f"Resuming {json_file} at record {offset}")
+
+        start = time.perf_counter()
+        records = movies = quotes = 0
+        try:
+            for batch in iter_batches(itertools.islice(iter_movie_records(json_file), offset, None), batch_size):
+                batch_movies, batch_quotes = storage.load_movies(batch, stage='etl')
+                records += len(batch)
+                storage.record_load_progress(file_path, checksum, offset + records)
+                storage.commit()
+                movies += batch_movies
+                quotes += batch_quotes
+            storage.record_load_progress(file_path, checksum, offset + records, completed=True)
+            storage.commit()
+        except Exception as e:
+            print(f"Error processing file {json_file}: {str(e)}")
+            storage.rollback()
+        print_file_throughput(json_file, records, movies, quotes, time.perf_counter() - start)
+        total_movies += movies
+        total_quotes += quotes
+
+    print(f"Bulk load finished: {total_movies} new movies, {total_quotes} quotes "
+          f"in {time.perf_counter() - started:.2f}s")
+    cluster_new_quotes(storage)
+
+# Per-process state of a parallel load worker: its connection and staging table name
+_worker = {}
+
+def _init_worker(db_params, counter):
+    with counter.get_lock():
+        counter.value += 1
+        _worker['stage'] = f"etl_{counter.value}"
+    _worker['conn'] = psycopg2.connect(**db_params)
+
+def _load_batch(task):
+    json_file, index, batch = task
+    conn = _worker['conn']
+    try:
+        movies, quotes = load_movies(conn, batch, stage=_worker['stage'])
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        return json_file, index, len(batch), 0, 0, str(e)
+    return json_file, index, len(batch), movies, quotes, None
+
+def parallel_load_json_files(conn, db_params, json_dir_path, workers, batch_size=1000, reload=False):
+    """
+    Load all JSON files in the directory with a pool of worker processes.
+
+    The main process streams records from the files and hands out batches of
+    batch_size, so large files are split across workers too. Each of the
+    workers holds one connection and its own staging tables, and commits
+    every batch it loads. At most two batches per worker are in flight, so
+    memory stays bounded however large the files are.
+
+    Batches finish out of order; the main process advances a file's offset in
+    the load manifest (on conn) over the batches finished without a gap.
+    """
+    json_files = result_files(json_dir_path)
+
+    if not json_files:
+        print(f"No results files found in {json_dir_path}")
+        return
+
+    # Look up every file in the manifest before the pool starts using conn
+    files = {}
+    for json_file in json_files:
+        file_path = os.path.abspath(json_file)
+        checksum = file_checksum(json_file)
+        offset = manifest_offset(PostgresStorage(conn=conn), file_path, checksum, reload)
+        if offset is None:
+            print(f"Skipping already loaded file: {json_file}")
+            continue
+        if offset:
+            print(f"Resuming {json_file} at record {offset}")
+        files[json_file] = {
+            'path': file_path, 'checksum': checksum, 'offset': offset, 'loaded': offset, 'sizes': [],
+            'done': set(), 'next': 0, 'read': False, 'records': 0, 'movies': 0, 'quotes': 0, 'failed': 0,
+            'start': None, 'end': None,
+        }
+    slots = threading.BoundedSemaphore(2 * workers)
+
+    def tasks():
+        for json_file, progress in files.items():
+            progress['start'] = time.perf_counter()
+            try:
+                records = itertools.islice(iter_movie_records(json_file), progress['offset'], None)
+                for index, batch in enumerate(iter_batches(records, batch_size)):
+                    slots.acquire()
+                    progress['sizes'].append(len(batch))
+                    yield json_file, index, batch
+                progress['read'] = True
+            except OSError as e:
+                print(f"Error reading file {json_file}: {str(e)}")
+
+    started = time.perf_counter()
+    context = multiprocessing.get_context('spawn')
+    counter = context.Value('i', 0)
+    with context.Pool(workers, initializer=_init_worker, initargs=(db_params, counter)) as pool:
+        for json_file, index, records, movies, quotes, error in pool.imap_unordered(_load_batch, tasks()):
+            slots.release()
+            progress = files[json_file]
+            progress['end'] = time.perf_counter()
+            if error:
+                progress['failed'] += records
+                print(f"Error loading a batch of {records} records from {json_file}: {error}")
+                continue
+            progress['records'] += records
+            progress['movies'] += movies
+            progress['quotes'] += quotes
+            progress['done'].add(index)
+            # Move the manifest offset over the batches finished without a gap
+            advanced = False
+            while progress['next'] in progress['done']:
+                progress['loaded'] += progress['sizes'][progress['next']]
+                progress['next'] += 1
+                advanced = True
+            if advanced:
+                record_load_progress(conn, progress['path'], progress['checksum'], progress['loaded'])
+                conn.commit()
+
+    for json_file, progress in files.items():
+        if progress['read'] and progress['next'] == len(progress['sizes']):
+            record_load_progress(conn, progress['path'], progress['checksum'], progress['loaded'], completed=True)
+            conn.commit()
+        start = progress['start'] or started
+        elapsed = (progress['end'] or start) - start
+        print_file_throughput(json_file, progress['records'], progress['movies'], progress['quotes'], elapsed)
+    total_records = sum(progress['records'] for progress in files.values())
+    elapsed = time.perf_counter() - started
+    print(f"Parallel load finished: {total_records} records, "
+          f"{sum(progress['movies'] for progress in files.values())} new movies, "
+          f"{sum(progress['quotes'] for progress in files.values())} quotes with {workers} workers "
+          f"in {elapsed:.2f}s ({total_records / elapsed:.0f} records/s)")
+    cluster_new_quotes(PostgresStorage(conn=conn))
+
+def display_info(storage, refresh=False):
+    """
+    Display information about the database tables.
+
+    Counts are read from the summary tables the loaders keep up to date, so
+    this does not scan movies or quotes. With refresh, the summary tables are
+    rebuilt from the data first.
+    """
+    start = time.perf_counter()
+    stats = storage.stats(refresh)
+    if refresh:
+        print(f"Rebuilt summary tables in {time.perf_counter() - start:.2f}s")
+
+    print("\n=== Database Information ===")
+    print(f"Total Movies: {stats['movies']}")
+    print(f"Total Quotes: {stats['quotes']}")
+    if stats['refreshed_at']:
+        print(f"Summary tables last rebuilt: {stats['refreshed_at']}")
+
+    print("\n=== Movies by First Letter ===")
+    for letter, count in stats['letters']:
+        print(f"{letter} = {count}")
+
+    # Movies without a year are counted under year 0
+    print("\n=== Movies by Year ===")
+    for year, count in stats['years']:
+        print(f"{year or 'unknown'} = {count}")
+
+    # Average quotes per movie that has quotes
+    if stats['movies_with_quotes']:
+        print(f"\nAverage Quotes per Movie: {stats['quotes'] / stats['movies_with_quotes']:.2f}")
 
 def main():
     """Main function to run the ETL process."""
@@ -185,25 +348,69 @@ def main():
         'port': '15432'
     }
     
+    parser = argparse.ArgumentParser(description='Load crawled movie quotes into PostgreSQL or SQLite')
+    parser.add_argument('command', nargs='?', choices=['load', 'info', 'segment', 'dedup'], default='load',
+                        help='load JSON files (default), show database information, '
+                             'split quotes loaded without speaker turns into quote_lines, '
+                             'or cluster quotes loaded without a near-duplicate cluster')
     # Directory containing JSON files - replace with your actual path
-    json_dir_path = './crawler/results/test'
+    parser.add_argument('--json-dir', default='./crawler/results/test',
+                        help='Directory containing the JSON files to load (default: ./crawler/results/test)')
+    parser.add_argument('--sqlite', metavar='PATH',
+                        help='Use an embedded SQLite database file instead of PostgreSQL (always loads in batches)')
+    parser.add_argument('--bulk', action='store_true',
+                        help='Load with COPY into staging tables and set-based upserts instead of row by row')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Bulk load with this many worker processes, one connection each (default: 1)')
+    parser.add_argument('--batch-size', type=int, default=1000,
+                        help='Records per COPY batch and commit in bulk mode (default: 1000)')
+    parser.add_argument('--reload', action='store_true',
+                        help='Ignore the load manifest and load every file again from the start')
+    parser.add_argument('--refresh', action='store_true',
+                        help='info: rebuild the summary tables from the movies and quotes tables first')
+    args = parser.parse_args()
+    json_dir_path = args.json_dir
     
     try:
         # Connect to the database
-        print(f"Connecting to PostgreSQL database: {db_params['dbname']}")
-        conn = psycopg2.connect(**db_params)
+        if args.sqlite:
+            print(f"Opening SQLite database: {args.sqlite}")
+            storage = open_storage(f"sqlite:///{args.sqlite}", create=False)
+        else:
+            print(f"Connecting to PostgreSQL database: {db_params['dbname']}")
+            storage = PostgresStorage(conn=psycopg2.connect(**db_params))
+        conn = storage.conn
         
         # Check if the info command was provided
-        if len(sys.argv) > 1 and sys.argv[1].lower() == 'info':
-            display_info(conn)
+        if args.command == 'info':
+            # Read-only: key and hash migrations are left to load
+            storage.create_stats_tables()
+            display_info(storage, args.refresh)
+        elif args.command == 'segment':
+            storage.create_schema()
+            start = time.perf_counter()
+            segmented = storage.segment_stored_quotes()
+            print(f"Segmented {segmented} quotes into speaker turns in {time.perf_counter() - start:.2f}s")
+        elif args.command == 'dedup':
+            storage.create_schema()
+            cluster_new_quotes(storage)
         else:
             # Create schema and tables
             print("Creating schema and tables if they don't exist...")
-            create_schema_and_tables(conn)
+            storage.create_schema()
             
             # Process JSON files and insert data
             print(f"Processing JSON files from: {json_dir_path}")
-            process_json_files(conn, json_dir_path)
+            if args.sqlite:
+                if args.workers > 1:
+                    print("SQLite has a single writer; loading with one process")
+                bulk_load_json_files(storage, json_dir_path, args.batch_size, args.reload)
+            elif args.workers > 1:
+                parallel_load_json_files(conn, db_params, json_dir_path, args.workers, args.batch_size, args.reload)
+            elif args.bulk:
+                bulk_load_json_files(storage, json_dir_path, args.batch_size, args.reload)
+            else:
+                process_json_files(conn, json_dir_path, args.reload)
             
             print("Data processing completed successfully!")
         
@@ -0,0 +1,203 @@
+import gzip
+import hashlib
+import json
+import threading
+import zlib
+from collections import OrderedDict
+
+from starlette.responses import Response, StreamingResponse
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always there
+    brotli = None
+
+
+def accepted_encodings(header):
+    """Content codings an Accept-Encoding header allows (q > 0), lowercased."""
+    accepted = set()
+    for part in (header or '').split(','):
+        coding, _, params = part.partition(';')
+        coding = coding.strip().lower()
+        q = params.strip()
+        if q.startswith('q='):
+            try:
+                if float(q[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        if coding:
+            accepted.add(coding)
+    return accepted
+
+
+class ResponseCache:
+    """
+    Encoded response bodies by ETag, least recently used dropped first once
+    they take more than max_bytes. A body over a tenth of max_bytes is not
+    kept. ETags name the data version, so the entries of an old version are
+    simply never hit again and age out.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def get(self, etag):
+        with self.lock:
+            entry = self.entries.get(etag)
+            if entry is not None:
+                self.entries.move_to_end(etag)
+            return entry
+
+    def put(self, etag, body, encoding):
+        if len(body) > self.max_bytes // 10:
+            return
+        with self.lock:
+            if etag in self.entries:
+                return
+            self.entries[etag] = (body, encoding)
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                _, (dropped, _) = self.entries.popitem(last=False)
+                self.size -= len(dropped)
+
+
+class HttpCache:
+    """
+    Validators, compression and caching for responses that only change with
+    the data they are read from.
+
+    A response's ETag is a digest of the data version (the crawler output's
+    manifest generation or file stats, or the database's data_version), the
+    path and the query, tagged with the content coding, so it is strong: one
+    tag always stands for the same bytes. A request whose If-None-Match holds
+    it gets an empty 304 before any data is read. Bodies of min_size bytes or
+    more are compressed with brotli if it is installed and accepted, else
+    gzip. With cache_bytes, encoded bodies are kept in a ResponseCache, so a
+    repeated request costs a dictionary lookup.
+    """
+
+    def __init__(self, max_age=60, min_size=1024, cache_bytes=0, gzip_level=6, brotli_quality=5):
+        self.max_age = max_age
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.cache = ResponseCache(cache_bytes) if cache_bytes else None
+
+    def encoding(self, request):
+        accepted = accepted_encodings(request.headers.get('accept-encoding'))
+        if brotli is not None and 'br' in accepted:
+            return 'br'
+        if 'gzip' in accepted:
+            return 'gzip'
+        return None
+
+    def etag(self, request, version, encoding):
+        key = repr((version, request.url.path, sorted(request.query_params.multi_items())))
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=12).hexdigest()
+        return f'"{digest}-{encoding}"' if encoding else f'"{digest}"'
+
+    def headers(self, etag):
+        return {'ETag': etag, 'Cache-Control': f'public, max-age={self.max_age}', 'Vary': 'Accept-Encoding'}
+
+    @staticmethod
+    def not_modified(request, etag):
+        header = request.headers.get('if-none-match')
+        if not header:
+            return False
+        tags = [tag.strip() for tag in header.split(',')]
+        return '*' in tags or any(tag[2:] == etag if tag.startswith('W/') else tag == etag for tag in tags)
+
+    def compress(self, body, encoding):
+        if encoding == 'br':
+            return brotli.compress(body, quality=self.brotli_quality)
+        # No timestamp in the header, so equal bodies compress to equal bytes
+        return gzip.compress(body, self.gzip_level, mtime=0)
+
+    def respond(self, request, version, build, media_type='application/json'):
+        """
+        The response to a request for data at version: 304 if the client has
+        it, else the cached body, else the body build() returns (JSON text,
+        bytes, or a value to serialize as JSON), compressed and cached.
+        """
+        encoding, etag, headers, response = self._lookup(request, version, media_type)
+        return response or self._encoded(build(), encoding, etag, headers, media_type)
+
+    async def respond_async(self, request, version, build, media_type='application/json'):
+        """respond for a coroutine function build."""
+        encoding, etag, headers, response = self._lookup(request, version, media_type)
+        return response or self._encoded(await build(), encoding, etag, headers, media_type)
+
+    def _lookup(self, request, version, media_type):
+        encoding = self.encoding(request)
+        etag = self.etag(request, version, encoding)
+        headers = self.headers(etag)
+        if self.not_modified(request, etag):
+            return encoding, etag, headers, Response(status_code=304, headers=headers)
+        cached = self.cache.get(etag) if self.cache else None
+        if cached is None:
+            return encoding, etag, headers, None
+        body, coding = cached
+        if coding:
+            headers['Content-Encoding'] = coding
+        return encoding, etag, headers, Response(body, media_type=media_type, headers=headers)
+
+    def _encoded(self, body, encoding, etag, headers, media_type):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        elif not isinstance(body, bytes):
+            body = json.dumps(body).encode('utf-8')
+        coding = None
+        if encoding and len(body) >= self.min_size:
+            body, coding = self.compress(body, encoding), encoding
+        if self.cache:
+            self.cache.put(etag, body, coding)
+        if coding:
+            headers['Content-Encoding'] = coding
+        return Response(body, media_type=media_type, headers=headers)
+
+    def stream(self, request, version, chunks, media_type):
+        """
+        Like respond for a body streamed from chunks(), an iterable or async
+        iterable, compressed on the fly and never cached.
+        """
+        encoding = self.encoding(request)
+        etag = self.etag(request, version, encoding)
+        headers = self.headers(etag)
+        if self.not_modified(request, etag):
+            return Response(status_code=304, headers=headers)
+        body = chunks()
+        if encoding:
+            headers['Content-Encoding'] = encoding
+            body = self._compressed(body, encoding)
+        return StreamingResponse(body, media_type=media_type, headers=headers)
+
+    def _compressed(self, chunks, encoding):
+        if encoding == 'br':
+            compressor = brotli.Compressor(quality=self.brotli_quality)
+            compress, flush = compressor.process, compressor.finish
+        else:
+            compressor = zlib.compressobj(self.gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            compress, flush = compressor.compress, compressor.flush
+        if hasattr(chunks, '__aiter__'):
+            return _compress_async(chunks, compress, flush)
+        return _compress(chunks, compress, flush)
+
+
+def _compress(chunks, compress, flush):
+    for chunk in chunks:
+        data = compress(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+        if data:
+            yield data
+    yield flush()
+
+
+async def _compress_async(chunks, compress, flush):
+    async for chunk in chunks:
+        data = compress(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+        if data:
+            yield data
+    yield flush()
@@ -0,0 +1,327 @@
+import asyncio
+import functools
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from urllib.parse import quote, urlencode
+
+from crawler import db
+from crawler.metrics import MetricsRegistry
+from crawler.storage import (
+    PG_MOVIE, PG_MOVIES_PAGE, PG_MOVIES_QUOTES, PG_RANDOM_QUOTE, PG_STATS_LETTERS, PG_STATS_TOTALS,
+    PG_STATS_YEARS, SqliteStorage, _movie_records, _raw_title,
+)
+
+ACQUIRE_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0)
+
+
+@functools.lru_cache(maxsize=None)
+def _numbered(sql):
+    names = []
+
+    def number(match):
+        if match.group(1) not in names:
+            names.append(match.group(1))
+        return f"${names.index(match.group(1)) + 1}"
+
+    return re.sub(r'%\((\w+)\)s', number, sql).replace('%%', '%'), tuple(names)
+
+
+def numbered(sql, params):
+    """A query with named parameters (%(name)s) as asyncpg's arguments: the query with $1, $2, ... and their values."""
+    sql, names = _numbered(sql)
+    return (sql, *(params[name] for name in names))
+
+
+def postgres_url(dsn):
+    """
+    A libpq key=value DSN ("dbname=quotes host=localhost") as the
+    postgresql:// URL asyncpg takes; URLs are returned as they are.
+    """
+    if '://' in dsn:
+        return dsn
+    from psycopg2.extensions import parse_dsn
+
+    params = parse_dsn(dsn)
+    database = quote(params.pop('dbname', ''), safe='')
+    return f"postgresql:///{database}?{urlencode(params)}" if params else f"postgresql:///{database}"
+
+
+class AsyncStorage:
+    """
+    Read side of a Storage for the async API, over a pool of at most
+    max_size connections.
+
+    Requests wait up to acquire_timeout seconds for a free connection, then
+    fail with asyncio.TimeoutError. The pool's state and the time spent
+    waiting for connections and running each query are kept in a
+    MetricsRegistry and rendered for Prometheus by render_metrics.
+    """
+
+    def __init__(self, min_size=1, max_size=10, acquire_timeout=10.0):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.waiting = 0
+        self.in_use = 0
+        self.metrics = MetricsRegistry()
+        self.metrics.describe('db_pool_acquire_seconds', 'Time spent waiting for a pooled connection',
+                              ACQUIRE_BUCKETS)
+        self.metrics.describe('db_pool_acquire_timeouts_total', 'Requests that gave up waiting for a connection')
+        self.metrics.describe('db_query_seconds', 'Time spent running each query on its connection')
+
+    async def open(self):
+        raise NotImplementedError
+
+    async def close(self):
+        raise NotImplementedError
+
+    async def _acquire(self):
+        raise NotImplementedError
+
+    async def _release(self, conn):
+        raise NotImplementedError
+
+    def pool_size(self):
+        """Connections currently open."""
+        raise NotImplementedError
+
+    @asynccontextmanager
+    async def query(self, name):
+        """A pooled connection for one query, timed under name."""
+        self.waiting += 1
+        start = time.perf_counter()
+        try:
+            conn = await asyncio.wait_for(self._acquire(), self.acquire_timeout)
+        except asyncio.TimeoutError:
+            self.metrics.inc('db_pool_acquire_timeouts_total')
+            raise
+        finally:
+            self.waiting -= 1
+        self.metrics.observe('db_pool_acquire_seconds', time.perf_counter() - start)
+        self.in_use += 1
+        try:
+            with self.metrics.timer('db_query_seconds', query=name):
+                yield conn
+        finally:
+            self.in_use -= 1
+            await self._release(conn)
+
+    def pool_state(self):
+        size = self.pool_size()
+        return {'size': size, 'min_size': self.min_size, 'max_size': self.max_size, 'in_use': self.in_use,
+                'idle': size - self.in_use, 'waiting': self.waiting}
+
+    def render_metrics(self):
+        """Pool gauges, acquire waits and query times in the Prometheus text format."""
+        lines = []
+        for name, value in self.pool_state().items():
+            lines.append(f"# TYPE db_pool_{name} gauge")
+            lines.append(f"db_pool_{name} {value}")
+        return '\n'.join(lines) + '\n' + self.metrics.render()
+
+    async def data_version(self):
+        """See Storage.data_version."""
+        raise NotImplementedError
+
+    async def stats(self):
+        """See Storage.stats."""
+        raise NotImplementedError
+
+    async def search_quotes(self, query, movie_id=None, year=None, limit=20, cursor=None, collapse=False):
+        """See Storage.search_quotes."""
+        raise NotImplementedError
+
+    async def list_movies(self, letter=None, year=None, limit=100, after=None):
+        """See Storage.list_movies."""
+        raise NotImplementedError
+
+    async def get_movie(self, movie_id):
+        """See Storage.get_movie."""
+        raise NotImplementedError
+
+    async def random_quote(self):
+        """See Storage.random_quote."""
+        raise NotImplementedError
+
+    async def iter_movies(self, letter=None, year=None, batch_size=1000):
+        """
+        Every matching movie as a crawler record, read one keyset page at a
+        time, so no connection is held while a slow client reads the stream.
+        """
+        after = None
+        while True:
+            rows = await self.list_movies(letter, year, batch_size, after)
+            for _, record in rows:
+                yield record
+            if len(rows) < batch_size:
+                return
+            after = rows[-1][0]
+
+
+class AsyncPostgresStorage(AsyncStorage):
+    """
+    The quotesnet schema in PostgreSQL through an asyncpg pool.
+
+    The statements are PostgresStorage's, with numbered parameters. Their
+    texts never vary with the arguments, so asyncpg prepares each one once
+    per connection and keeps it in its statement cache (statement_cache_size);
+    later calls only bind and execute.
+    """
+
+    def __init__(self, dsn, min_size=1, max_size=10, acquire_timeout=10.0, statement_cache_size=100):
+        super().__init__(min_size, max_size, acquire_timeout)
+        self.dsn = dsn
+        self.statement_cache_size = statement_cache_size
+        self.pool = None
+
+    async def open(self):
+        import asyncpg
+
+        self.pool = await asyncpg.create_pool(postgres_url(self.dsn), min_size=self.min_size, max_size=self.max_size,
+                                              statement_cache_size=self.statement_cache_size)
+
+    async def close(self):
+        await self.pool.close()
+
+    async def _acquire(self):
+        return await self.pool.acquire()
+
+    async def _release(self, conn):
+        await self.pool.release(conn)
+
+    def pool_size(self):
+        return self.pool.get_size() if self.pool is not None else 0
+
+    async def data_version(self):
+        async with self.query('data_version') as conn:
+            return await conn.fetchval("SELECT data_version FROM quotesnet.stats_totals")
+
+    async def stats(self):
+        async with self.query('stats') as conn:
+            movies, quotes, movies_with_quotes, refreshed_at = await conn.fetchrow(PG_STATS_TOTALS)
+            letters = await conn.fetch(PG_STATS_LETTERS)
+            years = await conn.fetch(PG_STATS_YEARS)
+        return {
+            'movies': movies, 'quotes': quotes, 'movies_with_quotes': movies_with_quotes,
+            'refreshed_at': str(refreshed_at) if refreshed_at is not None else None,
+            'letters': [tuple(row) for row in letters], 'years': [tuple(row) for row in years],
+        }
+
+    async def search_quotes(self, query, movie_id=None, year=None, limit=20, cursor=None, collapse=False):
+        sql, params = db.search_statement(query, movie_id, year, limit, cursor, collapse)
+        async with self.query('search_quotes') as conn:
+            return [tuple(row) for row in await conn.fetch(*numbered(sql, params))]
+
+    async def list_movies(self, letter=None, year=None, limit=100, after=None):
+        async with self.query('list_movies') as conn:
+            movies = await conn.fetch(*numbered(PG_MOVIES_PAGE, {'letter': letter, 'year': year,
+                                                                 'after': after or 0, 'limit': limit}))
+            quotes = await conn.fetch(*numbered(PG_MOVIES_QUOTES, {'ids': [movie[0] for movie in movies]}))
+        return _movie_records(movies, quotes)
+
+    async def get_movie(self, movie_id):
+        async with self.query('get_movie') as conn:
+            movies = await conn.fetch(*numbered(PG_MOVIE, {'movie_id': movie_id}))
+            if not movies:
+                return None
+            quotes = await conn.fetch(*numbered(PG_MOVIES_QUOTES, {'ids': [movies[0][0]]}))
+        return _movie_records(movies, quotes)[0][1]
+
+    async def random_quote(self):
+        async with self.query('random_quote') as conn:
+            row = await conn.fetchrow(PG_RANDOM_QUOTE)
+        if row is None:
+            return None
+        title, year, movie_id, url, text = row
+        return movie_id, _raw_title(title, year, movie_id), url, text
+
+
+class AsyncSqliteStorage(AsyncStorage):
+    """
+    An embedded stand-in for AsyncPostgresStorage: up to max_size
+    SqliteStorage connections to one file, each query run on a worker thread
+    of a pool as large as the connection pool. sqlite3 keeps every
+    connection's prepared statements in its statement cache, so repeated
+    queries skip parsing as they do on PostgreSQL.
+    """
+
+    def __init__(self, path, min_size=1, max_size=10, acquire_timeout=10.0):
+        super().__init__(min_size, max_size, acquire_timeout)
+        self.path = path
+        self.idle = []
+        self.opened = 0
+        self.available = None
+        self.executor = None
+
+    async def open(self):
+        self.available = asyncio.Semaphore(self.max_size)
+        self.executor = ThreadPoolExecutor(self.max_size, thread_name_prefix='sqlite-api')
+        storage = await self._connect()
+        # Creates the tables, or upgrades an older file, like open_storage
+        await asyncio.get_running_loop().run_in_executor(self.executor, storage.create_schema)
+        self.idle.append(storage)
+        for _ in range(self.min_size - 1):
+            self.idle.append(await self._connect())
+
+    async def close(self):
+        for storage in self.idle:
+            storage.close()
+        self.idle.clear()
+        self.executor.shutdown()
+
+    async def _connect(self):
+        storage = await asyncio.get_running_loop().run_in_executor(self.executor, SqliteStorage, self.path)
+        self.opened += 1
+        return storage
+
+    async def _acquire(self):
+        await self.available.acquire()
+        if self.idle:
+            return self.idle.pop()
+        try:
+            return await self._connect()
+        except BaseException:
+            self.available.release()
+            raise
+
+    async def _release(self, storage):
+        self.idle.append(storage)
+        self.available.release()
+
+    def pool_size(self):
+        return self.opened
+
+    async def _run(self, name, method, *args):
+        async with self.query(name) as storage:
+            return await asyncio.get_running_loop().run_in_executor(
+                self.executor, functools.partial(getattr(storage, method), *args))
+
+    async def data_version(self):
+        return await self._run('data_version', 'data_version')
+
+    async def stats(self):
+        return await self._run('stats', 'stats')
+
+    async def search_quotes(self, query, movie_id=None, year=None, limit=20, cursor=None, collapse=False):
+        return await self._run('search_quotes', 'search_quotes', query, movie_id, year, limit, cursor, collapse)
+
+    async def list_movies(self, letter=None, year=None, limit=100, after=None):
+        return await self._run('list_movies', 'list_movies', letter, year, limit, after)
+
+    async def get_movie(self, movie_id):
+        return await self._run('get_movie', 'get_movie', movie_id)
+
+    async def random_quote(self):
+        return await self._run('random_quote', 'random_quote')
+
+
+def open_async_storage(url, min_size=1, max_size=10, acquire_timeout=10.0):
+    """The AsyncStorage a database URL names, like crawler.storage.open_storage; call open() before use."""
+    if url.startswith('sqlite:'):
+        path = url[len('sqlite:'):]
+        if path.startswith('///'):
+            path = path[3:]
+        return AsyncSqliteStorage(path, min_size, max_size, acquire_timeout)
+    return AsyncPostgresStorage(url, min_size, max_size, acquire_timeout)
@@ -0,0 +1,110 @@
+import json
+import os
+import string
+import time
+import zlib
+
+from segments import iter_records
+
+BASE_URL = "https://www.quotes.net"
+
+# Letter index pages under /allmovies/<letter>
+ALL_LETTERS = list(string.ascii_uppercase)
+
+
+def parse_letters(letters):
+    """
+    Turn a letters argument into a list of index page letters.
+
+    Accepts "all", a comma separated list such as "Q,UV,X", or a list.
+    """
+    if isinstance(letters, (list, tuple)):
+        return [letter.upper() for letter in letters]
+    if letters.strip().lower() == 'all':
+        return list(ALL_LETTERS)
+    return [letter.strip().upper() for letter in letters.split(',') if letter.strip()]
+
+
+def index_url(letter, base_url=BASE_URL):
+    """Return the /allmovies index URL for a letter."""
+    return f"{base_url.rstrip('/')}/allmovies/{letter}"
+
+
+def shard_of(movie_url, shard_count):
+    """Stable shard number for a movie URL (crc32, identical in every process)."""
+    return zlib.crc32(movie_url.encode('utf-8')) % shard_count
+
+
+def letters_for_shard(letters, shard_index, shard_count):
+    """Assign letters to shards round-robin."""
+    return [letter for i, letter in enumerate(letters) if i % shard_count == shard_index]
+
+
+def shard_dir(base_dir, shard_index):
+    """Directory holding a shard's output and crawl state."""
+    return os.path.join(base_dir, f"shard-{shard_index}")
+
+
+def merge_shard_outputs(shard_output_dirs, output_file):
+    """
+    Merge shard output segments into a single JSON array, dropping duplicates.
+
+    A movie crawled more than once (re-crawls append new segments) keeps its
+    latest record, in the position of its first one.
+
+    Args:
+        shard_output_dirs (list): Output directories written by the shard crawlers
+        output_file (str): Path of the merged JSON array
+
+    Returns:
+        int: Number of movies written
+    """
+    movies = {}
+    for output_dir in shard_output_dirs:
+        if not os.path.isdir(output_dir):
+            continue
+        for movie in iter_records(output_dir):
+            movies[movie.get('url')] = movie
+    tmp_file = output_file + '.tmp'
+    with open(tmp_file, 'w', encoding='utf-8') as out:
+        out.write('[\n')
+        out.write(',\n'.join(json.dumps(movie, ensure_ascii=False) for movie in movies.values()))
+        out.write('\n]\n')
+    os.replace(tmp_file, output_file)
+    return len(movies)
+
+
+def load_index_cache(path, max_age):
+    """
+    Load cached index page links that are younger than max_age seconds.
+
+    Returns:
+        dict: index URL -> list of movie URLs (only the fresh entries)
+    """
+    if max_age <= 0 or not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    except json.JSONDecodeError:
+        return {}
+    now = time.time()
+    return {url: entry['links'] for url, entry in cache.items() if now - entry['fetched_at'] < max_age}
+
+
+def save_index_cache(path, index_links):
+    """Store freshly fetched index page links, keeping other cached pages."""
+    cache = {}
+    if os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                cache = json.load(f)
+        except json.JSONDecodeError:
+            cache = {}
+    now = time.time()
+    for url, links in index_links.items():
+        cache[url] = {'fetched_at': now, 'links': links}
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(cache, f)
+    os.replace(tmp_path, path)
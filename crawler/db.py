@@ -0,0 +1,728 @@
+import hashlib
+import io
+import re
+import uuid
+from collections import defaultdict
+
+from crawler.dialogue import segment_quote
+
+# Statements creating the quotesnet schema (safe to run repeatedly)
+SCHEMA_STATEMENTS = [
+    "CREATE SCHEMA IF NOT EXISTS quotesnet;",
+    """
+    CREATE TABLE IF NOT EXISTS quotesnet.movies (
+        id SERIAL PRIMARY KEY,
+        title TEXT NOT NULL,
+        year INTEGER,
+        movie_id INTEGER,
+        url TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS quotesnet.quotes (
+        id SERIAL PRIMARY KEY,
+        movie_id INTEGER REFERENCES quotesnet.movies(id),
+        quote_text TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_movie_title ON quotesnet.movies(title);",
+    "CREATE INDEX IF NOT EXISTS idx_movie_year ON quotesnet.movies(year);",
+    "CREATE INDEX IF NOT EXISTS idx_movie_movie_id ON quotesnet.movies(movie_id);",
+    "CREATE INDEX IF NOT EXISTS idx_quote_movie_id ON quotesnet.quotes(movie_id);",
+    """
+    CREATE TABLE IF NOT EXISTS quotesnet.load_manifest (
+        file_path TEXT PRIMARY KEY,
+        checksum TEXT NOT NULL,
+        records_loaded INTEGER NOT NULL DEFAULT 0,
+        completed BOOLEAN NOT NULL DEFAULT FALSE,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS quotesnet.quote_lines (
+        quote_id INTEGER NOT NULL REFERENCES quotesnet.quotes(id) ON DELETE CASCADE,
+        position SMALLINT NOT NULL,
+        speaker TEXT,
+        line TEXT,
+        stage_direction TEXT,
+        PRIMARY KEY (quote_id, position)
+    );
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_quote_lines_speaker ON quotesnet.quote_lines(speaker);",
+    "CREATE INDEX IF NOT EXISTS idx_quote_lines_speaker_lower ON quotesnet.quote_lines(lower(speaker));",
+    # Near-duplicate clusters (see dedup_stored_quotes)
+    "ALTER TABLE quotesnet.quotes ADD COLUMN IF NOT EXISTS cluster_id INTEGER;",
+    "ALTER TABLE quotesnet.quotes ADD COLUMN IF NOT EXISTS minhash BYTEA;",
+    "CREATE INDEX IF NOT EXISTS idx_quote_cluster_id ON quotesnet.quotes(cluster_id);",
+    """
+    CREATE TABLE IF NOT EXISTS quotesnet.quote_buckets (
+        band SMALLINT NOT NULL,
+        bucket BIGINT NOT NULL,
+        quote_id INTEGER NOT NULL REFERENCES quotesnet.quotes(id) ON DELETE CASCADE,
+        PRIMARY KEY (band, bucket)
+    );
+    """,
+]
+
+# Movies are identified by the quotes.net id at the end of their URL. Rows
+# duplicated by older loaders are merged (quotes move to the oldest row)
+# before the unique index is built.
+MERGE_DUPLICATE_MOVIES = """
+WITH ranked AS (
+    SELECT id, MIN(id) OVER (PARTITION BY movie_id) AS keep_id
+    FROM quotesnet.movies
+    WHERE movie_id IS NOT NULL
+), moved AS (
+    UPDATE quotesnet.quotes q SET movie_id = r.keep_id
+    FROM ranked r
+    WHERE q.movie_id = r.id AND r.id <> r.keep_id
+)
+DELETE FROM quotesnet.movies m
+USING ranked r
+WHERE m.id = r.id AND r.id <> r.keep_id
+"""
+MOVIE_KEY_INDEX = "CREATE UNIQUE INDEX IF NOT EXISTS uq_movie_movie_id ON quotesnet.movies(movie_id);"
+
+# Quotes carry an md5 of their text; a quote already stored for a movie is
+# dropped at insert time (ON CONFLICT DO NOTHING). Existing duplicates are
+# removed, oldest row kept, before the unique index is built.
+QUOTE_HASH_COLUMN = """
+ALTER TABLE quotesnet.quotes
+    ADD COLUMN IF NOT EXISTS content_hash UUID GENERATED ALWAYS AS (md5(quote_text)::uuid) STORED
+"""
+DELETE_DUPLICATE_QUOTES = """
+DELETE FROM quotesnet.quotes q
+USING quotesnet.quotes d
+WHERE q.movie_id = d.movie_id AND q.content_hash = d.content_hash AND q.id > d.id
+"""
+QUOTE_HASH_INDEX = "CREATE UNIQUE INDEX IF NOT EXISTS uq_quote_content ON quotesnet.quotes(movie_id, content_hash);"
+
+# Full-text search: a generated tsvector of every quote, so every loader
+# maintains it without extra work, behind a GIN index.
+SEARCH_VECTOR_COLUMN = """
+ALTER TABLE quotesnet.quotes
+    ADD COLUMN IF NOT EXISTS search_vector TSVECTOR GENERATED ALWAYS AS (to_tsvector('english', quote_text)) STORED
+"""
+SEARCH_INDEX = "CREATE INDEX IF NOT EXISTS idx_quote_search ON quotesnet.quotes USING GIN (search_vector);"
+
+# Summary tables kept up to date by load_movies in the same transaction as
+# each batch (see update_stats), so reading them never scans movies or quotes.
+# Movies without a year are counted under year 0. stats_totals.data_version
+# goes up with every committed change to movies, quotes or clusters, so
+# readers can tell whether cached results are still current.
+STATS_STATEMENTS = [
+    """
+    CREATE TABLE IF NOT EXISTS quotesnet.stats_totals (
+        id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+        movies BIGINT NOT NULL DEFAULT 0,
+        quotes BIGINT NOT NULL DEFAULT 0,
+        movies_with_quotes BIGINT NOT NULL DEFAULT 0,
+        refreshed_at TIMESTAMP
+    );
+    """,
+    "ALTER TABLE quotesnet.stats_totals ADD COLUMN IF NOT EXISTS data_version BIGINT NOT NULL DEFAULT 0;",
+    "INSERT INTO quotesnet.stats_totals (id) VALUES (TRUE) ON CONFLICT DO NOTHING;",
+    """
+    CREATE TABLE IF NOT EXISTS quotesnet.stats_letters (
+        letter TEXT PRIMARY KEY,
+        movies BIGINT NOT NULL
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS quotesnet.stats_years (
+        year INTEGER PRIMARY KEY,
+        movies BIGINT NOT NULL
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS quotesnet.movie_quote_counts (
+        movie_id INTEGER PRIMARY KEY REFERENCES quotesnet.movies(id) ON DELETE CASCADE,
+        quotes INTEGER NOT NULL
+    );
+    """,
+]
+
+
+def create_schema_and_tables(conn):
+    """Create the necessary schema and tables if they don't exist."""
+    with conn.cursor() as cur:
+        for statement in SCHEMA_STATEMENTS:
+            cur.execute(statement)
+        cur.execute("SELECT to_regclass('quotesnet.uq_movie_movie_id')")
+        if cur.fetchone()[0] is None:
+            cur.execute(MERGE_DUPLICATE_MOVIES)
+            cur.execute(MOVIE_KEY_INDEX)
+        cur.execute("SELECT to_regclass('quotesnet.uq_quote_content')")
+        if cur.fetchone()[0] is None:
+            cur.execute(QUOTE_HASH_COLUMN)
+            cur.execute(DELETE_DUPLICATE_QUOTES)
+            cur.execute(QUOTE_HASH_INDEX)
+        cur.execute("SELECT to_regclass('quotesnet.idx_quote_search')")
+        if cur.fetchone()[0] is None:
+            cur.execute(SEARCH_VECTOR_COLUMN)
+            cur.execute(SEARCH_INDEX)
+    conn.commit()
+    create_stats_tables(conn)
+
+
+def create_stats_tables(conn):
+    """
+    Create the summary tables if they don't exist, built from movies and
+    quotes, and commit. Nothing else in the schema is touched, so read-only
+    commands can call this on a database no loader has upgraded yet.
+    """
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('quotesnet.stats_totals')")
+        build_stats = cur.fetchone()[0] is None
+        for statement in STATS_STATEMENTS:
+            cur.execute(statement)
+    conn.commit()
+    if build_stats:
+        refresh_stats(conn)
+
+
+def refresh_stats(conn):
+    """Rebuild the summary tables from movies and quotes (full scans) and commit."""
+    with conn.cursor() as cur:
+        cur.execute("TRUNCATE quotesnet.stats_letters, quotesnet.stats_years, quotesnet.movie_quote_counts")
+        cur.execute("""
+        INSERT INTO quotesnet.stats_letters (letter, movies)
+        SELECT UPPER(LEFT(title, 1)), COUNT(*) FROM quotesnet.movies GROUP BY 1
+        """)
+        cur.execute("""
+        INSERT INTO quotesnet.stats_years (year, movies)
+        SELECT COALESCE(year, 0), COUNT(*) FROM quotesnet.movies GROUP BY 1
+        """)
+        cur.execute("""
+        INSERT INTO quotesnet.movie_quote_counts (movie_id, quotes)
+        SELECT movie_id, COUNT(*) FROM quotesnet.quotes WHERE movie_id IS NOT NULL GROUP BY 1
+        """)
+        cur.execute("""
+        UPDATE quotesnet.stats_totals SET
+            movies = (SELECT COUNT(*) FROM quotesnet.movies),
+            quotes = (SELECT COUNT(*) FROM quotesnet.quotes),
+            movies_with_quotes = (SELECT COUNT(*) FROM quotesnet.movie_quote_counts),
+            refreshed_at = CURRENT_TIMESTAMP,
+            data_version = data_version + 1
+        """)
+    conn.commit()
+
+
+def bump_data_version(cur):
+    """Mark the stored data as changed, in the caller's transaction."""
+    cur.execute("UPDATE quotesnet.stats_totals SET data_version = data_version + 1")
+
+
+def get_data_version(conn):
+    """The current data version, from stats_totals (see STATS_STATEMENTS)."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT data_version FROM quotesnet.stats_totals")
+        return cur.fetchone()[0]
+
+
+def update_stats(cur, movie_changes, quote_counts):
+    """
+    Apply one batch's changes to the summary tables, in the caller's transaction.
+
+    Rows are locked in a fixed order (letters, years, per-movie counts, then
+    the totals row, each sorted by key), so concurrent loaders wait for each
+    other instead of deadlocking.
+
+    Args:
+        movie_changes: (first letter, year, +1/-1 movies) rows
+        quote_counts: (movie id, quotes inserted) rows
+    """
+    from psycopg2.extras import execute_values
+
+    letters = defaultdict(int)
+    years = defaultdict(int)
+    for letter, year, delta in movie_changes:
+        letters[letter] += delta
+        years[year or 0] += delta
+    letters = sorted((key, delta) for key, delta in letters.items() if delta)
+    years = sorted((key, delta) for key, delta in years.items() if delta)
+    quote_counts = sorted((movie_id, count) for movie_id, count in quote_counts if count)
+
+    if letters:
+        execute_values(cur, """
+        INSERT INTO quotesnet.stats_letters (letter, movies) VALUES %s
+        ON CONFLICT (letter) DO UPDATE SET movies = stats_letters.movies + EXCLUDED.movies
+        """, letters)
+    if years:
+        execute_values(cur, """
+        INSERT INTO quotesnet.stats_years (year, movies) VALUES %s
+        ON CONFLICT (year) DO UPDATE SET movies = stats_years.movies + EXCLUDED.movies
+        """, years)
+    movies_with_quotes = 0
+    if quote_counts:
+        new_rows = execute_values(cur, """
+        INSERT INTO quotesnet.movie_quote_counts (movie_id, quotes) VALUES %s
+        ON CONFLICT (movie_id) DO UPDATE SET quotes = movie_quote_counts.quotes + EXCLUDED.quotes
+        RETURNING (xmax = 0)
+        """, quote_counts, fetch=True)
+        movies_with_quotes = sum(1 for (inserted,) in new_rows if inserted)
+
+    movies = sum(delta for _, delta in letters)
+    quotes = sum(count for _, count in quote_counts)
+    # Every changed movie row is in movie_changes, even a URL change that
+    # nets out to nothing, so an empty batch leaves the version alone
+    if movie_changes or quote_counts:
+        cur.execute("""
+        UPDATE quotesnet.stats_totals
+        SET movies = movies + %s, quotes = quotes + %s, movies_with_quotes = movies_with_quotes + %s,
+            data_version = data_version + 1
+        """, (movies, quotes, movies_with_quotes))
+
+
+def file_checksum(path, chunk_size=1 << 20):
+    """sha256 of a file's contents, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_load_state(conn, file_path):
+    """
+    Return the load manifest entry of a file.
+
+    Returns:
+        tuple: (checksum, records loaded, completed), or None for a file never loaded
+    """
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT checksum, records_loaded, completed FROM quotesnet.load_manifest WHERE file_path = %s",
+            (file_path,)
+        )
+        return cur.fetchone()
+
+
+def record_load_progress(conn, file_path, checksum, records_loaded, completed=False):
+    """
+    Record how many records of a file are loaded. The caller commits, ideally
+    in the same transaction as the records themselves.
+    """
+    with conn.cursor() as cur:
+        cur.execute("""
+        INSERT INTO quotesnet.load_manifest (file_path, checksum, records_loaded, completed, updated_at)
+        VALUES (%s, %s, %s, %s, CURRENT_TIMESTAMP)
+        ON CONFLICT (file_path) DO UPDATE
+            SET checksum = EXCLUDED.checksum, records_loaded = EXCLUDED.records_loaded,
+                completed = EXCLUDED.completed, updated_at = EXCLUDED.updated_at
+        """, (file_path, checksum, records_loaded, completed))
+
+
+def parse_movie_title(raw_title):
+    """
+    Parse a raw movie title in the format "title (year) movie_id"
+    Returns a tuple of (title, year, movie_id)
+    """
+    # Regular expression to match the pattern: title (year) movie_id
+    pattern = r"(.*)\s*\((\d{4})(?:/[ivxlcdm]+)?\)\s*(\d+)$"
+    match = re.match(pattern, raw_title)
+
+    if match:
+        title = match.group(1).strip()
+        year = int(match.group(2))
+        movie_id = int(match.group(3))
+        return title, year, movie_id
+    else:
+        # If the pattern doesn't match, return the original title and None for year and movie_id
+        return raw_title, None, None
+
+
+def parse_movie_url(url):
+    """Return the quotes.net movie id at the end of a movie URL, or None."""
+    match = re.search(r"_(\d+)/?$", url or '')
+    return int(match.group(1)) if match else None
+
+
+def _copy_value(value):
+    if value is None:
+        return '\\N'
+    return (str(value)
+            .replace('\\', '\\\\')
+            .replace('\t', '\\t')
+            .replace('\n', '\\n')
+            .replace('\r', '\\r'))
+
+
+def copy_rows(cur, table, columns, rows):
+    """Bulk load rows into a table with COPY ... FROM STDIN (text format)."""
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write('\t'.join(_copy_value(value) for value in row))
+        buffer.write('\n')
+    buffer.seek(0)
+    cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", buffer)
+
+
+def quote_hash(text):
+    """The content_hash PostgreSQL computes for a quote (md5 of the text as a uuid)."""
+    return str(uuid.UUID(hashlib.md5(text.encode('utf-8')).hexdigest()))
+
+
+def parse_movies(movies):
+    """
+    Parse the title, year and quotes.net movie_id of movie records; records
+    without a title are dropped.
+
+    Returns:
+        list: (pos, title, year, movie_id, url, quotes) per movie, pos being
+              its index in movies
+    """
+    parsed = []
+    for pos, movie in enumerate(movies):
+        raw_title = movie.get('title')
+        if not raw_title:
+            continue
+        title, year, title_movie_id = parse_movie_title(raw_title)
+        movie_id = parse_movie_url(movie.get('url')) or title_movie_id
+        parsed.append((pos, title, year, movie_id, movie.get('url'), movie.get('quotes') or []))
+    return parsed
+
+
+def staging_rows(parsed):
+    """
+    Flatten parsed movies (see parse_movies) into staging rows, splitting
+    every quote into speaker turns.
+
+    Returns:
+        tuple: (movie rows (pos, title, year, movie_id, url), quote rows (pos, quote_text),
+                line rows (pos, content_hash, position, speaker, line, stage_direction))
+    """
+    movie_rows = []
+    quote_rows = []
+    line_rows = []
+    for pos, title, year, movie_id, url, quotes in parsed:
+        movie_rows.append((pos, title, year, movie_id, url))
+        for quote in quotes:
+            text = quote.get('text')
+            if text:
+                quote_rows.append((pos, text))
+                content_hash = quote_hash(text)
+                line_rows.extend((pos, content_hash) + tuple(turn) for turn in segment_quote(text))
+    return movie_rows, quote_rows, line_rows
+
+
+def movie_rows(movies):
+    """Staging rows of movie records; see parse_movies and staging_rows."""
+    return staging_rows(parse_movies(movies))
+
+
+def create_staging_tables(cur, stage=None):
+    """
+    Create empty staging tables and return their names.
+
+    Without a stage name, session-local temp tables emptied on commit are
+    used. With one, unlogged tables quotesnet.stage_movies_<stage> and
+    quotesnet.stage_quotes_<stage> are (re)used and truncated; they skip
+    the WAL, which is what makes bulk COPY cheap, and concurrent loaders
+    must use different stage names.
+
+    Returns:
+        tuple: (movie staging table, quote staging table, line staging table)
+    """
+    if stage is None:
+        movies_table, quotes_table, lines_table = 'stage_movies', 'stage_quotes', 'stage_lines'
+        prefix, suffix = 'TEMP', ' ON COMMIT DELETE ROWS'
+    else:
+        movies_table = f'quotesnet.stage_movies_{stage}'
+        quotes_table = f'quotesnet.stage_quotes_{stage}'
+        lines_table = f'quotesnet.stage_lines_{stage}'
+        prefix, suffix = 'UNLOGGED', ''
+    cur.execute(f"""
+    CREATE {prefix} TABLE IF NOT EXISTS {movies_table} (
+        pos INTEGER, title TEXT, year INTEGER, movie_id INTEGER, url TEXT
+    ){suffix}
+    """)
+    cur.execute(f"""
+    CREATE {prefix} TABLE IF NOT EXISTS {quotes_table} (
+        pos INTEGER, quote_text TEXT
+    ){suffix}
+    """)
+    cur.execute(f"""
+    CREATE {prefix} TABLE IF NOT EXISTS {lines_table} (
+        pos INTEGER, content_hash UUID, position SMALLINT, speaker TEXT, line TEXT, stage_direction TEXT
+    ){suffix}
+    """)
+    if stage is not None:
+        cur.execute(f"TRUNCATE {movies_table}, {quotes_table}, {lines_table}")
+    return movies_table, quotes_table, lines_table
+
+
+def load_movies(conn, movies, stage=None):
+    """
+    Load a batch of movie records with COPY and set-based statements; see
+    load_movie_rows.
+
+    Returns:
+        tuple: (movies inserted, quotes inserted)
+    """
+    return load_movie_rows(conn, movie_rows(movies), stage)
+
+
+def load_movie_rows(conn, rows, stage=None):
+    """
+    Load a batch of staging rows (see movie_rows) with COPY and set-based
+    statements.
+
+    Movies, quotes and the quotes' speaker turns are copied into staging
+    tables (see create_staging_tables). Movies are then upserted in one
+    statement on their quotes.net movie_id, and the quotes and their turns
+    (quotesnet.quote_lines) are moved across in one statement each, joined on
+    that key. Movies without a movie_id fall back to matching on title and
+    year. Quotes already stored for a movie are skipped by their content
+    hash. The summary tables are updated with the batch's changes. The
+    caller commits.
+
+    Returns:
+        tuple: (movies inserted, quotes inserted)
+    """
+    movie_stage, quote_stage, line_stage = rows
+    if not movie_stage:
+        return 0, 0
+
+    with conn.cursor() as cur:
+        movies_table, quotes_table, lines_table = create_staging_tables(cur, stage)
+        copy_rows(cur, movies_table, ('pos', 'title', 'year', 'movie_id', 'url'), movie_stage)
+        copy_rows(cur, quotes_table, ('pos', 'quote_text'), quote_stage)
+        copy_rows(cur, lines_table, ('pos', 'content_hash', 'position', 'speaker', 'line', 'stage_direction'),
+                  line_stage)
+
+        # Latest record wins for a movie_id seen twice in the batch. The old
+        # title and year of updated movies are read from the statement's
+        # snapshot so the summary tables can move them.
+        cur.execute(f"""
+        WITH old AS (
+            SELECT DISTINCT m.id, m.title, m.year
+            FROM quotesnet.movies m
+            JOIN {movies_table} s ON s.movie_id = m.movie_id
+        ), upserted AS (
+            INSERT INTO quotesnet.movies (title, year, movie_id, url)
+            SELECT DISTINCT ON (s.movie_id) s.title, s.year, s.movie_id, s.url
+            FROM {movies_table} s
+            WHERE s.movie_id IS NOT NULL
+            ORDER BY s.movie_id, s.pos DESC
+            ON CONFLICT (movie_id) DO UPDATE
+                SET title = EXCLUDED.title, year = EXCLUDED.year, url = EXCLUDED.url
+                WHERE (movies.title, movies.year, movies.url)
+                      IS DISTINCT FROM (EXCLUDED.title, EXCLUDED.year, EXCLUDED.url)
+            RETURNING id, title, year, (xmax = 0) AS inserted
+        ), changes AS (
+            SELECT u.title, u.year, 1 AS delta FROM upserted u
+            UNION ALL
+            SELECT o.title, o.year, -1 FROM upserted u JOIN old o ON o.id = u.id WHERE NOT u.inserted
+        )
+        SELECT UPPER(LEFT(title, 1)), year, SUM(delta) FROM changes GROUP BY 1, 2
+        """)
+        movie_changes = cur.fetchall()
+
+        cur.execute(f"""
+        WITH inserted AS (
+            INSERT INTO quotesnet.movies (title, year, url)
+            SELECT DISTINCT ON (s.title, s.year) s.title, s.year, s.url
+            FROM {movies_table} s
+            WHERE s.movie_id IS NULL
+              AND NOT EXISTS (
+                SELECT 1 FROM quotesnet.movies m
+                WHERE m.movie_id IS NULL AND m.title = s.title AND m.year IS NOT DISTINCT FROM s.year
+              )
+            ORDER BY s.title, s.year, s.pos
+            RETURNING title, year
+        )
+        SELECT UPPER(LEFT(title, 1)), year, COUNT(*) FROM inserted GROUP BY 1, 2
+        """)
+        movie_changes += cur.fetchall()
+        movies_inserted = sum(delta for _, _, delta in movie_changes)
+
+        # Database id of every staged movie
+        resolved = f"""
+        resolved AS (
+            SELECT s.pos, m.id
+            FROM {movies_table} s
+            JOIN quotesnet.movies m ON m.movie_id = s.movie_id
+            UNION ALL
+            SELECT s.pos, (
+                SELECT m.id FROM quotesnet.movies m
+                WHERE m.movie_id IS NULL AND m.title = s.title AND m.year IS NOT DISTINCT FROM s.year
+                ORDER BY m.id
+                LIMIT 1
+            )
+            FROM {movies_table} s
+            WHERE s.movie_id IS NULL
+        )
+        """
+
+        cur.execute(f"""
+        WITH {resolved}, inserted AS (
+            INSERT INTO quotesnet.quotes (movie_id, quote_text)
+            SELECT r.id, q.quote_text
+            FROM {quotes_table} q
+            JOIN resolved r ON r.pos = q.pos
+            ON CONFLICT (movie_id, content_hash) DO NOTHING
+            RETURNING movie_id
+        )
+        SELECT movie_id, COUNT(*) FROM inserted GROUP BY 1
+        """)
+        quote_counts = cur.fetchall()
+        quotes_inserted = sum(count for _, count in quote_counts)
+
+        cur.execute(f"""
+        WITH {resolved}
+        INSERT INTO quotesnet.quote_lines (quote_id, position, speaker, line, stage_direction)
+        SELECT q.id, l.position, l.speaker, l.line, l.stage_direction
+        FROM {lines_table} l
+        JOIN resolved r ON r.pos = l.pos
+        JOIN quotesnet.quotes q ON q.movie_id = r.id AND q.content_hash = l.content_hash
+        ON CONFLICT (quote_id, position) DO NOTHING
+        """)
+
+        update_stats(cur, movie_changes, quote_counts)
+
+    return movies_inserted, quotes_inserted
+
+
+def segment_stored_quotes(conn, batch_size=5000):
+    """
+    Split quotes stored without speaker turns into quotesnet.quote_lines.
+
+    Quotes are read with a server-side cursor and their turns COPYed in
+    batches, each committed.
+
+    Returns:
+        int: Number of quotes segmented
+    """
+    segmented = 0
+    with conn.cursor(name='unsegmented_quotes', withhold=True) as quotes:
+        quotes.itersize = batch_size
+        quotes.execute("""
+        SELECT q.id, q.quote_text FROM quotesnet.quotes q
+        WHERE NOT EXISTS (SELECT 1 FROM quotesnet.quote_lines l WHERE l.quote_id = q.id)
+        """)
+        while True:
+            batch = quotes.fetchmany(batch_size)
+            if not batch:
+                break
+            rows = [(quote_id,) + tuple(turn) for quote_id, text in batch for turn in segment_quote(text)]
+            with conn.cursor() as cur:
+                copy_rows(cur, 'quotesnet.quote_lines',
+                          ('quote_id', 'position', 'speaker', 'line', 'stage_direction'), rows)
+            conn.commit()
+            segmented += len(batch)
+    return segmented
+
+
+def search_quotes(conn, query, movie_id=None, year=None, limit=20, cursor=None, collapse=False):
+    """
+    Full-text search over quotesnet.quotes.
+
+    The query uses web search syntax (websearch_to_tsquery): "quoted phrases",
+    OR and -excluded words. Hits are ranked with ts_rank_cd, best first, ties
+    broken by quote id, and paged with a keyset cursor rather than OFFSET.
+
+    Args:
+        movie_id: only quotes of this quotes.net movie id
+        year: only quotes of movies from this year
+        cursor: (rank, quote id) of the last hit of the previous page
+        collapse: only the best hit of each near-duplicate cluster
+
+    Returns:
+        list: (quote id, movie_id, title, year, url, quote text, rank) rows
+    """
+    with conn.cursor() as cur:
+        cur.execute(*search_statement(query, movie_id, year, limit, cursor, collapse))
+        return cur.fetchall()
+
+
+def search_statement(query, movie_id=None, year=None, limit=20, cursor=None, collapse=False):
+    """The SQL and named parameters of a search_quotes call."""
+    filters = []
+    params = {'query': query, 'movie_id': movie_id, 'year': year, 'limit': limit}
+    if movie_id is not None:
+        filters.append("m.movie_id = %(movie_id)s")
+    if year is not None:
+        filters.append("m.year = %(year)s")
+    page = ["h.best"] if collapse else []
+    if cursor is not None:
+        # rank is a real; comparing against the cursor as a real keeps ties exact
+        page.append("(h.rank < %(rank)s::real OR (h.rank = %(rank)s::real AND h.id > %(after)s))")
+        params['rank'], params['after'] = cursor
+    filters = ''.join(f" AND {condition}" for condition in filters)
+    page = f"WHERE {' AND '.join(page)}" if page else ''
+    return f"""
+        WITH hits AS (
+            SELECT q.id, m.movie_id, m.title, m.year, m.url, q.quote_text, ts_rank_cd(q.search_vector, query) AS rank,
+                   COALESCE(q.cluster_id, q.id) AS cluster
+            FROM quotesnet.quotes q
+            JOIN quotesnet.movies m ON m.id = q.movie_id
+            CROSS JOIN websearch_to_tsquery('english', %(query)s) query
+            WHERE q.search_vector @@ query{filters}
+        ), ranked AS (
+            SELECT hits.*, row_number() OVER (PARTITION BY cluster ORDER BY rank DESC, id) = 1 AS best
+            FROM hits
+        )
+        SELECT h.id, h.movie_id, h.title, h.year, h.url, h.quote_text, h.rank
+        FROM {'ranked' if collapse else 'hits'} h
+        {page}
+        ORDER BY h.rank DESC, h.id
+        LIMIT %(limit)s
+        """, params
+
+
+def dedup_stored_quotes(conn, batch_size=5000):
+    """
+    Assign quotes stored without a cluster to near-duplicate clusters.
+
+    Quotes are read in id order with a server-side cursor. Each batch gets
+    MinHash signatures (crawler.dedup), its LSH buckets are looked up in
+    quotesnet.quote_buckets in one statement, and the cluster ids, signatures
+    and new bucket anchors are written back and committed. A quote's
+    cluster_id is the id of the first quote of its cluster.
+
+    Returns:
+        int: Number of quotes clustered
+    """
+    from psycopg2.extras import execute_values
+
+    from crawler.dedup import cluster_batch, unpack_signature
+
+    clustered = 0
+    with conn.cursor(name='unclustered_quotes', withhold=True) as quotes:
+        quotes.itersize = batch_size
+        quotes.execute("SELECT id, quote_text FROM quotesnet.quotes WHERE cluster_id IS NULL ORDER BY id")
+        while True:
+            batch = quotes.fetchmany(batch_size)
+            if not batch:
+                break
+            with conn.cursor() as cur:
+                def find_anchors(keys):
+                    if not keys:
+                        return {}
+                    rows = execute_values(cur, """
+                    SELECT k.band, k.bucket, q.cluster_id, q.minhash
+                    FROM (VALUES %s) AS k(band, bucket)
+                    JOIN quotesnet.quote_buckets b ON b.band = k.band AND b.bucket = k.bucket
+                    JOIN quotesnet.quotes q ON q.id = b.quote_id
+                    """, keys, page_size=len(keys), fetch=True)
+                    return {(band, bucket): (cluster_id, unpack_signature(minhash))
+                            for band, bucket, cluster_id, minhash in rows}
+
+                assigned, anchors = cluster_batch(batch, find_anchors)
+                execute_values(cur, """
+                UPDATE quotesnet.quotes q SET cluster_id = v.cluster_id, minhash = v.minhash
+                FROM (VALUES %s) AS v(id, cluster_id, minhash)
+                WHERE q.id = v.id
+                """, assigned, template="(%s, %s, %s::bytea)", page_size=len(assigned))
+                if anchors:
+                    execute_values(cur, """
+                    INSERT INTO quotesnet.quote_buckets (band, bucket, quote_id) VALUES %s
+                    ON CONFLICT (band, bucket) DO NOTHING
+                    """, anchors, page_size=len(anchors))
+                bump_data_version(cur)
+            conn.commit()
+            clustered += len(batch)
+    return clustered
@@ -0,0 +1,129 @@
+import hashlib
+import struct
+import zlib
+
+from crawler.search import tokenize
+
+# A quote's signature holds NUM_HASHES minima, cut into BANDS bands for LSH.
+# Two quotes share a bucket in some band with probability 1 - (1 - s^r)^BANDS
+# for Jaccard similarity s and r = NUM_HASHES / BANDS rows per band: 0.89 at
+# s = 0.7, 0.985 at s = 0.8, 0.19 at s = 0.4. Candidates are then kept only
+# when their signatures agree on at least THRESHOLD of the positions. Word
+# pairs as shingles keep a one-word edit of a 20-word quote above 0.8.
+NUM_HASHES = 32
+BANDS = 8
+THRESHOLD = 0.7
+SHINGLE_SIZE = 2
+
+_EMPTY = 0xFFFFFFFF
+
+
+def shingles(text, size=SHINGLE_SIZE):
+    """Distinct word size-grams of a quote; a shorter quote is one shingle."""
+    tokens = tokenize(text)
+    if len(tokens) <= size:
+        return {' '.join(tokens)} if tokens else set()
+    return {' '.join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)}
+
+
+def signature(text, num_hashes=NUM_HASHES):
+    """
+    MinHash signature of a quote, or None for a quote without words.
+
+    One permutation hashing: every shingle is hashed once, the hash picks one
+    of num_hashes bins and the rest of it competes for that bin's minimum, so
+    a signature costs O(shingles + num_hashes) instead of their product. Empty
+    bins borrow the minimum of the next non-empty bin (densification).
+    """
+    values = [_EMPTY] * num_hashes
+    for shingle in shingles(text):
+        h = zlib.crc32(shingle.encode('utf-8'))
+        slot, value = h % num_hashes, h // num_hashes
+        if value < values[slot]:
+            values[slot] = value
+    if all(value == _EMPTY for value in values):
+        return None
+    for slot in range(num_hashes):
+        offset = 1
+        while values[slot] == _EMPTY:
+            values[slot] = values[(slot + offset) % num_hashes]
+            offset += 1
+    return tuple(values)
+
+
+def similarity(a, b):
+    """Estimated Jaccard similarity of two signatures."""
+    return sum(x == y for x, y in zip(a, b)) / len(a)
+
+
+def band_keys(sig, bands=BANDS):
+    """One (band, bucket) LSH key per band; buckets are signed 64-bit ints."""
+    rows = len(sig) // bands
+    keys = []
+    for band in range(bands):
+        packed = struct.pack(f'<{rows}I', *sig[band * rows:(band + 1) * rows])
+        bucket = int.from_bytes(hashlib.blake2b(packed, digest_size=8).digest(), 'big', signed=True)
+        keys.append((band, bucket))
+    return keys
+
+
+def pack_signature(sig):
+    return struct.pack(f'<{len(sig)}I', *sig)
+
+
+def unpack_signature(data):
+    return struct.unpack(f'<{len(data) // 4}I', bytes(data))
+
+
+def cluster_batch(quotes, find_anchors, threshold=THRESHOLD, bands=BANDS):
+    """
+    Assign a batch of quotes to near-duplicate clusters.
+
+    Every LSH bucket is anchored by the first quote that landed in it. A quote
+    joins the lowest cluster among the anchors of its buckets whose signature
+    is similar enough, or starts a cluster named after its own id, and then
+    anchors the buckets nobody holds yet. Each quote is compared with at most
+    one anchor per band, so the work is linear in the number of quotes.
+
+    Args:
+        quotes: (quote id, text) pairs, in id order
+        find_anchors: callable taking a list of (band, bucket) keys and
+            returning {(band, bucket): (cluster id, signature)} for the keys
+            anchored by earlier batches
+
+    Returns:
+        tuple: (list of (quote id, cluster id, packed signature or None),
+                list of new (band, bucket, quote id) anchors)
+    """
+    signed = [(quote_id, signature(text)) for quote_id, text in quotes]
+    keys = {quote_id: band_keys(sig, bands) for quote_id, sig in signed if sig is not None}
+    anchors = find_anchors(sorted({key for quote_keys in keys.values() for key in quote_keys}))
+
+    assigned = []
+    new_anchors = []
+    for quote_id, sig in signed:
+        if sig is None:
+            assigned.append((quote_id, quote_id, None))
+            continue
+        cluster = quote_id
+        for key in keys[quote_id]:
+            anchor = anchors.get(key)
+            if anchor is not None and anchor[0] < cluster and similarity(sig, anchor[1]) >= threshold:
+                cluster = anchor[0]
+        for key in keys[quote_id]:
+            if key not in anchors:
+                anchors[key] = (cluster, sig)
+                new_anchors.append(key + (quote_id,))
+        assigned.append((quote_id, cluster, pack_signature(sig)))
+    return assigned, new_anchors
+
+
+def cluster_quotes(texts, threshold=THRESHOLD, bands=BANDS):
+    """
+    Cluster quotes held in memory; quote ids are positions in texts.
+
+    Returns:
+        list: the cluster id (lowest quote id of the cluster) of every quote
+    """
+    assigned, _ = cluster_batch(list(enumerate(texts)), lambda keys: {}, threshold, bands)
+    return [cluster for _, cluster, _ in assigned]
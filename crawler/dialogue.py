@@ -0,0 +1,68 @@
+import re
+from collections import namedtuple
+
+# One speaker turn of a quote. speaker is None for narration and for scene
+# directions given before anyone speaks; stage_direction joins the [...]
+# parts of the turn with " | ".
+Turn = namedtuple('Turn', ['position', 'speaker', 'line', 'stage_direction'])
+
+# A speaker name is a capitalised word followed by up to five more words,
+# which may be lower case ("Security guard", "Guy in lab coat") or follow a
+# comma ("Lawson, the Fugitive"). Lower-case words are letters only, so a
+# run-on "lieMr." is never taken for part of a name.
+_FIRST_WORD = r"[A-ZÀ-ÖØ-Þ][\w'.&\-]*"
+_WORD = r"(?:[A-ZÀ-ÖØ-Þ0-9#'\"(][\w'.&\-\")]*|[a-z][a-z'\-]*)"
+_NAME = rf"{_FIRST_WORD}(?: ?,? {_WORD}){{0,5}}"
+# Quotes are scraped as run-on text ("...pilgrim?Jeremiah Johnson: I can...",
+# "...hung upFreeman: Doesn't matter"), so a new turn starts at a name
+# followed by a colon that opens the text or directly follows punctuation,
+# a closing bracket or a lower-case letter -- never a space, which is what
+# keeps colons inside a line ("Just one thing though: Does...") in the line.
+SPEAKER = re.compile(rf"(?<![\s,:;\d_A-ZÀ-ÖØ-Þ])(?P<speaker>{_NAME}):(?!\d)\s*")
+DIRECTION = re.compile(r"\[([^\]]*)\]")
+
+
+def _turn(position, speaker, body):
+    if '[' in body:
+        directions = ' | '.join(direction.strip() for direction in DIRECTION.findall(body) if direction.strip())
+        body = DIRECTION.sub(' ', body)
+    else:
+        directions = None
+    line = ' '.join(body.split())
+    return Turn(position, speaker, line or None, directions or None)
+
+
+def segment_quote(text):
+    """
+    Split one quote into speaker turns.
+
+        >>> segment_quote("[at dawn]Del Gue: Hawk.Jeremiah Johnson: [nods] Yep.")
+        [Turn(position=0, speaker=None, line=None, stage_direction='at dawn'),
+         Turn(position=1, speaker='Del Gue', line='Hawk.', stage_direction=None),
+         Turn(position=2, speaker='Jeremiah Johnson', line='Yep.', stage_direction='nods')]
+    """
+    turns = []
+    start = 0
+    speaker = None
+    for match in SPEAKER.finditer(text):
+        body = text[start:match.start()]
+        if speaker is not None or body.strip():
+            turns.append(_turn(len(turns), speaker, body))
+        speaker = match.group('speaker')
+        start = match.end()
+    body = text[start:]
+    if speaker is not None or body.strip():
+        turns.append(_turn(len(turns), speaker, body))
+    return turns
+
+
+def segment_quotes(texts):
+    """
+    Segment a batch of quotes.
+
+    Yields:
+        tuple: (index of the quote in texts, Turn) for every turn, in order
+    """
+    for index, text in enumerate(texts):
+        for turn in segment_quote(text):
+            yield index, turn
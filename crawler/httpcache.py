@@ -0,0 +1,70 @@
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+
+class ConditionalCachePolicy:
+    """
+    HTTP cache policy for quotes.net.
+
+    Successful responses are always stored (quotes.net sends no cache headers).
+    Cached pages are revalidated on every crawl with If-None-Match /
+    If-Modified-Since built from the stored ETag / Last-Modified, and a 304
+    answer is served from the cache. Movie list pages may be trusted for
+    HTTPCACHE_INDEX_TTL seconds without revalidation.
+
+    With HTTPCACHE_REPLAY every cached response is treated as fresh, so a crawl
+    can be replayed offline against the cache, e.g. after changing the parser.
+    """
+
+    def __init__(self, settings):
+        self.ignore_schemes = settings.getlist('HTTPCACHE_IGNORE_SCHEMES')
+        self.replay = settings.getbool('HTTPCACHE_REPLAY')
+        self.index_ttl = settings.getint('HTTPCACHE_INDEX_TTL', 0)
+
+    def should_cache_request(self, request):
+        if urlparse(request.url).scheme in self.ignore_schemes:
+            return False
+        if request.meta.get('dont_cache', False):
+            return False
+        return request.method == 'GET'
+
+    def should_cache_response(self, response, request):
+        return response.status == 200
+
+    def is_cached_response_fresh(self, cachedresponse, request):
+        if self.replay:
+            return True
+        if self.index_ttl and '/allmovies/' in request.url:
+            age = self._age(cachedresponse)
+            if age is not None and age < self.index_ttl:
+                return True
+        self._set_conditional_validators(request, cachedresponse)
+        return False
+
+    def is_cached_response_valid(self, cachedresponse, response, request):
+        return response.status == 304
+
+    def _set_conditional_validators(self, request, cachedresponse):
+        etag = cachedresponse.headers.get(b'ETag')
+        if etag:
+            request.headers[b'If-None-Match'] = etag
+        last_modified = cachedresponse.headers.get(b'Last-Modified')
+        if last_modified:
+            request.headers[b'If-Modified-Since'] = last_modified
+        elif not etag:
+            # Fall back to the time the page was cached, which quotes.net may still honour
+            date = cachedresponse.headers.get(b'Date')
+            if date:
+                request.headers[b'If-Modified-Since'] = date
+
+    def _age(self, cachedresponse):
+        date = cachedresponse.headers.get(b'Date')
+        if not date:
+            return None
+        try:
+            cached_at = parsedate_to_datetime(date.decode('latin-1')).timestamp()
+        except (TypeError, ValueError):
+            return None
+        return time.time() - cached_at
+
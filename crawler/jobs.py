@@ -0,0 +1,278 @@
+import itertools
+import json
+import logging
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+CRAWLER_DIR = os.path.dirname(os.path.abspath(__file__))
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+MODES = ('full', 'incremental', 'replay')
+
+# Scrapy's LogStats line, logged every LOGSTATS_INTERVAL seconds and when the spider closes
+LOGSTATS = re.compile(r"Crawled (\d+) pages \(at (\d+) pages/min\), scraped (\d+) items \(at (\d+) items/min\)")
+
+# Bytes read from the end of a job's log to find its latest progress line
+LOG_TAIL_BYTES = 64 * 1024
+
+
+class JobQueueFull(Exception):
+    """Raised when a job is submitted while the queue of waiting jobs is full."""
+
+
+class JobConflict(Exception):
+    """Raised when a job would crawl letters a queued or running job already covers."""
+
+
+def letter_groups(letters):
+    """Index page letters of a letters argument ("Z", "Q,UV,X"), or None for "all"."""
+    if letters.strip().lower() == 'all':
+        return None
+    return {group.strip().upper() for group in letters.split(',') if group.strip()}
+
+
+def letters_overlap(a, b):
+    groups_a, groups_b = letter_groups(a), letter_groups(b)
+    if groups_a is None or groups_b is None:
+        return True
+    return bool(set(''.join(groups_a)) & set(''.join(groups_b)))
+
+
+class CrawlJob:
+    """One crawl run by crawler/run.py in a supervised subprocess."""
+
+    def __init__(self, job_id, letters='Z', batch_size=0, max_movies=0, mode='full', job_dir=None):
+        self.id = job_id
+        self.letters = letters
+        self.batch_size = batch_size
+        self.max_movies = max_movies
+        self.mode = mode
+        self.job_dir = job_dir
+        self.log_path = os.path.join(job_dir, 'crawl.log')
+        self.status = QUEUED
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.returncode = None
+        self.error = None
+        self.cancel_requested = False
+        self.process = None
+
+    def command(self, progress_interval=10):
+        """Command line of the crawl; its Scrapy job directory and run report live in job_dir."""
+        command = [
+            sys.executable, os.path.join(CRAWLER_DIR, 'run.py'),
+            '--letters', self.letters,
+            '--batch-size', str(self.batch_size),
+            '--max-movies', str(self.max_movies),
+            # Concurrent crawls would compete for one metrics port
+            '--set', 'METRICS_PORT=0',
+            '--set', f'METRICS_REPORT_DIR={self.job_dir}',
+            '--set', f'LOGSTATS_INTERVAL={progress_interval}',
+            '--set', f"JOBDIR={os.path.join(self.job_dir, 'scrapy')}",
+        ]
+        if self.mode == 'incremental':
+            command.append('--incremental')
+        elif self.mode == 'replay':
+            command.append('--replay')
+        return command
+
+    def progress(self):
+        """
+        Pages crawled and items scraped so far, from the latest LogStats line
+        of the job's log; finished jobs add next_start_index from their run report.
+        """
+        progress = {'pages': 0, 'items': 0, 'pages_per_min': 0, 'items_per_min': 0}
+        try:
+            with open(self.log_path, 'rb') as f:
+                f.seek(max(0, os.path.getsize(self.log_path) - LOG_TAIL_BYTES))
+                tail = f.read().decode('utf-8', 'replace')
+        except OSError:
+            tail = ''
+        matches = LOGSTATS.findall(tail)
+        if matches:
+            pages, pages_rate, items, items_rate = map(int, matches[-1])
+            progress.update(pages=pages, items=items, pages_per_min=pages_rate, items_per_min=items_rate)
+        if self.status in FINISHED:
+            report = self.report()
+            if report:
+                stats = report.get('scrapy_stats', {})
+                progress['pages'] = stats.get('response_received_count', progress['pages'])
+                progress['items'] = stats.get('item_scraped_count', progress['items'])
+                progress['next_start_index'] = report.get('next_start_index')
+        return progress
+
+    def report(self):
+        """The run report the crawl's metrics extension wrote when it closed, or None."""
+        try:
+            names = sorted(name for name in os.listdir(self.job_dir) if name.startswith('run_report_'))
+        except OSError:
+            return None
+        if not names:
+            return None
+        try:
+            with open(os.path.join(self.job_dir, names[-1]), 'r') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'status': self.status,
+            'letters': self.letters,
+            'batch_size': self.batch_size,
+            'max_movies': self.max_movies,
+            'mode': self.mode,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'returncode': self.returncode,
+            'error': self.error,
+            'progress': self.progress(),
+        }
+
+
+class CrawlJobManager:
+    """
+    Runs crawls as supervised subprocesses, at most max_concurrent at a time.
+
+    Submitted jobs wait in a FIFO queue of up to max_queued jobs for a free
+    slot. A supervisor thread per running job waits for its process, records
+    the outcome and starts the next queued job. Cancelling a running job
+    sends SIGTERM, which lets Scrapy close the spider and finish its output
+    segments, and SIGKILL after cancel_grace seconds. The newest keep_finished
+    finished jobs stay listed.
+    """
+
+    def __init__(self, jobs_dir, max_concurrent=1, max_queued=10, cancel_grace=30.0, progress_interval=10,
+                 keep_finished=100):
+        self.jobs_dir = os.path.abspath(jobs_dir)
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.cancel_grace = cancel_grace
+        self.progress_interval = progress_interval
+        self.keep_finished = keep_finished
+        self.jobs = {}
+        self.queue = []
+        self.running = set()
+        self.lock = threading.Lock()
+        self.sequence = itertools.count(1)
+
+    def submit(self, letters='Z', batch_size=0, max_movies=0, mode='full'):
+        """
+        Queue a crawl and start it if a slot is free.
+
+        Raises:
+            ValueError: for an unknown mode or empty letters
+            JobConflict: if a queued or running job covers any of the letters
+            JobQueueFull: if max_queued jobs are already waiting
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown mode {mode!r}, expected one of {', '.join(MODES)}")
+        if letter_groups(letters) == set():
+            raise ValueError("No letters to crawl")
+        with self.lock:
+            for other in self.jobs.values():
+                if other.status in (QUEUED, RUNNING) and letters_overlap(letters, other.letters):
+                    raise JobConflict(f"Job {other.id} is already crawling {other.letters}")
+            if len(self.running) >= self.max_concurrent and len(self.queue) >= self.max_queued:
+                raise JobQueueFull(f"{len(self.queue)} crawl jobs are already waiting")
+            job_id = f"{time.strftime('%Y%m%d%H%M%S')}-{next(self.sequence)}-{uuid.uuid4().hex[:6]}"
+            job = CrawlJob(job_id, letters, batch_size, max_movies, mode, os.path.join(self.jobs_dir, job_id))
+            self.jobs[job_id] = job
+            self.queue.append(job)
+            self._start_queued()
+        return job
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def list(self):
+        with self.lock:
+            return sorted(self.jobs.values(), key=lambda job: job.created_at, reverse=True)
+
+    def cancel(self, job_id):
+        """Cancel a queued or running job; return it, or None if unknown."""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None or job.status in FINISHED:
+                return job
+            job.cancel_requested = True
+            if job.status == QUEUED:
+                self.queue.remove(job)
+                job.status = CANCELLED
+                job.finished_at = time.time()
+                return job
+            process = job.process
+        logger.info(f"Cancelling crawl job {job_id}")
+        process.terminate()
+        threading.Thread(target=self._kill_after_grace, args=(process,), daemon=True).start()
+        return job
+
+    def shutdown(self):
+        """Cancel every queued and running job, e.g. when the API stops."""
+        for job in self.list():
+            self.cancel(job.id)
+
+    def _kill_after_grace(self, process):
+        try:
+            process.wait(self.cancel_grace)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+    def _start_queued(self):
+        # Called with the lock held
+        while self.queue and len(self.running) < self.max_concurrent:
+            job = self.queue.pop(0)
+            os.makedirs(job.job_dir, exist_ok=True)
+            try:
+                with open(job.log_path, 'ab') as log:
+                    job.process = subprocess.Popen(job.command(self.progress_interval), stdout=log,
+                                                   stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL,
+                                                   cwd=os.path.dirname(CRAWLER_DIR))
+            except OSError as e:
+                job.status = FAILED
+                job.error = f"Could not start the crawler: {e}"
+                job.finished_at = time.time()
+                continue
+            job.status = RUNNING
+            job.started_at = time.time()
+            self.running.add(job.id)
+            threading.Thread(target=self._supervise, args=(job,), name=f'crawl-job-{job.id}', daemon=True).start()
+        self._forget_finished()
+
+    def _supervise(self, job):
+        returncode = job.process.wait()
+        with self.lock:
+            job.returncode = returncode
+            job.finished_at = time.time()
+            if job.cancel_requested:
+                job.status = CANCELLED
+            elif returncode == 0:
+                job.status = SUCCEEDED
+            else:
+                job.status = FAILED
+                job.error = f"Crawler exited with code {returncode}, see {job.log_path}"
+            self.running.discard(job.id)
+            self._start_queued()
+        logger.info(f"Crawl job {job.id} {job.status}")
+
+    def _forget_finished(self):
+        finished = sorted((job for job in self.jobs.values() if job.status in FINISHED),
+                          key=lambda job: job.finished_at)
+        for job in finished[:max(0, len(finished) - self.keep_finished)]:
+            del self.jobs[job.id]
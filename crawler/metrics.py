@@ -0,0 +1,405 @@
+import bisect
+import collections
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+def _label_text(labels):
+    if not labels:
+        return ''
+    pairs = ','.join('{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                     for name, value in labels)
+    return '{' + pairs + '}'
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus style."""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, fraction):
+        """Upper bound of the bucket holding the given quantile, capped at the largest observation."""
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(self.buckets[i], self.max) if i < len(self.buckets) else self.max
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'mean': round(self.sum / self.count, 6) if self.count else 0.0,
+            'p50': self.quantile(0.50),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+            'max': round(self.max, 6),
+        }
+
+
+class MetricsRegistry:
+    """
+    Thread-safe counters and histograms, keyed by metric name and labels.
+
+    Observations can come from the reactor thread and from pipeline writer
+    threads; the exporter renders them from its own HTTP thread.
+    """
+
+    def __init__(self, rate_window=60.0):
+        self.lock = threading.Lock()
+        self.help = {}
+        self.counters = collections.defaultdict(float)
+        self.histograms = {}
+        self.bucket_sets = {}
+        self.rate_window = rate_window
+        self.events = collections.defaultdict(collections.deque)
+        self.started = time.time()
+
+    def describe(self, name, text, buckets=None):
+        self.help[name] = text
+        if buckets is not None:
+            self.bucket_sets[name] = tuple(buckets)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted((label, str(value)) for label, value in labels.items())))
+        with self.lock:
+            self.counters[key] += value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted((label, str(value)) for label, value in labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(self.bucket_sets.get(name, LATENCY_BUCKETS))
+            histogram.observe(value)
+
+    def mark(self, name):
+        """Record an event for the sliding-window per-second rate of ``name``."""
+        now = time.monotonic()
+        with self.lock:
+            events = self.events[name]
+            events.append(now)
+            while events and events[0] < now - self.rate_window:
+                events.popleft()
+
+    def rate(self, name):
+        now = time.monotonic()
+        with self.lock:
+            events = self.events[name]
+            while events and events[0] < now - self.rate_window:
+                events.popleft()
+            window = min(self.rate_window, time.time() - self.started) or 1.0
+            return len(events) / window
+
+    def timer(self, name, **labels):
+        """Context manager observing the elapsed seconds into a histogram."""
+        return _Timer(self, name, labels)
+
+    def render(self, stats=None):
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items(), key=lambda entry: entry[0])
+            rates = sorted(self.events)
+        described = set()
+
+        def header(name, kind):
+            if name in described:
+                return
+            described.add(name)
+            if name in self.help:
+                lines.append(f"# HELP {name} {self.help[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in counters:
+            header(name, 'counter')
+            lines.append(f"{name}{_label_text(labels)} {value:g}")
+        for (name, labels), histogram in histograms:
+            header(name, 'histogram')
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+                cumulative += count
+                le = bound if bound == '+Inf' else f"{bound:g}"
+                lines.append(f"{name}_bucket{_label_text(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{name}_sum{_label_text(labels)} {histogram.sum:.6f}")
+            lines.append(f"{name}_count{_label_text(labels)} {histogram.count}")
+        for name in rates:
+            gauge = f"{name}_per_second"
+            header(gauge, 'gauge')
+            lines.append(f"{gauge} {self.rate(name):.3f}")
+        if stats:
+            header('scrapy_stat', 'gauge')
+            for key, value in sorted(stats.items()):
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    lines.append(f"scrapy_stat{_label_text((('name', key),))} {value:g}")
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self):
+        """Counters, histogram summaries and current rates as plain JSON data."""
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items(), key=lambda entry: entry[0])
+            rates = sorted(self.events)
+        data = {'counters': {}, 'histograms': {}, 'rates': {}}
+        for (name, labels), value in counters:
+            data['counters'].setdefault(name, {})[_label_text(labels) or 'total'] = value
+        for (name, labels), histogram in histograms:
+            data['histograms'].setdefault(name, {})[_label_text(labels) or 'all'] = histogram.summary()
+        for name in rates:
+            data['rates'][f"{name}_per_second"] = round(self.rate(name), 3)
+        return data
+
+
+class _Timer:
+    def __init__(self, registry, name, labels):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.registry.observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+def metrics_for(crawler):
+    """The metrics registry shared by every component of a crawler."""
+    registry = getattr(crawler, 'crawl_metrics', None)
+    if registry is None:
+        registry = crawler.crawl_metrics = MetricsRegistry()
+        registry.describe('crawler_requests_total', "Requests that reached the downloader")
+        registry.describe('crawler_responses_total', "Responses received, by status and cache hit")
+        registry.describe('crawler_items_total', "Items scraped")
+        registry.describe('crawler_download_latency_seconds', "Download latency of network responses")
+        registry.describe('crawler_parse_seconds', "Time spent in spider callbacks")
+        registry.describe('crawler_quotes_per_movie', "Quotes extracted per scraped movie", COUNT_BUCKETS)
+        registry.describe('crawler_state_save_seconds', "Time spent writing crawl state")
+        registry.describe('crawler_pipeline_write_seconds', "Time spent writing items in pipelines")
+    return registry
+
+
+class CallbackTimingMiddleware:
+    """
+    Spider middleware timing each callback into crawler_parse_seconds.
+
+    Only the time spent inside the callback generator is counted, not the
+    time the rest of Scrapy spends handling what it yields.
+    """
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('METRICS_ENABLED', True):
+            raise NotConfigured
+        return cls(metrics_for(crawler))
+
+    def process_spider_output(self, response, result, spider):
+        callback = response.request.callback
+        name = getattr(callback, '__name__', None) or 'parse'
+        elapsed = 0.0
+        iterator = iter(result)
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    output = next(iterator)
+                except StopIteration:
+                    elapsed += time.perf_counter() - start
+                    break
+                elapsed += time.perf_counter() - start
+                yield output
+        finally:
+            self.metrics.observe('crawler_parse_seconds', elapsed, callback=name)
+
+    async def process_spider_output_async(self, response, result, spider):
+        """process_spider_output for callbacks that are async generators (Scrapy 2.7+)."""
+        callback = response.request.callback
+        name = getattr(callback, '__name__', None) or 'parse'
+        elapsed = 0.0
+        iterator = result.__aiter__()
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    output = await iterator.__anext__()
+                except StopAsyncIteration:
+                    elapsed += time.perf_counter() - start
+                    break
+                elapsed += time.perf_counter() - start
+                yield output
+        finally:
+            self.metrics.observe('crawler_parse_seconds', elapsed, callback=name)
+
+
+class CrawlMetrics:
+    """
+    Extension exporting live crawl metrics and writing a JSON run report.
+
+    Counters and histograms (request and item rates, download latency, parse
+    time per callback, quotes per movie, response statuses, state-save and
+    pipeline write time) are served in the Prometheus text format on
+    http://METRICS_HOST:METRICS_PORT/metrics, with the same data as JSON on
+    /report. When the spider closes, the report is written to
+    run_report_<timestamp>.json in METRICS_REPORT_DIR (default: the spider's
+    state directory).
+    """
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.metrics = metrics_for(crawler)
+        self.host = settings.get('METRICS_HOST', '127.0.0.1')
+        self.port = settings.getint('METRICS_PORT', 0)
+        self.report_dir = settings.get('METRICS_REPORT_DIR')
+        self.server = None
+        self.spider = None
+        self.started_at = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('METRICS_ENABLED', True):
+            raise NotConfigured
+        extension = cls(crawler)
+        crawler.signals.connect(extension.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(extension.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(extension.request_reached_downloader, signal=signals.request_reached_downloader)
+        crawler.signals.connect(extension.response_received, signal=signals.response_received)
+        crawler.signals.connect(extension.item_scraped, signal=signals.item_scraped)
+        return extension
+
+    def spider_opened(self, spider):
+        self.spider = spider
+        self.started_at = datetime.now()
+        if self.port:
+            self.start_server()
+
+    def start_server(self):
+        try:
+            self.server = ThreadingHTTPServer((self.host, self.port), _make_handler(self))
+        except OSError as e:
+            logger.warning(f"Metrics endpoint disabled, cannot listen on {self.host}:{self.port}: {e}")
+            return
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name='metrics-http', daemon=True).start()
+        logger.info(f"Serving crawl metrics on http://{self.host}:{self.server.server_port}/metrics")
+
+    def request_reached_downloader(self, request, spider):
+        self.metrics.inc('crawler_requests_total')
+        self.metrics.mark('crawler_requests')
+
+    def response_received(self, response, request, spider):
+        cached = 'cached' in response.flags
+        self.metrics.inc('crawler_responses_total', status=response.status, cached=str(cached).lower())
+        if not cached and 'download_latency' in request.meta:
+            self.metrics.observe('crawler_download_latency_seconds', request.meta['download_latency'])
+
+    def item_scraped(self, item, response, spider):
+        self.metrics.inc('crawler_items_total')
+        self.metrics.mark('crawler_items')
+        self.metrics.observe('crawler_quotes_per_movie', len(item.get('quotes') or []))
+
+    def render(self):
+        return self.metrics.render(self.stats.get_stats())
+
+    def report(self, reason=None):
+        """Structured run report: run info, derived rates and every metric."""
+        spider = self.spider
+        stats = self.stats.get_stats()
+        elapsed = (datetime.now() - self.started_at).total_seconds() if self.started_at else 0.0
+        snapshot = self.metrics.snapshot()
+        requests = sum(snapshot['counters'].get('crawler_requests_total', {}).values())
+        responses = snapshot['counters'].get('crawler_responses_total', {})
+        total_responses = sum(responses.values())
+        forbidden = sum(count for labels, count in responses.items() if 'status="403"' in labels)
+        report = {
+            'spider': spider.name if spider else None,
+            'finish_reason': reason,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'elapsed_sec': round(elapsed, 3),
+            'requests_per_sec': round(requests / elapsed, 3) if elapsed else 0.0,
+            'items_per_sec': round(stats.get('item_scraped_count', 0) / elapsed, 3) if elapsed else 0.0,
+            'forbidden_rate': round(forbidden / total_responses, 4) if total_responses else 0.0,
+            'retry_rate': round(stats.get('retry/count', 0) / requests, 4) if requests else 0.0,
+            'next_start_index': getattr(spider, 'next_index', None),
+            **snapshot,
+            'scrapy_stats': {key: value for key, value in stats.items()
+                             if isinstance(value, (int, float, str)) and not isinstance(value, bool)},
+        }
+        return report
+
+    def spider_closed(self, spider, reason):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+        report_dir = self.report_dir or getattr(spider, 'state_dir', None) or os.getcwd()
+        os.makedirs(report_dir, exist_ok=True)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        report_file = os.path.join(report_dir, f'run_report_{timestamp}.json')
+        with open(report_file, 'w') as f:
+            json.dump(self.report(reason), f, indent=2, default=str)
+        logger.info(f"Run report saved to {report_file}")
+
+
+def _make_handler(extension):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            from twisted.internet import reactor, threads
+
+            path = self.path.split('?', 1)[0]
+            # Scrapy's stats dict is only ever changed on the reactor thread,
+            # so it is read there too rather than iterated from this one
+            if path == '/metrics':
+                body = threads.blockingCallFromThread(reactor, extension.render).encode('utf-8')
+                content_type = 'text/plain; version=0.0.4; charset=utf-8'
+            elif path == '/report':
+                report = threads.blockingCallFromThread(reactor, extension.report)
+                body = json.dumps(report, indent=2, default=str).encode('utf-8')
+                content_type = 'application/json'
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
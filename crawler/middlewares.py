@@ -0,0 +1,127 @@
+import asyncio
+import time
+
+
+class AdaptivePolitenessMiddleware:
+    """
+    Paces downloads with a non-blocking token bucket and adapts to the site.
+
+    The request rate and the number of requests in flight grow additively while
+    responses come back fast and clean, and are cut multiplicatively on slow
+    responses, 429/5xx errors or connection failures (AIMD). A run of 403/429
+    responses is treated as a ban: all requests are held back for a cool-down
+    period and the controller restarts from its minimum rate.
+
+    Waiting happens with asyncio.sleep, so the reactor keeps running while
+    requests are held back. Requires the asyncio reactor set in settings.py.
+    """
+
+    BAN_STATUSES = (403, 429)
+    BACKOFF_STATUSES = (429, 500, 502, 503, 504, 520, 521, 522, 524)
+
+    def __init__(self, settings, stats=None):
+        self.min_rate = settings.getfloat('POLITENESS_MIN_RATE', 0.2)
+        self.max_rate = settings.getfloat('POLITENESS_MAX_RATE', 8.0)
+        self.rate = settings.getfloat('POLITENESS_START_RATE', 1.0)
+        self.rate_step = settings.getfloat('POLITENESS_RATE_STEP', 0.1)
+        self.burst = settings.getfloat('POLITENESS_BURST', 2.0)
+        self.target_latency = settings.getfloat('POLITENESS_TARGET_LATENCY', 2.0)
+        self.max_concurrency = settings.getint('CONCURRENT_REQUESTS_PER_DOMAIN', 8)
+        self.ban_threshold = settings.getint('POLITENESS_BAN_THRESHOLD', 3)
+        self.cooldown = settings.getfloat('POLITENESS_COOLDOWN', 300.0)
+        self.stats = stats
+
+        self.concurrency = 1.0
+        self.in_flight = 0
+        self.tokens = self.burst
+        self.last_refill = time.monotonic()
+        self.cooldown_until = 0.0
+        self.consecutive_bans = 0
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler.settings, crawler.stats)
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    async def process_request(self, request, spider):
+        while True:
+            now = time.monotonic()
+            if now < self.cooldown_until:
+                await asyncio.sleep(self.cooldown_until - now)
+                continue
+            self._refill(now)
+            if self.in_flight < int(self.concurrency) and self.tokens >= 1:
+                self.tokens -= 1
+                self.in_flight += 1
+                request.meta['politeness_slot'] = True
+                return None
+            wait = (1 - self.tokens) / self.rate if self.tokens < 1 else 0.05
+            await asyncio.sleep(max(wait, 0.01))
+
+    def process_response(self, request, response, spider):
+        # Responses served by an earlier middleware (e.g. the HTTP cache) never took a slot
+        if not request.meta.pop('politeness_slot', False):
+            return response
+        self.in_flight = max(self.in_flight - 1, 0)
+        latency = request.meta.get('download_latency', 0.0)
+
+        if response.status in self.BAN_STATUSES:
+            self.consecutive_bans += 1
+            if self.consecutive_bans >= self.ban_threshold:
+                self._enter_cooldown(spider, response)
+            else:
+                self._decrease(spider, f"HTTP {response.status}")
+        elif response.status in self.BACKOFF_STATUSES:
+            self.consecutive_bans = 0
+            self._decrease(spider, f"HTTP {response.status}")
+        elif latency > self.target_latency:
+            self.consecutive_bans = 0
+            self._decrease(spider, f"latency {latency:.2f}s")
+        else:
+            self.consecutive_bans = 0
+            self._increase()
+        return response
+
+    def process_exception(self, request, exception, spider):
+        if not request.meta.pop('politeness_slot', False):
+            return None
+        self.in_flight = max(self.in_flight - 1, 0)
+        self._decrease(spider, exception.__class__.__name__)
+        return None
+
+    def _increase(self):
+        self.rate = min(self.max_rate, self.rate + self.rate_step)
+        self.concurrency = min(self.max_concurrency, self.concurrency + 1 / self.concurrency)
+        self._record()
+
+    def _decrease(self, spider, reason):
+        self.rate = max(self.min_rate, self.rate / 2)
+        self.concurrency = max(1.0, self.concurrency / 2)
+        spider.logger.debug(f"Backing off ({reason}): rate={self.rate:.2f}/s, concurrency={int(self.concurrency)}")
+        self._record()
+
+    def _enter_cooldown(self, spider, response):
+        retry_after = (response.headers.get('Retry-After') or b'').decode('latin-1')
+        cooldown = self.cooldown
+        if retry_after.isdigit():
+            cooldown = max(cooldown, float(retry_after))
+        self.cooldown_until = time.monotonic() + cooldown
+        self.rate = self.min_rate
+        self.concurrency = 1.0
+        self.tokens = 0.0
+        self.consecutive_bans = 0
+        spider.logger.warning(
+            f"Possible ban detected (HTTP {response.status} x{self.ban_threshold}), "
+            f"cooling down for {cooldown:.0f}s"
+        )
+        if self.stats:
+            self.stats.inc_value('politeness/bans')
+        self._record()
+
+    def _record(self):
+        if self.stats:
+            self.stats.set_value('politeness/rate', round(self.rate, 3))
+            self.stats.set_value('politeness/concurrency', int(self.concurrency))
@@ -0,0 +1,195 @@
+import bisect
+import itertools
+import json
+import os
+import random
+
+from crawler.db import parse_movie_title, parse_movie_url
+from crawler.offsets import MappedSegment, is_indexable, load_offset_index
+from crawler.readers import iter_movie_records, normalize_record, result_files
+from crawler.segments import load_manifest
+
+
+def data_version(directory):
+    """
+    Version of the results in a directory, for cache invalidation.
+
+    A crawler output directory is versioned by its manifest generation,
+    which every finished segment bumps; any other directory by the path,
+    mtime and size of each results file.
+    """
+    manifest = load_manifest(directory)
+    if manifest['segments']:
+        return ('manifest', manifest.get('generation'))
+    version = []
+    for path in result_files(directory):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        version.append((path, stat.st_mtime_ns, stat.st_size))
+    return ('files', tuple(version))
+
+
+def movie_key(record):
+    """Identity of a movie across records: its quotes.net id, else its title and year."""
+    title, year, title_movie_id = parse_movie_title(record['title'])
+    movie_id = parse_movie_url(record.get('url')) or title_movie_id
+    return movie_id if movie_id is not None else (title, year)
+
+
+class MovieIndex:
+    """
+    Movies of a results directory, for paging and lookups without reading it.
+
+    Every movie gets a position in the order it was first seen; a movie
+    crawled again later keeps its position and takes its latest record.
+    Uncompressed JSON Lines segments are memory-mapped and a movie is kept
+    as the offset and length of its line, read from the segment's offset
+    index (crawler/offsets.py), so building the index decodes nothing and a
+    lookup decodes one record. Records of other files (JSON arrays,
+    compressed segments) are kept serialized. Positions are listed per
+    title letter, per year and per both, so a filtered page is a bisect into
+    one list followed by page-size work.
+    """
+
+    def __init__(self):
+        self.sources = []
+        self.described = []
+        self.quote_counts = []
+        self.keys = {}
+        self.movie_ids = {}
+        self.letters = {}
+        self.years = {}
+        self.letter_years = {}
+        self.all = []
+        self._cumulative = None
+
+    @classmethod
+    def from_directory(cls, directory):
+        index = cls()
+        for path in result_files(directory):
+            if not is_indexable(path):
+                for record in iter_movie_records(path):
+                    if record['title']:
+                        index.add_record(record)
+                continue
+            segment = MappedSegment(path)
+            for movie_id, offset, length, quotes, year, letter in load_offset_index(path):
+                source = (segment, offset, length)
+                if movie_id >= 0:
+                    key = movie_id
+                else:
+                    key = movie_key(normalize_record(json.loads(segment.read(offset, length))))
+                index.add(key, movie_id if movie_id >= 0 else None, chr(letter) if letter else '', year or None,
+                          quotes, source)
+        return index.finish()
+
+    @classmethod
+    def from_records(cls, records):
+        index = cls()
+        for record in records:
+            if record.get('title'):
+                index.add_record(record)
+        return index.finish()
+
+    def add_record(self, record):
+        title, year, title_movie_id = parse_movie_title(record['title'])
+        movie_id = parse_movie_url(record.get('url')) or title_movie_id
+        key = movie_id if movie_id is not None else (title, year)
+        self.add(key, movie_id, title[:1].upper(), year, len(record.get('quotes') or []), json.dumps(record))
+
+    def add(self, key, movie_id, letter, year, quotes, source):
+        position = self.keys.get(key)
+        if position is None:
+            position = self.keys[key] = len(self.sources)
+            self.sources.append(source)
+            self.described.append((letter, year))
+            self.quote_counts.append(quotes)
+        else:
+            self.sources[position] = source
+            self.described[position] = (letter, year)
+            self.quote_counts[position] = quotes
+        if movie_id is not None:
+            self.movie_ids[movie_id] = position
+
+    def finish(self):
+        for position, (letter, year) in enumerate(self.described):
+            self.all.append(position)
+            self.letters.setdefault(letter, []).append(position)
+            self.years.setdefault(year, []).append(position)
+            self.letter_years.setdefault((letter, year), []).append(position)
+        return self
+
+    def __len__(self):
+        return len(self.sources)
+
+    def record_json(self, position):
+        """The JSON text of the record at a position."""
+        source = self.sources[position]
+        if isinstance(source, str):
+            return source
+        segment, offset, length = source
+        return segment.read(offset, length).decode('utf-8')
+
+    def record(self, position):
+        return normalize_record(json.loads(self.record_json(position)))
+
+    def find(self, movie_id):
+        """Position of a movie by its quotes.net id, or None."""
+        return self.movie_ids.get(movie_id)
+
+    def random_quote(self, rng=random):
+        """
+        A quote drawn uniformly from every quote, as (record, quote), or None.
+
+        The movie is picked by bisecting the running total of quote counts,
+        so only that movie's record is decoded.
+        """
+        if self._cumulative is None:
+            self._cumulative = list(itertools.accumulate(self.quote_counts))
+        total = self._cumulative[-1] if self._cumulative else 0
+        if not total:
+            return None
+        pick = rng.randrange(total)
+        position = bisect.bisect_right(self._cumulative, pick)
+        record = self.record(position)
+        before = self._cumulative[position - 1] if position else 0
+        quotes = record['quotes']
+        return record, quotes[min(pick - before, len(quotes) - 1)]
+
+    def stats(self):
+        """Movie and quote totals and movies per letter and year, shaped like Storage.stats."""
+        return {
+            'movies': len(self), 'quotes': sum(self.quote_counts),
+            'movies_with_quotes': sum(1 for quotes in self.quote_counts if quotes), 'refreshed_at': None,
+            'letters': sorted((letter, len(positions)) for letter, positions in self.letters.items()),
+            'years': sorted((year or 0, len(positions)) for year, positions in self.years.items()),
+        }
+
+    def positions(self, letter=None, year=None):
+        """Sorted positions of the movies matching the filters."""
+        if letter is not None and year is not None:
+            return self.letter_years.get((letter.upper(), year), [])
+        if letter is not None:
+            return self.letters.get(letter.upper(), [])
+        if year is not None:
+            return self.years.get(year, [])
+        return self.all
+
+    def page(self, letter=None, year=None, limit=100, after=None):
+        """
+        Serialized records of up to limit matching movies after position after.
+
+        Returns:
+            tuple: (list of (position, JSON text), whether more movies match)
+        """
+        positions = self.positions(letter, year)
+        start = 0 if after is None else bisect.bisect_right(positions, after)
+        page = positions[start:start + limit]
+        return [(position, self.record_json(position)) for position in page], start + limit < len(positions)
+
+    def iter_json(self, letter=None, year=None):
+        """Serialized records of every matching movie, in order."""
+        for position in self.positions(letter, year):
+            yield self.record_json(position)
@@ -0,0 +1,114 @@
+import json
+import logging
+import mmap
+import os
+import struct
+
+from crawler.db import parse_movie_title, parse_movie_url
+from crawler.readers import normalize_record
+
+logger = logging.getLogger(__name__)
+
+# Offset index of an uncompressed JSON Lines segment, kept next to it as
+# <segment>.idx: a header with the size of the segment it describes, then one
+# entry per movie record with its quotes.net movie id (-1 if unknown), the
+# byte offset and length of its line, its number of quotes, its year (0 if
+# unknown) and the first letter of its title as a code point (0 if none)
+INDEX_SUFFIX = '.idx'
+INDEX_MAGIC = b'QNETIDX1'
+HEADER = struct.Struct('<8sQ')
+ENTRY = struct.Struct('<qQIIhI')
+
+
+def index_path(path):
+    return path + INDEX_SUFFIX
+
+
+def is_indexable(path):
+    """Only uncompressed JSON Lines segments can be read at an offset."""
+    return path.endswith('.jsonl')
+
+
+def describe_record(record):
+    """(movie id or -1, quotes, year or 0, letter code point or 0) of a normalized record."""
+    title, year, title_movie_id = parse_movie_title(record['title'])
+    movie_id = parse_movie_url(record.get('url')) or title_movie_id
+    letter = title[:1].upper()
+    return (
+        movie_id if movie_id is not None else -1,
+        len(record['quotes']),
+        year if year is not None and 0 < year < 1 << 15 else 0,
+        ord(letter) if letter else 0,
+    )
+
+
+def scan_segment(path):
+    """Yield the (movie id, offset, length, quotes, year, letter) entries of a segment."""
+    with open(path, 'rb') as f:
+        offset = 0
+        for line in f:
+            data = line.rstrip(b'\r\n')
+            if data.strip():
+                try:
+                    record = normalize_record(json.loads(data))
+                except (ValueError, UnicodeDecodeError):
+                    record = None
+                if record is None or not record['title']:
+                    logger.warning(f"Skipping a record that is not a movie at byte {offset} of {path}")
+                else:
+                    movie_id, quotes, year, letter = describe_record(record)
+                    yield movie_id, offset, len(data), quotes, year, letter
+            offset += len(line)
+
+
+def write_offset_index(path):
+    """Scan a segment, write its offset index next to it and return the entries."""
+    size = os.path.getsize(path)
+    entries = list(scan_segment(path))
+    tmp_path = index_path(path) + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(INDEX_MAGIC, size))
+        for entry in entries:
+            f.write(ENTRY.pack(*entry))
+    os.replace(tmp_path, index_path(path))
+    return entries
+
+
+def read_offset_index(path):
+    """The entries of a segment's offset index, or None if it is missing or stale."""
+    try:
+        with open(index_path(path), 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    if len(data) < HEADER.size:
+        return None
+    magic, size = HEADER.unpack_from(data)
+    if magic != INDEX_MAGIC or size != os.path.getsize(path) or (len(data) - HEADER.size) % ENTRY.size:
+        return None
+    return list(ENTRY.iter_unpack(memoryview(data)[HEADER.size:]))
+
+
+def load_offset_index(path):
+    """Read a segment's offset index, building it first if needed."""
+    entries = read_offset_index(path)
+    if entries is not None:
+        return entries
+    try:
+        return write_offset_index(path)
+    except OSError as e:
+        # A read-only directory: index in memory only
+        logger.warning(f"Cannot write the offset index of {path}: {e}")
+        return list(scan_segment(path))
+
+
+class MappedSegment:
+    """A segment mapped into memory; records are sliced out at their offsets."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(path) else b''
+
+    def read(self, offset, length):
+        return self.data[offset:offset + length]
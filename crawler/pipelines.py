@@ -1,18 +1,283 @@
-import json
 import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from scrapy.exceptions import NotConfigured
+from scrapy.utils.defer import deferred_from_coro
+from twisted.internet import defer
+from twisted.internet.threads import deferToThread
+
+from crawler.metrics import metrics_for
+from crawler.offsets import is_indexable, write_offset_index
+from crawler.segments import (
+    COMPRESSION_SUFFIXES, SegmentWriter, add_segments, load_manifest, manifest_lock, recover_partial_segments,
+    save_manifest
+)
+
+class SegmentedJsonLinesPipeline:
+    """
+    Streams items as JSON Lines into rotated, optionally compressed segments.
+
+    Segments are rotated once OUTPUT_ROTATE_BYTES of JSON have been written,
+    or kept one per movie letter with OUTPUT_ROTATE_BY_LETTER. Finished
+    segments are listed in OUTPUT_DIR/manifest.json, so readers can stream
+    complete files without ever seeing a half-written one.
+    """
+
+    def __init__(self, output_dir, rotate_bytes, rotate_by_letter, compression, fsync_every, metrics=None):
+        self.output_dir = output_dir
+        self.rotate_bytes = rotate_bytes
+        self.rotate_by_letter = rotate_by_letter
+        self.compression = compression or None
+        self.fsync_every = fsync_every
+        self.metrics = metrics
+        self.writers = {}
+        self.sequence = 0
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        return cls(
+            output_dir=settings.get('OUTPUT_DIR'),
+            rotate_bytes=settings.getint('OUTPUT_ROTATE_BYTES', 64 * 1024 * 1024),
+            rotate_by_letter=settings.getbool('OUTPUT_ROTATE_BY_LETTER'),
+            compression=settings.get('OUTPUT_COMPRESSION'),
+            fsync_every=settings.getint('OUTPUT_FSYNC_EVERY', 100),
+            metrics=metrics_for(crawler),
+        )
 
-class JsonWriterPipeline:
     def open_spider(self, spider):
-        # Create output file in the crawler directory
-        output_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'movies.json')
-        self.file = open(output_path, 'w')
-        spider.logger.info(f"Writing output to {output_path}")
+        os.makedirs(self.output_dir, exist_ok=True)
+        with manifest_lock(self.output_dir):
+            self.manifest = load_manifest(self.output_dir)
+            recovered = recover_partial_segments(self.output_dir)
+            if recovered:
+                self.manifest['segments'].extend(recovered)
+                save_manifest(self.output_dir, self.manifest)
+        # The pid keeps segment names apart when several crawls share the directory
+        self.run_id = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{os.getpid()}"
+        spider.logger.info(f"Writing output segments to {self.output_dir}")
 
     def close_spider(self, spider):
-        self.file.close()
-        spider.logger.info("Closed output file")
+        for key in list(self.writers):
+            self._finish(key)
+        spider.logger.info(f"Closed output segments ({len(self.manifest['segments'])} in manifest)")
 
     def process_item(self, item, spider):
-        line = json.dumps(dict(item)) + "\n"
-        self.file.write(line)
-        return item
\ No newline at end of file
+        start = time.perf_counter()
+        key = self._segment_key(item)
+        writer = self.writers.get(key)
+        if writer is None:
+            writer = self.writers[key] = self._open(key)
+        writer.write(dict(item))
+        if writer.bytes >= self.rotate_bytes:
+            self._finish(key)
+        if self.metrics:
+            self.metrics.observe('crawler_pipeline_write_seconds', time.perf_counter() - start, pipeline='segments')
+        return item
+
+    def _segment_key(self, item):
+        if not self.rotate_by_letter:
+            return ''
+        slug = item.get('url', '').split('/movies/')[-1]
+        first = slug[:1].upper()
+        return first if first.isalpha() else '0'
+
+    def _open(self, key):
+        self.sequence += 1
+        letter = f"-{key}" if key else ''
+        suffix = COMPRESSION_SUFFIXES[self.compression]
+        filename = f"movies-{self.run_id}-{self.sequence:05d}{letter}.jsonl{suffix}"
+        return SegmentWriter(self.output_dir, filename, self.compression, self.fsync_every)
+
+    def _finish(self, key):
+        writer = self.writers.pop(key)
+        entry = writer.close()
+        if key:
+            entry['letter'] = key
+        if is_indexable(writer.path):
+            # Written before the segment is listed, so readers find it in place
+            write_offset_index(writer.path)
+        self.manifest = add_segments(self.output_dir, [entry])
+
+
+class PostgresPipeline:
+    """
+    Writes movies and quotes straight into the quotesnet schema.
+
+    Items are handed to a background writer thread through a queue, so the
+    reactor never waits on the database. The writer flushes a batch with COPY
+    into staging tables (crawler.db.load_movies) whenever POSTGRES_FLUSH_SIZE
+    movies are buffered or POSTGRES_FLUSH_INTERVAL seconds have passed. The
+    queue holds at most POSTGRES_QUEUE_SIZE items; once it is full, items
+    wait on one shared Deferred that the writer fires when the queue has
+    drained to half, which holds the spider back to the database's pace
+    without tying up the reactor's threads. A batch that fails is rolled back and counted in
+    postgres/failed_movies. If the connection cannot be rolled back or
+    reopened, the spider is closed with reason 'postgres_failed'.
+    Disabled unless POSTGRES_DSN is set.
+    """
+
+    _STOP = object()
+
+    def __init__(self, dsn, flush_size, flush_interval, queue_size=1000, stats=None, metrics=None, crawler=None):
+        self.dsn = dsn
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.stats = stats
+        self.metrics = metrics
+        self.crawler = crawler
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.failed = None
+        # Fired (on the reactor thread) once the writer has made room in a full queue
+        self.room = None
+        self.blocked = threading.Event()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.get('POSTGRES_DSN'):
+            raise NotConfigured("POSTGRES_DSN is not set")
+        return cls(
+            dsn=settings.get('POSTGRES_DSN'),
+            flush_size=settings.getint('POSTGRES_FLUSH_SIZE', 200),
+            flush_interval=settings.getfloat('POSTGRES_FLUSH_INTERVAL', 5.0),
+            queue_size=settings.getint('POSTGRES_QUEUE_SIZE', 1000),
+            stats=crawler.stats,
+            metrics=metrics_for(crawler),
+            crawler=crawler,
+        )
+
+    def open_spider(self, spider):
+        import psycopg2
+
+        from crawler.db import create_schema_and_tables
+
+        self.spider = spider
+        self.logger = spider.logger
+        self.conn = psycopg2.connect(self.dsn)
+        create_schema_and_tables(self.conn)
+        self.thread = threading.Thread(target=self._writer, name='postgres-writer', daemon=True)
+        self.thread.start()
+        spider.logger.info("Writing items to PostgreSQL")
+
+    def close_spider(self, spider):
+        # Drain the queue in the writer thread without blocking the reactor
+        return deferToThread(self._stop)
+
+    def _stop(self):
+        self.queue.put(self._STOP)
+        self.thread.join()
+
+    def process_item(self, item, spider):
+        if self.failed is not None:
+            if self.stats:
+                self.stats.inc_value('postgres/failed_movies')
+            return item
+        return self._put(dict(item), item)
+
+    def _put(self, record, item):
+        try:
+            self.queue.put_nowait(record)
+            return item
+        except queue.Full:
+            pass
+        if self.room is None:
+            self.room = defer.Deferred()
+            self.blocked.set()
+        waiter = defer.Deferred()
+        self.room.addCallback(lambda result: waiter.callback(None))
+        # Room may be taken by other waiting items first, then this one waits again
+        return waiter.addCallback(lambda _: self._put(record, item))
+
+    def _room_made(self):
+        room, self.room = self.room, None
+        if room is not None:
+            room.callback(None)
+
+    def _writer(self):
+        from twisted.internet import reactor
+
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                item = self.queue.get(timeout=max(deadline - time.monotonic(), 0.01))
+            except queue.Empty:
+                item = None
+            if self.blocked.is_set() and self.queue.qsize() <= self.queue.maxsize // 2:
+                self.blocked.clear()
+                reactor.callFromThread(self._room_made)
+            if item is self._STOP:
+                self._flush(batch)
+                break
+            if item is not None:
+                batch.append(item)
+            if len(batch) >= self.flush_size or time.monotonic() >= deadline:
+                self._flush(batch)
+                batch = []
+                deadline = time.monotonic() + self.flush_interval
+        if self.conn is not None:
+            self.conn.close()
+        self.logger.info("Closed PostgreSQL connection")
+
+    def _flush(self, batch):
+        if not batch:
+            return
+        if self.failed is not None:
+            if self.stats:
+                self.stats.inc_value('postgres/failed_movies', len(batch))
+            return
+        from crawler.db import load_movies
+
+        start = time.perf_counter()
+        try:
+            movies, quotes = load_movies(self.conn, batch)
+            self.conn.commit()
+        except Exception as e:
+            self.logger.error(f"Error writing {len(batch)} movies to PostgreSQL: {e}")
+            if self.stats:
+                self.stats.inc_value('postgres/failed_movies', len(batch))
+            self._recover()
+            return
+        elapsed = time.perf_counter() - start
+        self.logger.info(f"Flushed {len(batch)} movies to PostgreSQL ({movies} new movies, {quotes} quotes) "
+                         f"in {elapsed:.2f}s")
+        if self.metrics:
+            self.metrics.observe('crawler_pipeline_write_seconds', elapsed, pipeline='postgres')
+        if self.stats:
+            self.stats.inc_value('postgres/movies', movies)
+            self.stats.inc_value('postgres/quotes', quotes)
+
+    def _recover(self):
+        """Roll the failed batch back, reconnecting if the connection is gone; give up if that fails too."""
+        import psycopg2
+        from twisted.internet import reactor
+
+        try:
+            self.conn.rollback()
+            return
+        except Exception as e:
+            self.logger.warning(f"PostgreSQL rollback failed, reconnecting: {e}")
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+        try:
+            self.conn = psycopg2.connect(self.dsn)
+            return
+        except Exception as e:
+            self.conn = None
+            self.failed = e
+        self.logger.error(f"Lost the PostgreSQL connection, closing the spider: {self.failed}")
+        # Further items are counted as failed until the spider closes
+        reactor.callFromThread(self._close_spider, 'postgres_failed')
+
+    def _close_spider(self, reason):
+        engine = self.crawler.engine
+        if hasattr(engine, 'close_spider_async'):  # Scrapy 2.13+
+            deferred_from_coro(engine.close_spider_async(reason=reason))
+        else:
+            engine.close_spider(self.spider, reason)
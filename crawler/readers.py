@@ -0,0 +1,238 @@
+import glob
+import json
+import logging
+import os
+
+from crawler.segments import (
+    MANIFEST_FILE, PART_SUFFIX, iter_segment, load_manifest, open_segment_reader, segment_paths
+)
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = ' \t\n\r'
+
+# Largest record a lenient reader buffers before it gives up on it as corrupt
+MAX_RECORD_CHARS = 16 << 20
+
+# Result files the ETL and the API pick up in a directory; plain title lists
+# (movies-A.list) hold no quotes and are only read when named explicitly
+RESULT_PATTERNS = ('*.json', '*.jsonl', '*.jsonl.gz', '*.jsonl.zst')
+
+
+def iter_json_array(path, chunk_size=1 << 20, strict=True):
+    """
+    Yield the elements of a JSON array file one at a time.
+
+    The file is read in chunks of ``chunk_size`` characters and each element
+    is decoded as soon as it is complete, so memory stays proportional to
+    the largest element rather than the file. Several arrays written back to
+    back (``[...][...]``, as appending runs used to produce) are read as one.
+
+    When ``strict`` is false, a truncated tail ends the file quietly, a
+    missing comma or bracket between elements is tolerated and a corrupt
+    element is skipped up to the next line starting with ``{``; each is
+    logged as a warning.
+
+    Raises:
+        json.JSONDecodeError: on malformed or truncated input, if strict
+    """
+    decoder = json.JSONDecoder()
+    with open_segment_reader(path) as f:
+        buffer = ''
+        pos = 0
+        eof = False
+        expect = '['  # '[' before an array, 'value' after '[' or ',', 'separator' after a value
+
+        def fill():
+            nonlocal buffer, pos, eof
+            chunk = f.read(chunk_size)
+            if not chunk:
+                eof = True
+            buffer = buffer[pos:] + chunk
+            pos = 0
+
+        def skip_record(message):
+            """Move past a corrupt element; False when nothing follows it."""
+            nonlocal pos, expect
+            while True:
+                start = buffer.find('\n{', pos)
+                if start >= 0:
+                    logger.warning(f"{message} in {path}, skipping to the next record")
+                    pos = start + 1
+                    expect = 'value'
+                    return True
+                if eof:
+                    logger.warning(f"{message} at the end of {path}, ignoring the rest of the file")
+                    return False
+                pos = max(pos, len(buffer) - 1)
+                fill()
+
+        while True:
+            while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+                pos += 1
+            if pos >= len(buffer):
+                if eof:
+                    break
+                fill()
+                continue
+
+            char = buffer[pos]
+            if expect == '[':
+                if char == '[':
+                    pos += 1
+                    expect = 'value'
+                elif strict:
+                    raise json.JSONDecodeError("Expecting '['", buffer, pos)
+                elif char == '{':
+                    logger.warning(f"Missing '[' in {path}")
+                    expect = 'value'
+                elif not skip_record("Unexpected data between arrays"):
+                    return
+            elif char == ']' and expect in ('value', 'separator'):
+                pos += 1
+                expect = '['
+            elif expect == 'separator':
+                if char == ',':
+                    pos += 1
+                    expect = 'value'
+                elif strict:
+                    raise json.JSONDecodeError("Expecting ',' delimiter", buffer, pos)
+                elif char in '{[':
+                    # "}{" or "}[": an element or array written after a cut-off one
+                    logger.warning(f"Missing ',' or ']' in {path}")
+                    expect = 'value' if char == '{' else '['
+                elif not skip_record("Unexpected data after a record"):
+                    return
+            else:
+                try:
+                    value, end = decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    if not eof and (strict or len(buffer) - pos < MAX_RECORD_CHARS):
+                        fill()
+                        continue
+                    if strict:
+                        raise
+                    if not skip_record("Corrupt or truncated record"):
+                        return
+                    continue
+                if end == len(buffer) and not eof:
+                    # A value ending exactly at the chunk edge may be cut short
+                    fill()
+                    continue
+                pos = end
+                expect = 'separator'
+                yield value
+
+        if expect != '[':
+            if strict:
+                raise json.JSONDecodeError("Unterminated array", buffer, pos)
+            logger.warning(f"Unterminated array at the end of {path}")
+
+
+def detect_format(path):
+    """
+    Guess the format of a results file from its first non-blank character.
+
+    Returns:
+        str: 'json' for JSON arrays (possibly several back to back), 'jsonl'
+             for JSON Lines (crawler output segments), 'titles' for a plain
+             list of movie titles, or None for an empty file
+    """
+    with open_segment_reader(path) as f:
+        while True:
+            chunk = f.read(4096)
+            if not chunk:
+                return None
+            stripped = chunk.lstrip(_WHITESPACE + '\ufeff')
+            if stripped:
+                break
+    if stripped[0] == '[':
+        return 'json'
+    if stripped[0] == '{':
+        return 'jsonl'
+    return 'titles'
+
+
+def iter_titles(path):
+    """Yield the lines of a plain title list."""
+    with open_segment_reader(path) as f:
+        for line in f:
+            title = line.strip()
+            if title:
+                yield title
+
+
+def normalize_record(record):
+    """
+    Bring a movie record to the crawler's shape, or return None if it has none.
+
+    Titles and URLs are stripped strings (url may be None), and quotes are a
+    list of dicts with a non-empty 'text'; quotes given as bare strings, as
+    in the benchmark fixtures, are wrapped.
+    """
+    if isinstance(record, str):
+        record = {'title': record}
+    if not isinstance(record, dict):
+        return None
+    quotes = []
+    for quote in record.get('quotes') or []:
+        if isinstance(quote, str):
+            quote = {'text': quote}
+        if isinstance(quote, dict) and isinstance(quote.get('text'), str) and quote['text'].strip():
+            quotes.append(quote)
+    title = record.get('title')
+    url = record.get('url')
+    return {
+        **record,
+        'title': title.strip() if isinstance(title, str) else None,
+        'url': url.strip() if isinstance(url, str) and url.strip() else None,
+        'quotes': quotes,
+    }
+
+
+def iter_movie_records(path, strict=False):
+    """
+    Yield the normalized movie records of one results file, in any format.
+
+    JSON arrays (including files produced by append mode), JSON Lines
+    segments (compressed or not, finished or ``.part``) and plain title
+    lists are all read lazily with constant memory. Unless strict, broken
+    input is skipped or ends the file with a warning instead of raising.
+    """
+    file_format = detect_format(path)
+    if file_format == 'json':
+        records = iter_json_array(path, strict=strict)
+    elif file_format == 'jsonl':
+        records = iter_segment(path)
+    elif file_format == 'titles':
+        records = iter_titles(path)
+    else:
+        return
+    for record in records:
+        movie = normalize_record(record)
+        if movie is None:
+            logger.warning(f"Skipping a record that is not a movie in {path}")
+            continue
+        yield movie
+
+
+def result_files(directory):
+    """
+    Results files to read from a directory, in order.
+
+    A crawler output directory with a segment manifest yields its finished
+    segments in manifest order; any other directory yields the files that
+    match RESULT_PATTERNS, sorted by name, leaving out an empty segment
+    manifest.
+    """
+    if load_manifest(directory)['segments']:
+        return [path for path in segment_paths(directory) if os.path.exists(path)]
+    paths = {path for pattern in RESULT_PATTERNS for path in glob.glob(os.path.join(directory, pattern))}
+    return sorted(path for path in paths
+                  if not path.endswith(PART_SUFFIX) and os.path.basename(path) != MANIFEST_FILE)
+
+
+def iter_directory_records(directory, strict=False):
+    """Stream the normalized movie records of every results file in a directory."""
+    for path in result_files(directory):
+        yield from iter_movie_records(path, strict=strict)
@@ -4,81 +4,250 @@ import os
 import sys
 import argparse
 import json
+import multiprocessing
 from datetime import datetime
 
-# Add the current directory to the Python path
+# Add the current directory and the project root to the Python path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('SCRAPY_SETTINGS_MODULE', 'crawler.settings')
 from spiders.movie_quotes_spider import MovieQuotesSpider
+from catalogue import merge_shard_outputs, parse_letters, shard_dir
 
-def run_spider(batch_size=20, start_index=0, max_movies=0, append=True):
+CRAWLER_DIR = os.path.dirname(os.path.abspath(__file__))
+SHARDS_DIR = os.path.join(CRAWLER_DIR, "shards")
+RESULTS_DIR = os.path.join(CRAWLER_DIR, "results")
+
+def run_spider(batch_size=20, start_index=0, max_movies=0, append=True, state_backend='log',
+               letters='Z', shard_index=0, shard_count=1, shard_by='letter', mode='full',
+               continuous=False, batch_delay=0, index_cache_ttl=86400, settings_overrides=None):
     """
     Run the movie quotes spider with batch processing.
-    
+
     Args:
-        batch_size (int): Number of movies to process in this batch
-        start_index (int): Starting index in the movie list
+        batch_size (int): Number of movies to process in this batch (0 for no limit)
+        start_index (int): Starting index in the movie list (None resumes a continuous run from its checkpoint)
         max_movies (int): Maximum number of movies to process (0 for no limit)
-        append (bool): Whether to append to existing output file (default: True)
+        append (bool): Ignored; output segments are always added to the manifest
+        state_backend (str): Crawl state backend, 'log' or 'sqlite' (default: 'log')
+        letters (str): Letter index pages to crawl, e.g. "Z", "Q,UV,X" or "all"
+        shard_index (int): Shard handled by this process
+        shard_count (int): Total number of shards (1 for an unsharded crawl)
+        shard_by (str): Split the frontier by 'letter' or by 'hash' of the movie URL
+        mode (str): 'full', 'incremental' (conditional re-crawl) or 'replay' (offline, from the HTTP cache)
+        continuous (bool): Feed every batch into this one crawler instead of stopping after one
+        batch_delay (float): Pause between batches in continuous mode, in seconds
+        index_cache_ttl (float): Seconds a cached index page link list stays valid (0 to refetch)
+        settings_overrides (dict): Extra settings applied on top of the project settings
     """
     # Create output directory if it doesn't exist
-    os.makedirs(os.path.dirname(os.path.abspath(__file__)), exist_ok=True)
-    
-    # Create jobs directory for resuming
-    jobs_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "jobs")
-    os.makedirs(jobs_dir, exist_ok=True)
-    
+    os.makedirs(CRAWLER_DIR, exist_ok=True)
+
     # Set up the settings
     settings = get_project_settings()
-    
-    # Set up the output file - always use movies.json
-    output_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "movies.json")
-    
-    # Configure the settings to output to a JSON file
-    settings.set('FEED_URI', f'file://{output_file}')
-    settings.set('FEED_FORMAT', 'json')
-    settings.set('FEED_EXPORT_ENCODING', 'utf-8')
-    
-    # Always set append mode
-    settings.set('FEED_EXPORT_FLAGS', ['a'])
-    
-    # Configure job directory for resuming
-    settings.set('JOBDIR', jobs_dir)
-    
-    print(f"Starting crawler with batch_size={batch_size}, start_index={start_index}, max_movies={max_movies}")
-    print(f"Output will be saved to: {output_file}")
-    
+    for name, value in (settings_overrides or {}).items():
+        settings.set(name, value, priority='cmdline')
+    if mode == 'replay':
+        # Never touch the network: serve cached pages, drop uncached requests
+        settings.set('HTTPCACHE_REPLAY', True, priority='cmdline')
+        settings.set('HTTPCACHE_IGNORE_MISSING', True, priority='cmdline')
+
+    if shard_count > 1:
+        # Each shard gets its own output, crawl state and job directory
+        state_dir = shard_dir(SHARDS_DIR, shard_index)
+        output_dir = os.path.join(state_dir, "output")
+    else:
+        state_dir = CRAWLER_DIR
+        output_dir = settings.get('OUTPUT_DIR')
+    jobs_dir = (settings_overrides or {}).get('JOBDIR') or os.path.join(state_dir, "jobs")
+
+    # Items are streamed into rotated JSON Lines segments listed in output_dir/manifest.json
+    settings.set('OUTPUT_DIR', output_dir, priority='cmdline')
+
+    # Configure job directory for resuming (overrides the spider's own JOBDIR)
+    os.makedirs(jobs_dir, exist_ok=True)
+    settings.set('JOBDIR', jobs_dir, priority='cmdline')
+
+    print(f"Starting crawler with batch_size={batch_size}, start_index={start_index}, max_movies={max_movies}"
+          + (f", continuous with {batch_delay}s between batches" if continuous else ""))
+    print(f"Output will be saved to: {output_dir}")
+
+    spider_kwargs = {}
+    if start_index is not None or not continuous:
+        spider_kwargs['start_index'] = start_index or 0
+
     # Run the crawler
     process = CrawlerProcess(settings)
-    process.crawl(
-        MovieQuotesSpider,
+    crawler = process.create_crawler(MovieQuotesSpider)
+    crawl = process.crawl(
+        crawler,
         batch_size=batch_size,
-        start_index=start_index,
-        max_movies=max_movies
+        max_movies=max_movies,
+        state_backend=state_backend,
+        letters=letters,
+        shard_index=shard_index,
+        shard_count=shard_count,
+        shard_by=shard_by,
+        state_dir=state_dir,
+        mode=mode,
+        continuous=continuous,
+        batch_delay=batch_delay,
+        index_cache_ttl=index_cache_ttl,
+        **spider_kwargs
     )
+    failures = []
+    crawl.addErrback(failures.append)
     process.start()
-    
-    print(f"Crawler finished. Output saved to: {output_file}")
-    
-    # Print next batch information
-    next_start = start_index + batch_size
-    print(f"\nTo process the next batch, run with: --start-index {next_start}")
+
+    # A crawl that errored or closed for any other reason than finishing exits non-zero,
+    # so supervisors (run_sharded, the API's crawl jobs) see it failed
+    finish_reason = crawler.stats.get_value('finish_reason')
+    if failures or finish_reason != 'finished':
+        error = failures[0].getErrorMessage() if failures else f"finish reason: {finish_reason}"
+        print(f"Crawler failed ({error}). Partial output saved to: {output_dir}")
+        sys.exit(1)
+
+    print(f"Crawler finished. Output saved to: {output_dir}")
+
+    # Print next batch information (where the scheduled batch actually ended)
+    if batch_size > 0 and not continuous and crawler.spider is not None:
+        next_start = crawler.spider.next_index
+        print(f"\nTo process the next batch, run with: --start-index {next_start}")
+    return output_dir
+
+def run_sharded(workers, letters='all', shard_by='letter', batch_size=0, start_index=0,
+                max_movies=0, state_backend='log', mode='full', continuous=False, batch_delay=0,
+                index_cache_ttl=86400, settings_overrides=None):
+    """
+    Crawl a set of letter index pages with one crawler process per shard, then merge.
+
+    Every shard writes output segments to crawler/shards/shard-<n>/output/ and keeps its own
+    crawl state there. The politeness controller's maximum rate is divided across
+    the workers so the site sees the same aggregate request rate. The other arguments
+    are passed to every shard's run_spider; a JOBDIR override gets a shard-<n>
+    directory per shard inside it.
+
+    Returns:
+        str: Path of the merged JSON array in crawler/results/
+    """
+    letter_list = parse_letters(letters)
+    settings = get_project_settings()
+    for name, value in (settings_overrides or {}).items():
+        settings.set(name, value, priority='cmdline')
+    overrides = dict(settings_overrides or {},
+                     POLITENESS_MAX_RATE=settings.getfloat('POLITENESS_MAX_RATE') / workers)
+
+    # Twisted's reactor cannot be restarted, so every shard runs in a fresh process
+    context = multiprocessing.get_context('spawn')
+    processes = []
+    metrics_port = settings.getint('METRICS_PORT')
+    for shard_index in range(workers):
+        # One metrics endpoint per shard process
+        shard_overrides = dict(overrides, METRICS_PORT=metrics_port + shard_index if metrics_port else 0)
+        if overrides.get('JOBDIR'):
+            shard_overrides['JOBDIR'] = shard_dir(overrides['JOBDIR'], shard_index)
+        process = context.Process(
+            target=run_spider,
+            kwargs={
+                'batch_size': batch_size,
+                'start_index': start_index,
+                'max_movies': max_movies,
+                'state_backend': state_backend,
+                'letters': letter_list,
+                'shard_index': shard_index,
+                'shard_count': workers,
+                'shard_by': shard_by,
+                'mode': mode,
+                'continuous': continuous,
+                'batch_delay': batch_delay,
+                'index_cache_ttl': index_cache_ttl,
+                'settings_overrides': shard_overrides,
+            }
+        )
+        process.start()
+        processes.append(process)
+
+    failed = 0
+    for shard_index, process in enumerate(processes):
+        process.join()
+        if process.exitcode != 0:
+            failed += 1
+            print(f"Shard {shard_index} exited with code {process.exitcode}")
+
+    # Merge the shard outputs into one results file
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    suffix = 'all' if letter_list == parse_letters('all') else ''.join(letter_list)
+    merged_file = os.path.join(RESULTS_DIR, f"movies-{suffix}.json")
+    shard_outputs = [os.path.join(shard_dir(SHARDS_DIR, i), "output") for i in range(workers)]
+    count = merge_shard_outputs(shard_outputs, merged_file)
+    print(f"Merged {count} movies from {workers} shards into {merged_file}")
+    if failed:
+        print(f"Warning: {failed} shard(s) failed; re-run to resume them from their saved state")
+    return merged_file
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Run the movie quotes crawler with batch processing')
-    parser.add_argument('--batch-size', type=int, default=20,
-                        help='Number of movies to process in this batch (default: 20)')
-    parser.add_argument('--start-index', type=int, default=0,
-                        help='Starting index in the movie list (default: 0)')
+    parser.add_argument('--batch-size', type=int, default=None,
+                        help='Number of movies to process in this batch, 0 for no limit '
+                             '(default: 20, or 0 with --workers)')
+    parser.add_argument('--start-index', type=int, default=None,
+                        help='Starting index in the movie list (default: 0, or the checkpoint with --continuous)')
     parser.add_argument('--max-movies', type=int, default=0,
                         help='Maximum number of movies to process, 0 for no limit (default: 0)')
     # --append flag is kept for backward compatibility but is now ignored
     parser.add_argument('--append', action='store_true',
-                        help='[Deprecated] Always appends to movies.json')
-    
+                        help='[Deprecated] Output segments are always added to crawler/output')
+    parser.add_argument('--state-backend', choices=['log', 'sqlite'], default='log',
+                        help='Backend used to track processed movies (default: log)')
+    parser.add_argument('--letters', default='Z',
+                        help='Letter index pages to crawl, e.g. "Z", "Q,UV,X" or "all" (default: Z)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of crawler processes to shard the catalogue across (default: 1)')
+    parser.add_argument('--shard-by', choices=['letter', 'hash'], default='letter',
+                        help='Split the catalogue between workers by letter or by movie URL hash (default: letter)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Re-check processed movies with conditional requests and only emit changed ones')
+    parser.add_argument('--replay', action='store_true',
+                        help='Re-parse every cached page offline without hitting the network')
+    parser.add_argument('--continuous', action='store_true',
+                        help='Run every batch in this process, checkpointing after each one')
+    parser.add_argument('--batch-delay', type=float, default=0,
+                        help='Seconds to pause between batches with --continuous (default: 0)')
+    parser.add_argument('--refresh-index', action='store_true',
+                        help='Re-download the letter index pages instead of using the cached link lists')
+    parser.add_argument('--set', action='append', default=[], metavar='NAME=VALUE',
+                        help='Override a Scrapy setting, e.g. --set LOGSTATS_INTERVAL=10 (JOBDIR moves the job directory)')
+
     args = parser.parse_args()
-    
-    run_spider(
-        batch_size=args.batch_size,
-        start_index=args.start_index,
-        max_movies=args.max_movies
-    )
\ No newline at end of file
+    index_cache_ttl = 0 if args.refresh_index else 86400
+    mode = 'replay' if args.replay else 'incremental' if args.incremental else 'full'
+    settings_overrides = dict(pair.split('=', 1) for pair in args.set)
+
+    if args.workers > 1:
+        run_sharded(
+            workers=args.workers,
+            letters=args.letters,
+            shard_by=args.shard_by,
+            batch_size=args.batch_size if args.batch_size is not None else 0,
+            start_index=args.start_index,
+            max_movies=args.max_movies,
+            state_backend=args.state_backend,
+            mode=mode,
+            continuous=args.continuous,
+            batch_delay=args.batch_delay,
+            index_cache_ttl=index_cache_ttl,
+            settings_overrides=settings_overrides
+        )
+    else:
+        run_spider(
+            batch_size=args.batch_size if args.batch_size is not None else 20,
+            start_index=args.start_index,
+            max_movies=args.max_movies,
+            state_backend=args.state_backend,
+            letters=args.letters,
+            mode=mode,
+            continuous=args.continuous,
+            batch_delay=args.batch_delay,
+            index_cache_ttl=index_cache_ttl,
+            settings_overrides=settings_overrides
+        )
@@ -0,0 +1,189 @@
+import heapq
+import math
+import re
+from collections import defaultdict, namedtuple
+
+from crawler.db import parse_movie_title, parse_movie_url
+
+# Words are runs of letters and digits; an apostrophe inside a word is dropped
+# ("don't" -> "dont") so queries and quotes tokenize the same way.
+_TOKEN = re.compile(r"\w+(?:'\w+)*")
+_PHRASE = re.compile(r'"([^"]*)"')
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+# Ranks are rounded so a cursor compares equal to the rank it was taken from
+RANK_DIGITS = 6
+
+Hit = namedtuple('Hit', ['quote_id', 'movie_id', 'title', 'year', 'url', 'text', 'rank'])
+
+
+def tokenize(text):
+    """Lower-cased word tokens of a text."""
+    return [token.replace("'", '') for token in _TOKEN.findall(text.lower())]
+
+
+def parse_query(query):
+    """
+    Split a search query into single terms and "quoted phrases".
+
+    Returns:
+        tuple: (list of terms, list of phrases, each a list of terms)
+    """
+    phrases = [tokenize(phrase) for phrase in _PHRASE.findall(query)]
+    terms = tokenize(_PHRASE.sub(' ', query))
+    return terms, [phrase for phrase in phrases if phrase]
+
+
+def encode_cursor(rank, quote_id):
+    """Opaque keyset cursor for the hit after which the next page starts."""
+    return f"{rank!r}:{quote_id}"
+
+
+def decode_cursor(cursor):
+    """
+    Return the (rank, quote_id) a cursor was made from.
+
+    Raises:
+        ValueError: for a cursor not made by encode_cursor
+    """
+    rank, _, quote_id = (cursor or '').partition(':')
+    return float(rank), int(quote_id)
+
+
+class QuoteIndex:
+    """
+    In-process inverted index over the quotes of crawled movie records.
+
+    Each quote is a document numbered in load order. Postings hold the
+    positions of every term in every document, so "phrases" are matched
+    exactly. Hits must contain every term and phrase of the query and are
+    ranked with BM25, best first, ties broken by quote id.
+    """
+
+    def __init__(self):
+        self.postings = defaultdict(dict)  # term -> {quote id: [positions]}
+        self.lengths = []
+        self.quotes = []  # (movie index, text)
+        self.movies = []  # (movie_id, title, year, url)
+        self.total_length = 0
+        self.clusters = None  # near-duplicate cluster of every quote, computed on first use
+
+    @classmethod
+    def from_records(cls, records):
+        index = cls()
+        for record in records:
+            index.add_movie(record)
+        return index
+
+    def __len__(self):
+        return len(self.quotes)
+
+    def add_movie(self, record):
+        raw_title = record.get('title')
+        if not raw_title:
+            return
+        title, year, title_movie_id = parse_movie_title(raw_title)
+        url = record.get('url')
+        movie = len(self.movies)
+        self.movies.append((parse_movie_url(url) or title_movie_id, title, year, url))
+        for quote in record.get('quotes') or []:
+            text = quote.get('text')
+            if text:
+                self.add_quote(movie, text)
+
+    def add_quote(self, movie, text):
+        quote_id = len(self.quotes)
+        tokens = tokenize(text)
+        for position, token in enumerate(tokens):
+            self.postings[token].setdefault(quote_id, []).append(position)
+        self.quotes.append((movie, text))
+        self.lengths.append(len(tokens))
+        self.total_length += len(tokens)
+
+    def _phrase_matches(self, phrase):
+        """Quote ids containing the phrase, with how often it occurs in each."""
+        postings = [self.postings.get(term) for term in phrase]
+        if not all(postings):
+            return {}
+        candidates = set.intersection(*(set(p) for p in sorted(postings, key=len)))
+        matches = {}
+        for quote_id in candidates:
+            starts = set(postings[0][quote_id])
+            for offset, p in enumerate(postings[1:], 1):
+                starts &= {position - offset for position in p[quote_id]}
+                if not starts:
+                    break
+            if starts:
+                matches[quote_id] = len(starts)
+        return matches
+
+    def cluster_ids(self):
+        """Near-duplicate cluster id of every quote (crawler.dedup)."""
+        if self.clusters is None or len(self.clusters) != len(self.quotes):
+            from crawler.dedup import cluster_quotes
+
+            self.clusters = cluster_quotes(text for _, text in self.quotes)
+        return self.clusters
+
+    def search(self, query, movie_id=None, year=None, limit=20, cursor=None, collapse=False):
+        """
+        Find quotes matching every term and phrase of a query.
+
+        Args:
+            movie_id: only quotes of this quotes.net movie id
+            year: only quotes of movies from this year
+            cursor: (rank, quote id) of the last hit of the previous page
+            collapse: only the best hit of each near-duplicate cluster
+
+        Returns:
+            list: up to limit Hits, best first
+        """
+        terms, phrases = parse_query(query)
+        if not terms and not phrases or not self.quotes:
+            return []
+
+        # Each required term or phrase maps quote ids to their frequency in it
+        required = [{quote_id: len(positions) for quote_id, positions in self.postings.get(term, {}).items()}
+                    for term in terms]
+        required += [self._phrase_matches(phrase) for phrase in phrases]
+        if not all(required):
+            return []
+        required.sort(key=len)
+        candidates = set(required[0]).intersection(*required[1:])
+
+        count = len(self.quotes)
+        average_length = self.total_length / count
+        idf = [math.log(1 + (count - len(matches) + 0.5) / (len(matches) + 0.5)) for matches in required]
+
+        scored = []
+        for quote_id in candidates:
+            movie, _ = self.quotes[quote_id]
+            if movie_id is not None and self.movies[movie][0] != movie_id:
+                continue
+            if year is not None and self.movies[movie][2] != year:
+                continue
+            norm = K1 * (1 - B + B * self.lengths[quote_id] / average_length)
+            rank = round(sum(weight * matches[quote_id] * (K1 + 1) / (matches[quote_id] + norm)
+                             for weight, matches in zip(idf, required)), RANK_DIGITS)
+            scored.append((-rank, quote_id))
+
+        if collapse:
+            clusters = self.cluster_ids()
+            best = {}
+            for hit in scored:
+                cluster = clusters[hit[1]]
+                if cluster not in best or hit < best[cluster]:
+                    best[cluster] = hit
+            scored = list(best.values())
+        if cursor:
+            after = (-cursor[0], cursor[1])
+            scored = [hit for hit in scored if hit > after]
+
+        hits = []
+        for negative_rank, quote_id in heapq.nsmallest(limit, scored):
+            movie, text = self.quotes[quote_id]
+            hits.append(Hit(quote_id, *self.movies[movie], text, -negative_rank))
+        return hits
@@ -0,0 +1,233 @@
+import gzip
+import io
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: a single crawler process per output directory
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = 'manifest.json'
+MANIFEST_LOCK_FILE = 'manifest.lock'
+PART_SUFFIX = '.part'
+
+COMPRESSION_SUFFIXES = {
+    None: '',
+    'gzip': '.gz',
+    'zstd': '.zst',
+}
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise RuntimeError("zstd compression requires the 'zstandard' package (pip install zstandard)")
+    return zstandard
+
+
+def open_segment_writer(path, compression=None):
+    """Open a binary writer for a segment, compressing on the fly."""
+    if compression == 'gzip':
+        return gzip.open(path, 'wb', compresslevel=6)
+    if compression == 'zstd':
+        return _zstandard().ZstdCompressor(level=3).stream_writer(open(path, 'wb'))
+    if compression is None:
+        return open(path, 'wb')
+    raise ValueError(f"Unknown compression: {compression}")
+
+
+def open_segment_reader(path):
+    """Open a segment for reading as text, detecting compression from the file name."""
+    name = path[:-len(PART_SUFFIX)] if path.endswith(PART_SUFFIX) else path
+    if name.endswith('.gz'):
+        return io.TextIOWrapper(gzip.open(path, 'rb'), encoding='utf-8')
+    if name.endswith('.zst'):
+        reader = _zstandard().ZstdDecompressor().stream_reader(open(path, 'rb'))
+        return io.TextIOWrapper(reader, encoding='utf-8')
+    return open(path, 'r', encoding='utf-8')
+
+
+def iter_segment(path):
+    """Yield the records of one segment, stopping quietly at a truncated tail."""
+    with open_segment_reader(path) as f:
+        try:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"Skipping corrupt record in {path}")
+        except (EOFError, OSError) as e:
+            logger.warning(f"Truncated segment {path}: {e}")
+
+
+def load_manifest(output_dir):
+    """Return the manifest of finished segments ({'generation': n, 'segments': [...]})."""
+    path = os.path.join(output_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {'generation': 0, 'segments': []}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_manifest(output_dir, manifest):
+    """Atomically replace the manifest, bumping its generation."""
+    manifest['generation'] = manifest.get('generation', 0) + 1
+    path = os.path.join(output_dir, MANIFEST_FILE)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+@contextmanager
+def manifest_lock(output_dir):
+    """Hold an exclusive lock on an output directory's manifest across processes."""
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(output_dir, MANIFEST_LOCK_FILE), 'a') as lock:
+        fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+
+
+def add_segments(output_dir, entries):
+    """
+    Append entries to the manifest and return it.
+
+    The manifest is re-read under manifest_lock, so crawler processes
+    sharing an output directory never drop each other's segments.
+    """
+    with manifest_lock(output_dir):
+        manifest = load_manifest(output_dir)
+        manifest['segments'].extend(entries)
+        save_manifest(output_dir, manifest)
+    return manifest
+
+
+def segment_paths(output_dir):
+    """Paths of the finished segments in manifest order."""
+    return [os.path.join(output_dir, segment['file']) for segment in load_manifest(output_dir)['segments']]
+
+
+def iter_records(output_dir):
+    """Stream every record of every finished segment in an output directory."""
+    for path in segment_paths(output_dir):
+        if os.path.exists(path):
+            yield from iter_segment(path)
+
+
+class SegmentWriter:
+    """
+    One JSON Lines segment being written.
+
+    Data goes to ``<file>.part`` and is flushed and fsynced every
+    ``fsync_every`` records. ``close()`` renames the file to its final name,
+    which is what makes a segment visible to readers via the manifest.
+    """
+
+    def __init__(self, output_dir, filename, compression=None, fsync_every=100):
+        self.output_dir = output_dir
+        self.filename = filename
+        self.path = os.path.join(output_dir, filename)
+        self.compression = compression
+        self.fsync_every = fsync_every
+        self.raw_path = self.path + PART_SUFFIX
+        self.stream = open_segment_writer(self.raw_path, compression)
+        # Held until close, so recovery in another process leaves this file alone
+        self.lock = open(self.raw_path, 'rb')
+        if fcntl is not None:
+            fcntl.flock(self.lock.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        self.records = 0
+        self.bytes = 0
+        self.unsynced = 0
+        self.opened_at = time.time()
+
+    def write(self, record):
+        data = (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8')
+        self.stream.write(data)
+        self.records += 1
+        self.bytes += len(data)
+        self.unsynced += 1
+        if self.unsynced >= self.fsync_every:
+            self.sync()
+
+    def sync(self):
+        self.stream.flush()
+        fileobj = getattr(self.stream, 'fileobj', None) or self.stream
+        if hasattr(fileobj, 'fileno'):
+            try:
+                os.fsync(fileobj.fileno())
+            except (OSError, io.UnsupportedOperation):
+                pass
+        self.unsynced = 0
+
+    def close(self):
+        """Finish the segment and return its manifest entry."""
+        self.sync()
+        self.stream.close()
+        os.replace(self.raw_path, self.path)
+        self.lock.close()
+        return {
+            'file': self.filename,
+            'records': self.records,
+            'bytes': self.bytes,
+            'compressed_bytes': os.path.getsize(self.path),
+            'compression': self.compression,
+            'opened_at': self.opened_at,
+            'closed_at': time.time(),
+        }
+
+
+def _is_being_written(path):
+    if fcntl is None:
+        return False
+    with open(path, 'rb') as f:
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return True
+    return False
+
+
+def recover_partial_segments(output_dir):
+    """
+    Finish segments left as .part by a crashed run and return their manifest entries.
+
+    Only the records that can still be decoded are counted; a truncated last
+    record is dropped by readers. Segments another live process is still
+    writing are skipped.
+    """
+    entries = []
+    for name in sorted(os.listdir(output_dir)):
+        if not name.endswith(PART_SUFFIX):
+            continue
+        raw_path = os.path.join(output_dir, name)
+        if _is_being_written(raw_path):
+            continue
+        records = sum(1 for _ in iter_segment(raw_path))
+        final_name = name[:-len(PART_SUFFIX)]
+        os.replace(raw_path, os.path.join(output_dir, final_name))
+        entries.append({
+            'file': final_name,
+            'records': records,
+            'compressed_bytes': os.path.getsize(os.path.join(output_dir, final_name)),
+            'recovered': True,
+            'closed_at': time.time(),
+        })
+        logger.warning(f"Recovered partial segment {final_name} ({records} records)")
+    return entries
@@ -1,3 +1,5 @@
+import os
+
 BOT_NAME = 'movie_quotes_crawler'
 
 SPIDER_MODULES = ['crawler.spiders']
@@ -8,8 +10,35 @@ ROBOTSTXT_OBEY = True
 
 # Configure item pipelines
 ITEM_PIPELINES = {
-   'crawler.pipelines.JsonWriterPipeline': 300,
+   'crawler.pipelines.SegmentedJsonLinesPipeline': 300,
+   'crawler.pipelines.PostgresPipeline': 400,  # only active when POSTGRES_DSN is set
+}
+
+# Streaming JSON Lines output: rotated segments plus a manifest of finished ones
+OUTPUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'output')
+OUTPUT_ROTATE_BYTES = 64 * 1024 * 1024   # start a new segment after this many bytes of JSON
+OUTPUT_ROTATE_BY_LETTER = False          # one segment per movie letter instead
+OUTPUT_COMPRESSION = None                # None, 'gzip' or 'zstd' (needs the zstandard package)
+OUTPUT_FSYNC_EVERY = 100                 # flush and fsync after this many items
+
+# Direct PostgreSQL sink, e.g. "dbname=pg_malone user=postgres password=postgres host=localhost port=15432"
+POSTGRES_DSN = os.environ.get('POSTGRES_DSN', '')
+POSTGRES_FLUSH_SIZE = 200                # movies per COPY batch
+POSTGRES_FLUSH_INTERVAL = 5.0            # seconds before a partial batch is flushed
+POSTGRES_QUEUE_SIZE = 1000               # items waiting for the writer before the spider is held back
+
+# Live crawl metrics: Prometheus endpoint on http://METRICS_HOST:METRICS_PORT/metrics
+# (JSON on /report) and a run_report_<timestamp>.json written when the spider closes
+EXTENSIONS = {
+   'crawler.metrics.CrawlMetrics': 500,
+}
+SPIDER_MIDDLEWARES = {
+   'crawler.metrics.CallbackTimingMiddleware': 1000,  # closest to the spider, times callbacks only
 }
+METRICS_ENABLED = True
+METRICS_HOST = '127.0.0.1'
+METRICS_PORT = 9410                      # 0 disables the HTTP endpoint; shards use METRICS_PORT + shard index
+METRICS_REPORT_DIR = None                # default: the spider's state directory
 
 # Set settings whose default value is deprecated to a future-proof value
 REQUEST_FINGERPRINTER_IMPLEMENTATION = "2.7"
@@ -19,11 +48,39 @@ FEED_EXPORT_ENCODING = "utf-8"
 # Configure maximum concurrent requests
 CONCURRENT_REQUESTS = 16
 
-# Configure a delay for requests for the same website
-DOWNLOAD_DELAY = 0.5
+# Extraction engine for movie pages: 'lxml' (fast) or 'parsel' (reference)
+QUOTES_EXTRACTOR = 'lxml'
+
+# Pacing is handled by AdaptivePolitenessMiddleware, so no fixed delay
+DOWNLOAD_DELAY = 0
+CONCURRENT_REQUESTS_PER_DOMAIN = 8
+
+# Configure downloader middlewares. The politeness controller sits closest to
+# the downloader so cached responses never consume tokens.
+DOWNLOADER_MIDDLEWARES = {
+   'crawler.middlewares.AdaptivePolitenessMiddleware': 950,
+}
+
+# AutoThrottle is replaced by the adaptive politeness controller
+AUTOTHROTTLE_ENABLED = False
+
+# Adaptive politeness controller (token bucket + AIMD backoff)
+POLITENESS_START_RATE = 1.0       # requests/sec to start with
+POLITENESS_MIN_RATE = 0.2
+POLITENESS_MAX_RATE = 8.0
+POLITENESS_RATE_STEP = 0.1        # additive increase per clean response
+POLITENESS_BURST = 2.0            # token bucket size
+POLITENESS_TARGET_LATENCY = 2.0   # slower responses trigger a backoff
+POLITENESS_BAN_THRESHOLD = 3      # consecutive 403/429 responses treated as a ban
+POLITENESS_COOLDOWN = 300         # seconds to pause after a ban
 
-# Enable and configure the AutoThrottle extension
-AUTOTHROTTLE_ENABLED = True
-AUTOTHROTTLE_START_DELAY = 1
-AUTOTHROTTLE_MAX_DELAY = 10
-AUTOTHROTTLE_TARGET_CONCURRENCY = 1.0
\ No newline at end of file
+# On-disk HTTP cache: gzip-compressed bodies plus headers (ETag/Last-Modified),
+# keyed by request fingerprint and revalidated with conditional requests
+HTTPCACHE_ENABLED = True
+HTTPCACHE_POLICY = 'crawler.httpcache.ConditionalCachePolicy'
+HTTPCACHE_STORAGE = 'scrapy.extensions.httpcache.FilesystemCacheStorage'
+HTTPCACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'httpcache')
+HTTPCACHE_GZIP = True
+HTTPCACHE_EXPIRATION_SECS = 0
+HTTPCACHE_INDEX_TTL = 0           # seconds a cached /allmovies page is trusted without revalidation
+HTTPCACHE_REPLAY = False          # serve everything from the cache (offline replay)
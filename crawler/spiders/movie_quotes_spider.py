@@ -1,29 +1,31 @@
 import scrapy
 import sys
+import hashlib
 import os
-import time
-import random
 import json
 import logging
 from datetime import datetime
+from urllib.parse import urlparse
 
 # Add the parent directory to the Python path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from items import MovieItem, QuoteItem
+from items import MovieItem
+from state import open_state_store
+from extractors import get_extractor
+from metrics import metrics_for
+from catalogue import (
+    BASE_URL, index_url, letters_for_shard, load_index_cache, parse_letters, save_index_cache, shard_of
+)
+from scrapy import signals
+from scrapy.exceptions import DontCloseSpider
 
 class MovieQuotesSpider(scrapy.Spider):
     name = "movie_quotes"
     allowed_domains = ["quotes.net"]
-    start_urls = [
-        "https://www.quotes.net/allmovies/Z"
-        ]
     
-    # Custom settings for this spider
+    # Custom settings for this spider (pacing is left to AdaptivePolitenessMiddleware)
     custom_settings = {
         'USER_AGENT': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-        'DOWNLOAD_DELAY': 2,  # 2 seconds delay between requests
-        'RANDOMIZE_DOWNLOAD_DELAY': True,
-        'CONCURRENT_REQUESTS': 1,  # Only one request at a time
         'ROBOTSTXT_OBEY': False,  # We need to set this to False as the site might block bots
         'JOBDIR': 'crawler/jobs',  # Directory to store job state for resuming
         'LOG_LEVEL': 'INFO',
@@ -33,95 +35,183 @@ class MovieQuotesSpider(scrapy.Spider):
         super(MovieQuotesSpider, self).__init__(*args, **kwargs)
         
         # Get batch parameters from command line arguments
-        self.batch_size = int(kwargs.get('batch_size', 20))  # Default batch size: 20 movies
+        self.batch_size = int(kwargs.get('batch_size', 20))  # Default batch size: 20 movies (0 = no limit)
         self.start_index = int(kwargs.get('start_index', 0))  # Default start index: 0
         self.max_movies = int(kwargs.get('max_movies', 0))  # Default: 0 (no limit)
         
-        # State file to keep track of processed movies
-        self.state_file = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'state.json')
+        self.state_backend = kwargs.get('state_backend', 'log')  # 'log' or 'sqlite'
         
-        # Load state if exists
-        self.processed_movies = self.load_state()
+        # 'full' skips processed movies, 'incremental' re-checks them and only emits
+        # changed ones, 'replay' re-parses everything from the HTTP cache
+        self.mode = kwargs.get('mode', 'full')
+        
+        # Catalogue parameters: which letter index pages to crawl and how to shard them
+        self.letters = parse_letters(kwargs.get('letters', 'Z'))  # "all" or e.g. "Q,UV,X"
+        self.shard_index = int(kwargs.get('shard_index', 0))
+        self.shard_count = int(kwargs.get('shard_count', 1))
+        self.shard_by = kwargs.get('shard_by', 'letter')  # 'letter' or 'hash'
+        if self.shard_count > 1 and self.shard_by == 'letter':
+            self.letters = letters_for_shard(self.letters, self.shard_index, self.shard_count)
+        base_url = kwargs.get('base_url', BASE_URL)
+        if base_url != BASE_URL:
+            self.allowed_domains = [urlparse(base_url).hostname]
+        self.index_urls = [index_url(letter, base_url) for letter in self.letters]
+        
+        # State store keeping track of processed movies (migrates a legacy state.json)
+        self.state_dir = kwargs.get('state_dir') or os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        self.processed_movies = open_state_store(self.state_dir, backend=self.state_backend)
+        
+        # Continuous mode feeds every batch of the frontier into this one running crawler,
+        # pausing batch_delay seconds between batches and checkpointing after each
+        self.continuous = str(kwargs.get('continuous', '')).lower() in ('1', 'true', 'yes')
+        self.batch_delay = float(kwargs.get('batch_delay', 0))
+        self.checkpoint_file = os.path.join(self.state_dir, 'checkpoint.json')
+        if self.continuous and 'start_index' not in kwargs:
+            self.start_index = self.load_checkpoint()
+        self.next_index = self.start_index
+        self.frontier = None
+        self.waiting_for_batch = False
+        
+        # Index page links are cached so repeated runs do not re-download them
+        self.index_cache_file = os.path.join(self.state_dir, 'index_cache.json')
+        self.index_links = load_index_cache(self.index_cache_file, float(kwargs.get('index_cache_ttl', 86400)))
         
         self.logger.info(f"Starting crawler with batch_size={self.batch_size}, start_index={self.start_index}")
+        self.logger.info(f"Letters: {','.join(self.letters)} (shard {self.shard_index + 1}/{self.shard_count} by {self.shard_by})")
         self.logger.info(f"Already processed {len(self.processed_movies)} movies")
     
-    def load_state(self):
-        """Load the state of processed movies from a file."""
-        if os.path.exists(self.state_file):
-            try:
-                with open(self.state_file, 'r') as f:
-                    return json.load(f)
-            except json.JSONDecodeError:
-                self.logger.error(f"Error loading state file: {self.state_file}")
-                return []
-        return []
-    
-    def save_state(self):
-        """Save the state of processed movies to a file."""
-        with open(self.state_file, 'w') as f:
-            json.dump(self.processed_movies, f)
-        self.logger.info(f"Saved state with {len(self.processed_movies)} processed movies")
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super(MovieQuotesSpider, cls).from_crawler(crawler, *args, **kwargs)
+        # Extraction engine for movie pages ('lxml' or 'parsel')
+        spider.extractor = get_extractor(kwargs.get('extractor') or crawler.settings.get('QUOTES_EXTRACTOR', 'lxml'))
+        # Shared with the CrawlMetrics extension (state-save timings)
+        spider.metrics = metrics_for(crawler)
+        if spider.continuous:
+            crawler.signals.connect(spider.spider_idle, signal=signals.spider_idle)
+        return spider
 
+    async def start(self):
+        """Scrapy 2.13+ seeds spiders through start() and no longer calls start_requests()."""
+        for request in self.start_requests():
+            yield request
+
+    def start_requests(self):
+        """Requests every uncached letter index page; the frontier is built once all are known."""
+        missing = [url for url in self.index_urls if url not in self.index_links]
+        if not missing:
+            self.logger.info(f"Using cached movie lists for {len(self.index_urls)} index pages")
+            yield from self.schedule_frontier()
+            return
+        for url in missing:
+            yield scrapy.Request(url, callback=self.parse, errback=self.index_failed)
+    
+    def index_failed(self, failure):
+        """Counts a failed index page as empty so the frontier is still built."""
+        self.logger.error(f"Failed to fetch movie list page: {failure.request.url}")
+        self.index_links[failure.request.url] = []
+        yield from self.schedule_frontier()
+    
     def parse(self, response):
-        """Parses the main movie list page."""
+        """Parses a movie list page."""
         self.logger.info(f"Parsing movie list page: {response.url}")
         
         # Check if we got a 403 error
         if response.status == 403:
             self.logger.error(f"Received 403 Forbidden error for {response.url}")
+            self.index_links[response.request.url] = []
+        else:
+            # Extract movie links from the page
+            movie_links = response.css("a[href^='/movies/']::attr(href)").getall()
+            self.index_links[response.request.url] = [response.urljoin(link) for link in movie_links]
+            self.logger.info(f"Found {len(movie_links)} movie links")
+            save_index_cache(self.index_cache_file, {response.request.url: self.index_links[response.request.url]})
+        
+        yield from self.schedule_frontier()
+    
+    def build_frontier(self):
+        """Merges the index pages, in letter order, into one de-duplicated frontier for this shard."""
+        frontier = []
+        seen = set()
+        for url in self.index_urls:
+            for movie_url in self.index_links.get(url, []):
+                if movie_url in seen:
+                    continue
+                seen.add(movie_url)
+                if self.shard_count > 1 and self.shard_by == 'hash' \
+                        and shard_of(movie_url, self.shard_count) != self.shard_index:
+                    continue
+                frontier.append(movie_url)
+        return frontier
+    
+    def schedule_frontier(self):
+        """Builds the frontier once every index page has been seen and schedules the first batch."""
+        if self.frontier is not None or any(url not in self.index_links for url in self.index_urls):
             return
         
-        # Extract movie links from the page
-        movie_links = response.css("a[href^='/movies/']::attr(href)").getall()
-        self.logger.info(f"Found {len(movie_links)} movie links")
+        self.frontier = self.build_frontier()
+        self.frontier_size = len(self.frontier)
+        self.logger.info(f"Frontier contains {len(self.frontier)} movies")
+        yield from self.schedule_batch()
+    
+    def frontier_end(self):
+        """Index just past the last movie this run may process."""
+        if self.max_movies > 0:
+            return min(len(self.frontier), self.max_movies)
+        return len(self.frontier)
+    
+    def schedule_batch(self):
+        """Yields requests for the next batch of the frontier."""
+        movie_links = self.frontier
+        start_index = self.next_index
         
-        # Calculate the end index for this batch
-        end_index = self.start_index + self.batch_size
+        # Calculate the end index for this batch (a batch size of 0 means no limit)
+        end_index = start_index + self.batch_size if self.batch_size > 0 else len(movie_links)
         if self.max_movies > 0:
             end_index = min(end_index, self.max_movies)
+        self.next_index = max(end_index, start_index)
         
         # Process movies in the current batch
-        batch_links = movie_links[self.start_index:end_index]
-        self.logger.info(f"Processing batch from index {self.start_index} to {end_index-1} ({len(batch_links)} movies)")
+        batch_links = movie_links[start_index:end_index]
+        self.logger.info(f"Processing batch from index {start_index} to {end_index-1} ({len(batch_links)} movies)")
         
         # Counter for processed movies in this batch
         processed_count = 0
         
-        for link in batch_links:
-            # Skip already processed movies
-            movie_url = response.urljoin(link)
-            if movie_url in self.processed_movies:
+        for movie_url in batch_links:
+            # Skip already processed movies (incremental and replay runs re-check them)
+            if self.mode == 'full' and movie_url in self.processed_movies:
                 self.logger.info(f"Skipping already processed movie: {movie_url}")
                 continue
             
-            # Add a small random delay
-            time.sleep(random.uniform(1, 3))
-            
             # Create a movie item
             # Extract movie title from URL, handling cases where the title contains slashes
-            movie_path = link.split('/movies/')[-1]  # Get everything after '/movies/'
+            movie_path = movie_url.split('/movies/')[-1]  # Get everything after '/movies/'
             movie_title = movie_path.replace('_', ' ')
             
             movie_item = MovieItem()
             movie_item['title'] = movie_title
             movie_item['url'] = movie_url
             
+            # The job directory's duplicate filter remembers every movie of earlier runs;
+            # incremental and replay runs exist to fetch those again
             yield scrapy.Request(
                 movie_url,
                 callback=self.parse_movie_details,
                 meta={'movie_item': movie_item},
+                dont_filter=self.mode != 'full',
                 headers={'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
             )
             
             processed_count += 1
         
+        self.last_batch_count = processed_count
         self.logger.info(f"Scheduled {processed_count} new movies for processing")
         
         # If we've reached the end of all movies or hit the max_movies limit
-        if end_index >= len(movie_links) or (self.max_movies > 0 and end_index >= self.max_movies):
+        if end_index >= self.frontier_end():
             self.logger.info("Reached the end of movie list or hit max_movies limit")
-        else:
+        elif not self.continuous:
             # Log information about the next batch
             next_start = end_index
             next_end = next_start + self.batch_size
@@ -129,7 +219,60 @@ class MovieQuotesSpider(scrapy.Spider):
                 next_end = min(next_end, self.max_movies)
             
             self.logger.info(f"To process the next batch, run with start_index={next_start} (will process {next_start} to {next_end-1})")
-
+    
+    def spider_idle(self):
+        """In continuous mode, checkpoints the finished batch and feeds the next one."""
+        if self.frontier is None:
+            return
+        if self.waiting_for_batch:
+            raise DontCloseSpider
+        
+        with self.metrics.timer('crawler_state_save_seconds', operation='checkpoint'):
+            self.save_checkpoint()
+        if self.next_index >= self.frontier_end():
+            return
+        
+        # Skip the pause when the last batch had nothing left to download
+        delay = self.batch_delay if self.last_batch_count else 0
+        self.logger.info(f"Batch finished; next batch from index {self.next_index} in {delay:.0f}s")
+        # Imported here so the reactor chosen in settings.py is installed first
+        from twisted.internet import reactor
+        self.waiting_for_batch = True
+        reactor.callLater(delay, self.feed_next_batch)
+        raise DontCloseSpider
+    
+    def feed_next_batch(self):
+        self.waiting_for_batch = False
+        for request in self.schedule_batch():
+            self.crawler.engine.crawl(request)
+    
+    def load_checkpoint(self):
+        """Index to resume a continuous run from (0 without a checkpoint)."""
+        if not os.path.exists(self.checkpoint_file):
+            return 0
+        try:
+            with open(self.checkpoint_file, 'r') as f:
+                checkpoint = json.load(f)
+        except json.JSONDecodeError:
+            return 0
+        if checkpoint.get('letters') != self.letters:
+            return 0
+        self.logger.info(f"Resuming from checkpoint at index {checkpoint['next_index']}")
+        return checkpoint['next_index']
+    
+    def save_checkpoint(self):
+        """Flushes crawl state and records where the next batch starts."""
+        self.processed_movies.flush()
+        tmp_file = self.checkpoint_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump({
+                'letters': self.letters,
+                'next_index': self.next_index,
+                'frontier_size': len(self.frontier),
+                'updated_at': datetime.now().isoformat(),
+            }, f)
+        os.replace(tmp_file, self.checkpoint_file)
+    
     def parse_movie_details(self, response):
         """Parses the movie details page and extracts quotes."""
         self.logger.info(f"Parsing movie page: {response.url}")
@@ -141,55 +284,65 @@ class MovieQuotesSpider(scrapy.Spider):
         
         movie_item = response.meta['movie_item']
         
-        # Extract movie title - adjust selector based on the actual HTML structure
-        title = response.css("h1::text").get()
+        # A 304 revalidation served from the cache means the page has not changed
+        if self.mode == 'incremental' and 'cached' in response.flags \
+                and self.processed_movies.get(movie_item['url']):
+            self.logger.info(f"Unchanged movie (not modified): {movie_item['url']}")
+            self.crawler.stats.inc_value('incremental/unchanged')
+            return
+        
+        # Extract the title and the quotes (text of the /mquote/ links)
+        title, quote_texts = self.extractor.extract(response)
         if title:
             movie_item['title'] = title.strip()
         
-        # Extract movie quotes - adjust selectors based on the actual HTML structure
-        quotes = []
-        
-        # Based on the provided URL content, quotes are in mquote tags
-        quote_blocks = response.css("a[href^='/mquote/']")
-        
-        for quote_block in quote_blocks:
-            quote_text = quote_block.xpath("string()").get()
-            if quote_text:
-                quote_item = QuoteItem()
-                quote_item['text'] = quote_text.strip()
-                quote_item['movie_title'] = movie_item['title']
-                quotes.append(dict(quote_item))
+        # Plain dicts with the QuoteItem fields, as emitted before
+        quotes = [{'text': text, 'movie_title': movie_item['title']} for text in quote_texts]
         
         movie_item['quotes'] = quotes
         
-        # Add this movie to the processed list
-        self.processed_movies.append(movie_item['url'])
-        self.save_state()
+        # Content hash of the extracted movie, used to detect changes on re-crawls
+        digest = hashlib.sha1(
+            json.dumps([movie_item['title'], quotes], sort_keys=True).encode('utf-8')
+        ).hexdigest()
+        if self.mode == 'incremental' and self.processed_movies.get(movie_item['url']) == digest:
+            self.logger.info(f"Unchanged movie (same content hash): {movie_item['url']}")
+            self.crawler.stats.inc_value('incremental/unchanged')
+            return
+        
+        # Add this movie to the processed list (flushed to disk in batches)
+        with self.metrics.timer('crawler_state_save_seconds', operation='add'):
+            self.processed_movies.add(movie_item['url'], digest)
         
         self.logger.info(f"Extracted {len(quotes)} quotes from {movie_item['title']}")
         yield movie_item
     
     def closed(self, reason):
         """Called when the spider is closed."""
+        total_processed = len(self.processed_movies)
         self.logger.info(f"Spider closed: {reason}")
-        self.logger.info(f"Total movies processed: {len(self.processed_movies)}")
+        self.logger.info(f"Total movies processed: {total_processed}")
         
-        # Save final state
-        self.save_state()
+        # Flush and close the state store
+        with self.metrics.timer('crawler_state_save_seconds', operation='close'):
+            self.processed_movies.close()
         
         # Create a summary file with timestamp
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        summary_file = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), f'summary_{timestamp}.txt')
+        summary_file = os.path.join(self.state_dir, f'summary_{timestamp}.txt')
         
         with open(summary_file, 'w') as f:
             f.write(f"Crawler run completed at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-            f.write(f"Total movies processed: {len(self.processed_movies)}\n")
+            f.write(f"Total movies processed: {total_processed}\n")
             f.write(f"Batch size: {self.batch_size}\n")
             f.write(f"Start index: {self.start_index}\n")
             f.write(f"Max movies limit: {self.max_movies if self.max_movies > 0 else 'No limit'}\n")
             
-            # Calculate next batch start index
-            next_start = self.start_index + self.batch_size
-            f.write(f"\nTo process the next batch, run with start_index={next_start}\n")
+            # The next batch starts where the scheduled batches ended, not at
+            # start_index + batch_size (the frontier may be exhausted or capped)
+            if self.frontier is not None and self.next_index >= self.frontier_end():
+                f.write(f"\nReached the end of the movie list (next index {self.next_index})\n")
+            else:
+                f.write(f"\nTo process the next batch, run with start_index={self.next_index}\n")
         
         self.logger.info(f"Summary saved to {summary_file}")
\ No newline at end of file
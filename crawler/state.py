@@ -0,0 +1,255 @@
+import json
+import logging
+import os
+import sqlite3
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class StateStore:
+    """
+    Base class for crawl state backends.
+
+    A state store maps a processed movie URL to an optional content digest.
+    Membership checks are answered from an index so they cost O(1) however
+    many movies have been crawled, and writes are buffered and flushed in
+    batches instead of rewriting the whole state after every movie.
+    """
+
+    def __init__(self, path, flush_every=50, flush_interval=5.0):
+        self.path = path
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self._pending = []
+        self._last_flush = time.monotonic()
+
+    def __contains__(self, url):
+        raise NotImplementedError
+
+    def __len__(self):
+        raise NotImplementedError
+
+    def get(self, url, default=None):
+        """Return the digest recorded for a URL."""
+        raise NotImplementedError
+
+    def add(self, url, digest=None):
+        """Record a processed URL, flushing when the batch is full or stale."""
+        self._record(url, digest)
+        self._pending.append((url, digest))
+        if (len(self._pending) >= self.flush_every
+                or time.monotonic() - self._last_flush >= self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        """Durably write all pending entries."""
+        if self._pending:
+            self._write(self._pending)
+            self._pending = []
+        self._last_flush = time.monotonic()
+
+    def compact(self):
+        """Reclaim space taken by superseded entries."""
+
+    def close(self):
+        self.flush()
+
+    def migrate_legacy(self, legacy_path):
+        """
+        Import a legacy state.json (a plain list of URLs) once.
+
+        The legacy file is renamed afterwards so the import never runs twice.
+        """
+        if not os.path.exists(legacy_path):
+            return 0
+        try:
+            with open(legacy_path, 'r') as f:
+                urls = json.load(f)
+        except json.JSONDecodeError:
+            logger.error(f"Error loading legacy state file: {legacy_path}")
+            return 0
+
+        migrated = 0
+        for url in urls:
+            if url not in self:
+                self._record(url, None)
+                self._pending.append((url, None))
+                migrated += 1
+        self.flush()
+        os.replace(legacy_path, legacy_path + '.migrated')
+        logger.info(f"Migrated {migrated} movies from {legacy_path}")
+        return migrated
+
+    def _record(self, url, digest):
+        raise NotImplementedError
+
+    def _write(self, entries):
+        raise NotImplementedError
+
+
+class LogStateStore(StateStore):
+    """
+    Append-only JSON Lines log with an in-memory dict index.
+
+    Each flush appends one line per entry and fsyncs the file. A crash can at
+    worst leave a truncated final line, which is ignored on the next load and
+    ended with a newline before anything else is appended. The log is
+    compacted on open once superseded lines outnumber live entries.
+    """
+
+    def __init__(self, path, **kwargs):
+        super().__init__(path, **kwargs)
+        self._index = {}
+        self._log_lines = 0
+        self._load()
+        if self._log_lines > 2 * max(len(self._index), 1):
+            self.compact()
+        self._file = open(self.path, 'a', encoding='utf-8')
+        self._end_torn_line()
+
+    def _end_torn_line(self):
+        # Appending to a line cut short by a crash would corrupt the first new entry too
+        with open(self.path, 'rb') as f:
+            if f.seek(0, os.SEEK_END) == 0:
+                return
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) == b'\n':
+                return
+        self._file.write('\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"Ignoring corrupt state entry in {self.path}")
+                    continue
+                self._index[entry['url']] = entry.get('digest')
+                self._log_lines += 1
+
+    def __contains__(self, url):
+        return url in self._index
+
+    def __len__(self):
+        return len(self._index)
+
+    def get(self, url, default=None):
+        return self._index.get(url, default)
+
+    def _record(self, url, digest):
+        self._index[url] = digest
+
+    def _write(self, entries):
+        self._file.write(''.join(
+            json.dumps({'url': url, 'digest': digest}) + '\n' for url, digest in entries
+        ))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._log_lines += len(entries)
+
+    def compact(self):
+        """Rewrite the log with one line per URL and atomically swap it in."""
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for url, digest in self._index.items():
+                f.write(json.dumps({'url': url, 'digest': digest}) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        reopen = hasattr(self, '_file')
+        if reopen:
+            self._file.close()
+        os.replace(tmp_path, self.path)
+        self._log_lines = len(self._index)
+        if reopen:
+            self._file = open(self.path, 'a', encoding='utf-8')
+        logger.info(f"Compacted state log to {self._log_lines} entries")
+
+    def close(self):
+        super().close()
+        self._file.close()
+
+
+class SqliteStateStore(StateStore):
+    """Embedded SQLite table keyed by URL, written in WAL mode."""
+
+    def __init__(self, path, **kwargs):
+        super().__init__(path, **kwargs)
+        self._conn = sqlite3.connect(self.path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS processed_movies (url TEXT PRIMARY KEY, digest TEXT)"
+        )
+        self._conn.commit()
+        self._unflushed = {}
+
+    def __contains__(self, url):
+        return url in self._unflushed or self._stored(url)
+
+    def _stored(self, url):
+        row = self._conn.execute(
+            "SELECT 1 FROM processed_movies WHERE url = ?", (url,)
+        ).fetchone()
+        return row is not None
+
+    def __len__(self):
+        count = self._conn.execute("SELECT COUNT(*) FROM processed_movies").fetchone()[0]
+        # URLs re-added since the last flush are already counted in the table
+        return count + sum(1 for url in self._unflushed if not self._stored(url))
+
+    def get(self, url, default=None):
+        if url in self._unflushed:
+            return self._unflushed[url]
+        row = self._conn.execute(
+            "SELECT digest FROM processed_movies WHERE url = ?", (url,)
+        ).fetchone()
+        return row[0] if row else default
+
+    def _record(self, url, digest):
+        self._unflushed[url] = digest
+
+    def _write(self, entries):
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO processed_movies (url, digest) VALUES (?, ?)",
+                entries
+            )
+        self._unflushed = {}
+
+    def compact(self):
+        self.flush()
+        self._conn.execute("VACUUM")
+
+    def close(self):
+        super().close()
+        self._conn.close()
+
+
+STATE_BACKENDS = {
+    'log': (LogStateStore, 'state.log'),
+    'sqlite': (SqliteStateStore, 'state.sqlite3'),
+}
+
+
+def open_state_store(state_dir, backend='log', legacy_file='state.json', **kwargs):
+    """
+    Open the crawl state store in state_dir, migrating a legacy state.json.
+
+    Args:
+        state_dir (str): Directory holding the state files
+        backend (str): 'log' for the append-only log, 'sqlite' for SQLite
+        legacy_file (str): Name of the legacy JSON list to import once
+    """
+    if backend not in STATE_BACKENDS:
+        raise ValueError(f"Unknown state backend: {backend}")
+    store_cls, filename = STATE_BACKENDS[backend]
+    os.makedirs(state_dir, exist_ok=True)
+    store = store_cls(os.path.join(state_dir, filename), **kwargs)
+    store.migrate_legacy(os.path.join(state_dir, legacy_file))
+    return store
@@ -0,0 +1,680 @@
+import json
+import os
+import sqlite3
+
+from crawler import db
+from crawler.dedup import cluster_batch, unpack_signature
+from crawler.dialogue import segment_quote
+from crawler.search import RANK_DIGITS, parse_query
+
+
+class Storage:
+    """
+    Base class for movie and quote storage backends.
+
+    A storage holds the quotesnet tables (movies, quotes, quote_lines, the
+    load manifest and the summary tables) behind one interface, so the ETL and
+    the API can target PostgreSQL or an embedded SQLite file alike. Writes
+    happen in the storage's current transaction; the caller commits.
+    """
+
+    def create_schema(self):
+        """Create the tables if they don't exist, and commit."""
+        raise NotImplementedError
+
+    def create_stats_tables(self):
+        """Create only the summary tables if they don't exist, built from the data, and commit."""
+        raise NotImplementedError
+
+    def load_movies(self, movies, stage=None):
+        """
+        Load a batch of movie records with their quotes and speaker turns.
+
+        Returns:
+            tuple: (movies inserted, quotes inserted)
+        """
+        return self.load_movie_rows(db.movie_rows(movies), stage)
+
+    def load_movie_rows(self, rows, stage=None):
+        """Load a batch of staging rows built by crawler.db.movie_rows; see load_movies."""
+        raise NotImplementedError
+
+    def get_load_state(self, file_path):
+        """Return (checksum, records loaded, completed) for a file, or None."""
+        raise NotImplementedError
+
+    def record_load_progress(self, file_path, checksum, records_loaded, completed=False):
+        raise NotImplementedError
+
+    def segment_stored_quotes(self):
+        """Split quotes stored without speaker turns into quote_lines; return how many."""
+        raise NotImplementedError
+
+    def dedup_stored_quotes(self):
+        """Assign quotes stored without a cluster to near-duplicate clusters; return how many."""
+        raise NotImplementedError
+
+    def stats(self, refresh=False):
+        """
+        Read the summary tables, rebuilding them from the data first with refresh.
+
+        Returns:
+            dict: movies, quotes, movies_with_quotes, refreshed_at, and letters
+                  and years as (key, movies) lists
+        """
+        raise NotImplementedError
+
+    def data_version(self):
+        """A counter that goes up with every committed change to movies, quotes or clusters."""
+        raise NotImplementedError
+
+    def search_quotes(self, query, movie_id=None, year=None, limit=20, cursor=None, collapse=False):
+        """
+        Full-text search, best first, paged with a (rank, quote id) cursor.
+        With collapse, only the best hit of each near-duplicate cluster.
+
+        Returns:
+            list: (quote id, movie_id, title, year, url, quote text, rank) rows
+        """
+        raise NotImplementedError
+
+    def iter_movies(self, letter=None, year=None):
+        """
+        Yield every stored movie as a crawler record (title, url, quotes), in
+        load order, optionally only those whose title starts with letter or
+        of one year.
+        """
+        raise NotImplementedError
+
+    def list_movies(self, letter=None, year=None, limit=100, after=None):
+        """
+        One page of iter_movies, keyset-paginated on the movie's database id.
+
+        Returns:
+            list: (id, record) pairs; pass the last id as after for the next page
+        """
+        raise NotImplementedError
+
+    def get_movie(self, movie_id):
+        """A stored movie as a crawler record, by its quotes.net movie id, or None."""
+        raise NotImplementedError
+
+    def random_quote(self):
+        """
+        A random stored quote, picked through the primary key index.
+
+        Returns:
+            tuple: (movie_id, title, url, quote text), or None without quotes
+        """
+        raise NotImplementedError
+
+    def commit(self):
+        self.conn.commit()
+
+    def rollback(self):
+        self.conn.rollback()
+
+    def close(self):
+        self.conn.close()
+
+
+def _raw_title(title, year, movie_id):
+    """The "title (year) movie_id" form crawler records carry."""
+    if year is None or movie_id is None:
+        return title
+    return f"{title} ({year}) {movie_id}"
+
+
+def _movie_records(movies, quotes):
+    """
+    Crawler records of (id, title, year, movie_id, url) rows, given their
+    (movie id, quote text) rows in order.
+    """
+    texts = {}
+    for id, text in quotes:
+        texts.setdefault(id, []).append({'text': text})
+    return [(id, {'title': _raw_title(title, year, movie_id), 'url': url, 'quotes': texts.get(id, [])})
+            for id, title, year, movie_id, url in movies]
+
+
+# Read queries of PostgresStorage, with named parameters. The async API
+# storage (crawler/async_storage.py) runs the same statements through asyncpg.
+PG_STATS_TOTALS = "SELECT movies, quotes, movies_with_quotes, refreshed_at FROM quotesnet.stats_totals"
+PG_STATS_LETTERS = "SELECT letter, movies FROM quotesnet.stats_letters WHERE movies > 0 ORDER BY letter"
+PG_STATS_YEARS = "SELECT year, movies FROM quotesnet.stats_years WHERE movies > 0 ORDER BY year"
+PG_MOVIES_PAGE = """
+SELECT id, title, year, movie_id, url FROM quotesnet.movies
+WHERE (%(letter)s::text IS NULL OR UPPER(LEFT(title, 1)) = %(letter)s)
+  AND (%(year)s::int IS NULL OR year = %(year)s)
+  AND id > %(after)s
+ORDER BY id
+LIMIT %(limit)s
+"""
+PG_MOVIE = "SELECT id, title, year, movie_id, url FROM quotesnet.movies WHERE movie_id = %(movie_id)s"
+PG_MOVIES_QUOTES = "SELECT movie_id, quote_text FROM quotesnet.quotes WHERE movie_id = ANY(%(ids)s) ORDER BY id"
+# The first quote at or after a random id; gaps left by deletes make the
+# quotes after them a little likelier
+PG_RANDOM_QUOTE = """
+SELECT m.title, m.year, m.movie_id, m.url, q.quote_text
+FROM quotesnet.quotes q
+JOIN quotesnet.movies m ON m.id = q.movie_id
+WHERE q.id >= (SELECT MIN(id) + floor(random() * (MAX(id) - MIN(id) + 1)) FROM quotesnet.quotes)
+ORDER BY q.id
+LIMIT 1
+"""
+
+
+def _stats_rows(cur):
+    cur.execute(PG_STATS_TOTALS)
+    movies, quotes, movies_with_quotes, refreshed_at = cur.fetchone()
+    cur.execute(PG_STATS_LETTERS)
+    letters = cur.fetchall()
+    cur.execute(PG_STATS_YEARS)
+    years = cur.fetchall()
+    return {
+        'movies': movies, 'quotes': quotes, 'movies_with_quotes': movies_with_quotes,
+        'refreshed_at': refreshed_at, 'letters': letters, 'years': years,
+    }
+
+
+class PostgresStorage(Storage):
+    """The quotesnet schema in PostgreSQL, through the functions of crawler.db."""
+
+    def __init__(self, dsn=None, conn=None):
+        if conn is None:
+            import psycopg2
+
+            conn = psycopg2.connect(dsn)
+        self.conn = conn
+
+    def create_schema(self):
+        db.create_schema_and_tables(self.conn)
+
+    def create_stats_tables(self):
+        db.create_stats_tables(self.conn)
+
+    def load_movie_rows(self, rows, stage=None):
+        return db.load_movie_rows(self.conn, rows, stage)
+
+    def get_load_state(self, file_path):
+        return db.get_load_state(self.conn, file_path)
+
+    def record_load_progress(self, file_path, checksum, records_loaded, completed=False):
+        db.record_load_progress(self.conn, file_path, checksum, records_loaded, completed)
+
+    def segment_stored_quotes(self):
+        return db.segment_stored_quotes(self.conn)
+
+    def dedup_stored_quotes(self):
+        return db.dedup_stored_quotes(self.conn)
+
+    def stats(self, refresh=False):
+        if refresh:
+            db.refresh_stats(self.conn)
+        with self.conn.cursor() as cur:
+            return _stats_rows(cur)
+
+    def data_version(self):
+        return db.get_data_version(self.conn)
+
+    def search_quotes(self, query, movie_id=None, year=None, limit=20, cursor=None, collapse=False):
+        return db.search_quotes(self.conn, query, movie_id, year, limit, cursor, collapse)
+
+    def iter_movies(self, letter=None, year=None, batch_size=1000):
+        with self.conn.cursor(name='stored_movies') as movies:
+            movies.itersize = batch_size
+            movies.execute("""
+            SELECT id, title, year, movie_id, url FROM quotesnet.movies
+            WHERE (%(letter)s::text IS NULL OR UPPER(LEFT(title, 1)) = %(letter)s)
+              AND (%(year)s::int IS NULL OR year = %(year)s)
+            ORDER BY id
+            """, {'letter': letter, 'year': year})
+            with self.conn.cursor() as cur:
+                for id, title, year, movie_id, url in movies:
+                    cur.execute("SELECT quote_text FROM quotesnet.quotes WHERE movie_id = %s ORDER BY id", (id,))
+                    yield {'title': _raw_title(title, year, movie_id), 'url': url,
+                           'quotes': [{'text': text} for text, in cur]}
+
+    def list_movies(self, letter=None, year=None, limit=100, after=None):
+        with self.conn.cursor() as cur:
+            cur.execute(PG_MOVIES_PAGE, {'letter': letter, 'year': year, 'after': after or 0, 'limit': limit})
+            movies = cur.fetchall()
+            cur.execute(PG_MOVIES_QUOTES, {'ids': [movie[0] for movie in movies]})
+            return _movie_records(movies, cur.fetchall())
+
+    def get_movie(self, movie_id):
+        with self.conn.cursor() as cur:
+            cur.execute(PG_MOVIE, {'movie_id': movie_id})
+            movies = cur.fetchall()
+            if not movies:
+                return None
+            cur.execute(PG_MOVIES_QUOTES, {'ids': [movies[0][0]]})
+            return _movie_records(movies, cur.fetchall())[0][1]
+
+    def random_quote(self):
+        with self.conn.cursor() as cur:
+            cur.execute(PG_RANDOM_QUOTE)
+            row = cur.fetchone()
+        if row is None:
+            return None
+        title, year, movie_id, url, text = row
+        return movie_id, _raw_title(title, year, movie_id), url, text
+
+
+# The quotesnet tables in SQLite. The FTS5 index (quotes_fts) and the summary
+# tables are kept up to date by triggers, so every write path maintains them.
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS movies (
+    id INTEGER PRIMARY KEY,
+    title TEXT NOT NULL,
+    year INTEGER,
+    movie_id INTEGER UNIQUE,
+    url TEXT,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_movie_title ON movies(title);
+CREATE INDEX IF NOT EXISTS idx_movie_year ON movies(year);
+
+CREATE TABLE IF NOT EXISTS quotes (
+    id INTEGER PRIMARY KEY,
+    movie_id INTEGER REFERENCES movies(id) ON DELETE CASCADE,
+    quote_text TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    cluster_id INTEGER,
+    minhash BLOB,
+    UNIQUE (movie_id, content_hash)
+);
+CREATE INDEX IF NOT EXISTS idx_quote_cluster_id ON quotes(cluster_id);
+
+CREATE TABLE IF NOT EXISTS quote_buckets (
+    band INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    quote_id INTEGER NOT NULL REFERENCES quotes(id) ON DELETE CASCADE,
+    PRIMARY KEY (band, bucket)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS quote_lines (
+    quote_id INTEGER NOT NULL REFERENCES quotes(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    speaker TEXT,
+    line TEXT,
+    stage_direction TEXT,
+    PRIMARY KEY (quote_id, position)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_quote_lines_speaker ON quote_lines(speaker);
+CREATE INDEX IF NOT EXISTS idx_quote_lines_speaker_lower ON quote_lines(lower(speaker));
+
+CREATE TABLE IF NOT EXISTS load_manifest (
+    file_path TEXT PRIMARY KEY,
+    checksum TEXT NOT NULL,
+    records_loaded INTEGER NOT NULL DEFAULT 0,
+    completed INTEGER NOT NULL DEFAULT 0,
+    updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS quotes_fts USING fts5(
+    quote_text, content='quotes', content_rowid='id', tokenize='porter unicode61'
+);
+CREATE TRIGGER IF NOT EXISTS quotes_fts_insert AFTER INSERT ON quotes BEGIN
+    INSERT INTO quotes_fts (rowid, quote_text) VALUES (new.id, new.quote_text);
+END;
+CREATE TRIGGER IF NOT EXISTS quotes_fts_delete AFTER DELETE ON quotes BEGIN
+    INSERT INTO quotes_fts (quotes_fts, rowid, quote_text) VALUES ('delete', old.id, old.quote_text);
+END;
+
+CREATE TABLE IF NOT EXISTS stats_totals (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    movies INTEGER NOT NULL DEFAULT 0,
+    quotes INTEGER NOT NULL DEFAULT 0,
+    movies_with_quotes INTEGER NOT NULL DEFAULT 0,
+    refreshed_at TEXT,
+    data_version INTEGER NOT NULL DEFAULT 0
+);
+INSERT OR IGNORE INTO stats_totals (id) VALUES (1);
+CREATE TABLE IF NOT EXISTS stats_letters (letter TEXT PRIMARY KEY, movies INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS stats_years (year INTEGER PRIMARY KEY, movies INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS movie_quote_counts (movie_id INTEGER PRIMARY KEY, quotes INTEGER NOT NULL);
+
+CREATE TRIGGER IF NOT EXISTS movies_stats_insert AFTER INSERT ON movies BEGIN
+    INSERT INTO stats_letters VALUES (upper(substr(new.title, 1, 1)), 1)
+        ON CONFLICT (letter) DO UPDATE SET movies = movies + 1;
+    INSERT INTO stats_years VALUES (coalesce(new.year, 0), 1)
+        ON CONFLICT (year) DO UPDATE SET movies = movies + 1;
+    UPDATE stats_totals SET movies = movies + 1, data_version = data_version + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS movies_stats_delete AFTER DELETE ON movies BEGIN
+    UPDATE stats_letters SET movies = movies - 1 WHERE letter = upper(substr(old.title, 1, 1));
+    UPDATE stats_years SET movies = movies - 1 WHERE year = coalesce(old.year, 0);
+    UPDATE stats_totals SET movies = movies - 1, data_version = data_version + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS movies_stats_update AFTER UPDATE OF title, year ON movies BEGIN
+    UPDATE stats_letters SET movies = movies - 1 WHERE letter = upper(substr(old.title, 1, 1));
+    UPDATE stats_years SET movies = movies - 1 WHERE year = coalesce(old.year, 0);
+    INSERT INTO stats_letters VALUES (upper(substr(new.title, 1, 1)), 1)
+        ON CONFLICT (letter) DO UPDATE SET movies = movies + 1;
+    INSERT INTO stats_years VALUES (coalesce(new.year, 0), 1)
+        ON CONFLICT (year) DO UPDATE SET movies = movies + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS movies_version_update AFTER UPDATE ON movies BEGIN
+    UPDATE stats_totals SET data_version = data_version + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS quotes_stats_insert AFTER INSERT ON quotes BEGIN
+    INSERT INTO movie_quote_counts VALUES (new.movie_id, 1)
+        ON CONFLICT (movie_id) DO UPDATE SET quotes = quotes + 1;
+    UPDATE stats_totals SET quotes = quotes + 1, data_version = data_version + 1, movies_with_quotes = movies_with_quotes
+        + (SELECT quotes = 1 FROM movie_quote_counts WHERE movie_id = new.movie_id);
+END;
+CREATE TRIGGER IF NOT EXISTS quotes_stats_delete AFTER DELETE ON quotes BEGIN
+    UPDATE movie_quote_counts SET quotes = quotes - 1 WHERE movie_id = old.movie_id;
+    UPDATE stats_totals SET quotes = quotes - 1, data_version = data_version + 1, movies_with_quotes = movies_with_quotes
+        - (SELECT quotes = 0 FROM movie_quote_counts WHERE movie_id = old.movie_id);
+    DELETE FROM movie_quote_counts WHERE movie_id = old.movie_id AND quotes = 0;
+END;
+"""
+
+SQLITE_REFRESH_STATS = """
+DELETE FROM stats_letters;
+DELETE FROM stats_years;
+DELETE FROM movie_quote_counts;
+INSERT INTO stats_letters SELECT upper(substr(title, 1, 1)), COUNT(*) FROM movies GROUP BY 1;
+INSERT INTO stats_years SELECT coalesce(year, 0), COUNT(*) FROM movies GROUP BY 1;
+INSERT INTO movie_quote_counts SELECT movie_id, COUNT(*) FROM quotes WHERE movie_id IS NOT NULL GROUP BY 1;
+UPDATE stats_totals SET
+    movies = (SELECT COUNT(*) FROM movies),
+    quotes = (SELECT COUNT(*) FROM quotes),
+    movies_with_quotes = (SELECT COUNT(*) FROM movie_quote_counts),
+    refreshed_at = CURRENT_TIMESTAMP,
+    data_version = data_version + 1;
+"""
+
+
+def fts5_query(query):
+    """
+    Translate a search query into an FTS5 expression.
+
+    Every word and "quoted phrase" must match; each is quoted so FTS5 operator
+    characters in the query are taken literally.
+    """
+    terms, phrases = parse_query(query)
+    return ' AND '.join('"' + ' '.join(phrase) + '"' for phrase in [[term] for term in terms] + phrases)
+
+
+class SqliteStorage(Storage):
+    """
+    The quotesnet tables in one embedded SQLite file.
+
+    The database runs in WAL mode, so readers never block the loader, and is
+    memory-mapped (mmap_size bytes) so reads are served from the page cache
+    without copying. Quote text is indexed with FTS5 for search.
+    """
+
+    def __init__(self, path, mmap_size=1 << 30):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        # A connection may be handed between threads, never used by two at once
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.execute(f"PRAGMA mmap_size={int(mmap_size)}")
+
+    def create_schema(self):
+        # Files created before quotes were clustered lack these columns
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(quotes)")}
+        if columns and 'cluster_id' not in columns:
+            self.conn.execute("ALTER TABLE quotes ADD COLUMN cluster_id INTEGER")
+            self.conn.execute("ALTER TABLE quotes ADD COLUMN minhash BLOB")
+        # ...and those created before the data version lack it and the triggers that bump it
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(stats_totals)")}
+        if columns and 'data_version' not in columns:
+            self.conn.execute("ALTER TABLE stats_totals ADD COLUMN data_version INTEGER NOT NULL DEFAULT 0")
+            for trigger in ('movies_stats_insert', 'movies_stats_delete', 'quotes_stats_insert', 'quotes_stats_delete'):
+                self.conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        self.conn.executescript(SQLITE_SCHEMA)
+        self.conn.commit()
+
+    def create_stats_tables(self):
+        # The SQLite upgrades only add columns, tables and triggers; none rewrites rows
+        self.create_schema()
+
+    def load_movie_rows(self, rows, stage=None):
+        movie_stage, quote_stage, line_stage = rows
+        if not movie_stage:
+            return 0, 0
+        cur = self.conn.cursor()
+
+        # Latest record wins for a movie seen twice in the batch, as in PostgreSQL
+        ids = {}
+        movies_inserted = 0
+        for pos, title, year, movie_id, url in movie_stage:
+            if movie_id is not None:
+                row = cur.execute("SELECT id, title, year, url FROM movies WHERE movie_id = ?", (movie_id,)).fetchone()
+            else:
+                row = cur.execute(
+                    "SELECT id, title, year, url FROM movies WHERE movie_id IS NULL AND title = ? AND year IS ?",
+                    (title, year)
+                ).fetchone()
+            if row is None:
+                cur.execute("INSERT INTO movies (title, year, movie_id, url) VALUES (?, ?, ?, ?)",
+                            (title, year, movie_id, url))
+                ids[pos] = cur.lastrowid
+                movies_inserted += 1
+                continue
+            ids[pos] = row[0]
+            if movie_id is not None and row[1:] != (title, year, url):
+                cur.execute("UPDATE movies SET title = ?, year = ?, url = ? WHERE id = ?", (title, year, url, row[0]))
+
+        quote_ids = {}
+        quotes_inserted = 0
+        for pos, text in quote_stage:
+            content_hash = db.quote_hash(text)
+            row = cur.execute(
+                "INSERT INTO quotes (movie_id, quote_text, content_hash) VALUES (?, ?, ?) "
+                "ON CONFLICT (movie_id, content_hash) DO NOTHING RETURNING id",
+                (ids[pos], text, content_hash)
+            ).fetchone()
+            if row is not None:
+                quote_ids[pos, content_hash] = row[0]
+                quotes_inserted += 1
+
+        cur.executemany(
+            "INSERT OR IGNORE INTO quote_lines (quote_id, position, speaker, line, stage_direction) "
+            "VALUES (?, ?, ?, ?, ?)",
+            ((quote_ids[pos, content_hash],) + tuple(turn)
+             for pos, content_hash, *turn in line_stage if (pos, content_hash) in quote_ids)
+        )
+        return movies_inserted, quotes_inserted
+
+    def get_load_state(self, file_path):
+        row = self.conn.execute(
+            "SELECT checksum, records_loaded, completed FROM load_manifest WHERE file_path = ?", (file_path,)
+        ).fetchone()
+        return None if row is None else (row[0], row[1], bool(row[2]))
+
+    def record_load_progress(self, file_path, checksum, records_loaded, completed=False):
+        self.conn.execute("""
+        INSERT INTO load_manifest (file_path, checksum, records_loaded, completed, updated_at)
+        VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT (file_path) DO UPDATE
+            SET checksum = excluded.checksum, records_loaded = excluded.records_loaded,
+                completed = excluded.completed, updated_at = excluded.updated_at
+        """, (file_path, checksum, records_loaded, completed))
+
+    def segment_stored_quotes(self, batch_size=5000):
+        # Paged by id, so quotes that split into no turns (empty text) are read once
+        segmented = 0
+        last_id = 0
+        while True:
+            batch = self.conn.execute("""
+            SELECT q.id, q.quote_text FROM quotes q
+            WHERE q.id > ? AND NOT EXISTS (SELECT 1 FROM quote_lines l WHERE l.quote_id = q.id)
+            ORDER BY q.id
+            LIMIT ?
+            """, (last_id, batch_size)).fetchall()
+            if not batch:
+                return segmented
+            rows = [(quote_id,) + tuple(turn) for quote_id, text in batch for turn in segment_quote(text)]
+            self.conn.executemany(
+                "INSERT INTO quote_lines (quote_id, position, speaker, line, stage_direction) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            self.conn.commit()
+            segmented += len(batch)
+            last_id = batch[-1][0]
+
+    def dedup_stored_quotes(self, batch_size=5000):
+        clustered = 0
+
+        def find_anchors(keys):
+            anchors = {}
+            # Looked up in chunks to stay under SQLite's bound-parameter limit
+            for start in range(0, len(keys), 400):
+                chunk = keys[start:start + 400]
+                rows = self.conn.execute(f"""
+                WITH k(band, bucket) AS (VALUES {', '.join(['(?, ?)'] * len(chunk))})
+                SELECT k.band, k.bucket, q.cluster_id, q.minhash
+                FROM k
+                JOIN quote_buckets b ON b.band = k.band AND b.bucket = k.bucket
+                JOIN quotes q ON q.id = b.quote_id
+                """, [value for key in chunk for value in key])
+                anchors.update(((band, bucket), (cluster_id, unpack_signature(minhash)))
+                               for band, bucket, cluster_id, minhash in rows)
+            return anchors
+
+        while True:
+            batch = self.conn.execute(
+                "SELECT id, quote_text FROM quotes WHERE cluster_id IS NULL ORDER BY id LIMIT ?", (batch_size,)
+            ).fetchall()
+            if not batch:
+                return clustered
+            assigned, anchors = cluster_batch(batch, find_anchors)
+            self.conn.executemany("UPDATE quotes SET cluster_id = ?, minhash = ? WHERE id = ?",
+                                  ((cluster, minhash, quote_id) for quote_id, cluster, minhash in assigned))
+            self.conn.executemany("INSERT OR IGNORE INTO quote_buckets (band, bucket, quote_id) VALUES (?, ?, ?)",
+                                  anchors)
+            self.conn.execute("UPDATE stats_totals SET data_version = data_version + 1")
+            self.conn.commit()
+            clustered += len(batch)
+
+    def stats(self, refresh=False):
+        if refresh:
+            self.conn.executescript(f"BEGIN; {SQLITE_REFRESH_STATS} COMMIT;")
+        cur = self.conn.cursor()
+        cur.execute("SELECT movies, quotes, movies_with_quotes, refreshed_at FROM stats_totals")
+        movies, quotes, movies_with_quotes, refreshed_at = cur.fetchone()
+        return {
+            'movies': movies, 'quotes': quotes, 'movies_with_quotes': movies_with_quotes,
+            'refreshed_at': refreshed_at,
+            'letters': cur.execute("SELECT letter, movies FROM stats_letters WHERE movies > 0 ORDER BY letter").fetchall(),
+            'years': cur.execute("SELECT year, movies FROM stats_years WHERE movies > 0 ORDER BY year").fetchall(),
+        }
+
+    def data_version(self):
+        return self.conn.execute("SELECT data_version FROM stats_totals").fetchone()[0]
+
+    def search_quotes(self, query, movie_id=None, year=None, limit=20, cursor=None, collapse=False):
+        expression = fts5_query(query)
+        if not expression:
+            return []
+        # bm25() is lower for better matches; it is negated so ranks sort like ts_rank_cd
+        filters = []
+        params = {'query': expression, 'movie_id': movie_id, 'year': year, 'limit': limit}
+        if movie_id is not None:
+            filters.append("m.movie_id = :movie_id")
+        if year is not None:
+            filters.append("m.year = :year")
+        page = ["h.best"] if collapse else []
+        if cursor is not None:
+            page.append("(h.rank < :rank OR (h.rank = :rank AND h.id > :after))")
+            params['rank'], params['after'] = cursor
+        filters = ''.join(f" AND {condition}" for condition in filters)
+        page = f"WHERE {' AND '.join(page)}" if page else ''
+        return self.conn.execute(f"""
+        WITH hits AS (
+            SELECT q.id, m.movie_id, m.title, m.year, m.url, q.quote_text,
+                   round(-bm25(quotes_fts), {RANK_DIGITS}) AS rank, coalesce(q.cluster_id, q.id) AS cluster
+            FROM quotes_fts
+            JOIN quotes q ON q.id = quotes_fts.rowid
+            JOIN movies m ON m.id = q.movie_id
+            WHERE quotes_fts MATCH :query{filters}
+        ), ranked AS (
+            SELECT hits.*, row_number() OVER (PARTITION BY cluster ORDER BY rank DESC, id) = 1 AS best
+            FROM hits
+        )
+        SELECT h.id, h.movie_id, h.title, h.year, h.url, h.quote_text, h.rank
+        FROM {'ranked' if collapse else 'hits'} h
+        {page}
+        ORDER BY h.rank DESC, h.id
+        LIMIT :limit
+        """, params).fetchall()
+
+    def iter_movies(self, letter=None, year=None):
+        movies = self.conn.execute("""
+        SELECT id, title, year, movie_id, url FROM movies
+        WHERE (?1 IS NULL OR UPPER(SUBSTR(title, 1, 1)) = ?1) AND (?2 IS NULL OR year = ?2)
+        ORDER BY id
+        """, (letter, year))
+        for id, title, year, movie_id, url in movies:
+            quotes = self.conn.execute("SELECT quote_text FROM quotes WHERE movie_id = ? ORDER BY id", (id,))
+            yield {'title': _raw_title(title, year, movie_id), 'url': url,
+                   'quotes': [{'text': text} for text, in quotes]}
+
+    def list_movies(self, letter=None, year=None, limit=100, after=None):
+        movies = self.conn.execute("""
+        SELECT id, title, year, movie_id, url FROM movies
+        WHERE (?1 IS NULL OR UPPER(SUBSTR(title, 1, 1)) = ?1) AND (?2 IS NULL OR year = ?2) AND id > ?3
+        ORDER BY id
+        LIMIT ?4
+        """, (letter, year, after or 0, limit)).fetchall()
+        # One statement text whatever the page size, so the connection's statement cache reuses it
+        quotes = self.conn.execute(
+            "SELECT movie_id, quote_text FROM quotes WHERE movie_id IN (SELECT value FROM json_each(?)) ORDER BY id",
+            (json.dumps([movie[0] for movie in movies]),)
+        ).fetchall() if movies else []
+        return _movie_records(movies, quotes)
+
+    def get_movie(self, movie_id):
+        movies = self.conn.execute("SELECT id, title, year, movie_id, url FROM movies WHERE movie_id = ?",
+                                   (movie_id,)).fetchall()
+        if not movies:
+            return None
+        quotes = self.conn.execute("SELECT movie_id, quote_text FROM quotes WHERE movie_id = ? ORDER BY id",
+                                   (movies[0][0],)).fetchall()
+        return _movie_records(movies, quotes)[0][1]
+
+    def random_quote(self):
+        row = self.conn.execute("""
+        SELECT m.title, m.year, m.movie_id, m.url, q.quote_text
+        FROM quotes q
+        JOIN movies m ON m.id = q.movie_id
+        WHERE q.id >= (SELECT MIN(id) + ABS(RANDOM()) % (MAX(id) - MIN(id) + 1) FROM quotes)
+        ORDER BY q.id
+        LIMIT 1
+        """).fetchone()
+        if row is None:
+            return None
+        title, year, movie_id, url, text = row
+        return movie_id, _raw_title(title, year, movie_id), url, text
+
+
+def open_storage(url, create=True):
+    """
+    Open the storage a database URL names.
+
+    Args:
+        url (str): ``sqlite:///path/to/quotes.sqlite3`` for an embedded SQLite
+            file, otherwise a PostgreSQL DSN or URL
+        create (bool): create the tables if they don't exist
+    """
+    if url.startswith('sqlite:'):
+        path = url[len('sqlite:'):]
+        if path.startswith('///'):
+            path = path[3:]
+        storage = SqliteStorage(path)
+    else:
+        storage = PostgresStorage(url)
+    if create:
+        storage.create_schema()
+    return storage
@@ -1,75 +1,340 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File
-from fastapi.responses import JSONResponse
-from typing import List
+from fastapi import FastAPI, HTTPException, UploadFile, File, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+from pydantic import BaseModel, Field
+from starlette.concurrency import run_in_threadpool
+from typing import List, Optional
 import json
 import os
-import subprocess
+import threading
 import httpx
+from contextlib import asynccontextmanager
 
-app = FastAPI()
+from crawler.api_cache import HttpCache
+from crawler.async_storage import open_async_storage
+from crawler.db import parse_movie_title, parse_movie_url
+from crawler.jobs import CrawlJobManager, JobConflict, JobQueueFull
+from crawler.movie_index import MovieIndex, data_version
+from crawler.search import QuoteIndex, decode_cursor, encode_cursor
+from crawler.readers import iter_directory_records
+from crawler.segments import load_manifest
 
-CRAWLER_OUTPUT_FILE = "movies.json"
+@asynccontextmanager
+async def lifespan(app):
+    global database
+    if QUOTES_DATABASE:
+        database = open_async_storage(QUOTES_DATABASE, DATABASE_POOL_MIN, DATABASE_POOL_SIZE, DATABASE_ACQUIRE_TIMEOUT)
+        await database.open()
+    yield
+    # Don't leave crawler processes behind the API
+    crawl_jobs.shutdown()
+    if database is not None:
+        await database.close()
+        database = None
 
-def run_scrapy_crawler():
-    """Runs the Scrapy crawler and saves the output to a JSON file."""
+app = FastAPI(lifespan=lifespan)
+
+CRAWLER_OUTPUT_DIR = os.path.join("crawler", "output")
+
+# Movies, quotes, stats and search are read from a database when
+# QUOTES_DATABASE is set (sqlite:///path/to/quotes.sqlite3 or a PostgreSQL
+# DSN, POSTGRES_DSN by default), otherwise from the crawler output. The
+# database is read asynchronously through a pool of DATABASE_POOL_MIN to
+# DATABASE_POOL_SIZE connections; a request that waits longer than
+# DATABASE_ACQUIRE_TIMEOUT seconds for one gets a 503
+QUOTES_DATABASE = os.environ.get('QUOTES_DATABASE', os.environ.get('POSTGRES_DSN', ''))
+DATABASE_POOL_MIN = int(os.environ.get('DATABASE_POOL_MIN', '1'))
+DATABASE_POOL_SIZE = int(os.environ.get('DATABASE_POOL_SIZE', os.environ.get('SEARCH_POOL_SIZE', '10')))
+DATABASE_ACQUIRE_TIMEOUT = float(os.environ.get('DATABASE_ACQUIRE_TIMEOUT', '10'))
+database = None
+
+# Movie and search responses carry ETags of the data version and may be
+# cached by clients for CACHE_MAX_AGE seconds; bodies of COMPRESS_MIN_SIZE
+# bytes or more are compressed, and up to RESPONSE_CACHE_MB of encoded
+# bodies are kept in memory (0 turns that off)
+http_cache = HttpCache(
+    max_age=int(os.environ.get('CACHE_MAX_AGE', '60')),
+    min_size=int(os.environ.get('COMPRESS_MIN_SIZE', '1024')),
+    cache_bytes=int(float(os.environ.get('RESPONSE_CACHE_MB', '0')) * 1024 * 1024),
+)
+
+# Crawls run as supervised subprocesses, CRAWL_MAX_CONCURRENT at a time; up
+# to CRAWL_MAX_QUEUED more wait for a free slot
+crawl_jobs = CrawlJobManager(
+    os.environ.get('CRAWL_JOBS_DIR', os.path.join("crawler", "crawl_jobs")),
+    max_concurrent=int(os.environ.get('CRAWL_MAX_CONCURRENT', '1')),
+    max_queued=int(os.environ.get('CRAWL_MAX_QUEUED', '10')),
+    cancel_grace=float(os.environ.get('CRAWL_CANCEL_GRACE', '30')),
+)
+
+class CrawlRequest(BaseModel):
+    letters: str = Field('Z', description='Letter index pages, e.g. "Z", "Q,UV,X" or "all"')
+    batch_size: int = Field(0, ge=0, description='Movies to crawl, 0 for no limit')
+    max_movies: int = Field(0, ge=0, description='Maximum number of movies, 0 for no limit')
+    mode: str = Field('full', description="'full', 'incremental' or 'replay'")
+
+@app.post("/crawl", status_code=202)
+def crawl_website(request: Optional[CrawlRequest] = None):
+    """Queues a crawl and returns its job right away; poll /crawl/{job_id} for progress."""
+    request = request or CrawlRequest()
     try:
-        # Create crawler directory if it doesn't exist
-        os.makedirs("crawler", exist_ok=True)
-        
-        # Remove existing output file if it exists
-        output_path = os.path.join("crawler", CRAWLER_OUTPUT_FILE)
-        if os.path.exists(output_path):
-            os.remove(output_path)
-            
-        # Run the crawler using the run.py script with Poetry
-        result = subprocess.run(
-            ["poetry", "run", "python", f"crawler/run.py"],
-            check=True,
-            capture_output=True,
-            text=True
-        )
-        
-        print(f"Scrapy command output: {result.stdout}")
-        print(f"Scrapy error output: {result.stderr}")
-        
-        # Check if the output file was created
-        if os.path.exists(output_path):
-            print(f"Scrapy crawler output file created: {output_path}")
-        else:
-            print(f"Warning: Output file not found at {output_path}")
-    except subprocess.CalledProcessError as e:
-        print(f"Error running Scrapy: {e.stderr}")
-        raise HTTPException(status_code=500, detail=f"Error running Scrapy: {e.stderr}")
-    except FileNotFoundError:
-        raise HTTPException(status_code=500, detail="Scrapy command not found. Ensure Scrapy is installed.")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {e}")
-
-@app.post("/crawl")
-async def crawl_website():
-    """Starts the web crawling process."""
-    run_scrapy_crawler()
-    return {"message": "Crawling started. Check /movies for results."}
+        job = crawl_jobs.submit(request.letters, request.batch_size, request.max_movies, request.mode)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except JobConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    return job.to_dict()
+
+@app.get("/crawl")
+def list_crawl_jobs():
+    """Lists crawl jobs, newest first."""
+    return {'jobs': [job.to_dict() for job in crawl_jobs.list()]}
+
+@app.get("/crawl/{job_id}")
+def get_crawl_job(job_id: str):
+    """Status and progress of a crawl job."""
+    job = crawl_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown crawl job")
+    return job.to_dict()
+
+@app.delete("/crawl/{job_id}")
+def cancel_crawl_job(job_id: str):
+    """Cancels a queued or running crawl job."""
+    job = crawl_jobs.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown crawl job")
+    return job.to_dict()
+
+@app.exception_handler(TimeoutError)
+async def database_busy(request: Request, exc: TimeoutError):
+    """Every pooled connection stayed busy for DATABASE_ACQUIRE_TIMEOUT seconds."""
+    return JSONResponse({'detail': 'Database busy, try again'}, status_code=503, headers={'Retry-After': '1'})
+
+def stream_ndjson(lines):
+    """Serialize records (dicts or JSON text) as JSON Lines."""
+    for line in lines:
+        yield (line if isinstance(line, str) else json.dumps(line)) + "\n"
+
+async def stream_ndjson_async(records):
+    async for record in records:
+        yield json.dumps(record) + "\n"
+
+def movies_page(records, next_cursor):
+    """The JSON text of a /movies page from records already serialized to JSON."""
+    return '{"movies": [' + ', '.join(records) + '], "next_cursor": ' + json.dumps(next_cursor) + '}'
+
+async def database_version():
+    """Data version of the database, for ETags."""
+    return ('database', QUOTES_DATABASE, await database.data_version())
 
 @app.get("/movies")
-async def get_movies():
-    """Retrieves the scraped movie data."""
-    output_path = os.path.join("crawler", CRAWLER_OUTPUT_FILE)
-    if not os.path.exists(output_path):
-        raise HTTPException(status_code=404, detail="No data found. Run /crawl first.")
+async def get_movies(
+    request: Request,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    letter: Optional[str] = Query(None, min_length=1, max_length=1, description='First letter of the title'),
+    year: Optional[int] = None,
+    format: str = Query('json', pattern='^(json|ndjson)$', description='json: one page; ndjson: every match'),
+):
+    """
+    Pages through the scraped movies, optionally filtered by title letter and
+    year. Pass next_cursor back as cursor for the next page; format=ndjson
+    streams every matching movie as JSON Lines instead.
+    """
     try:
-        with open(output_path, "r") as f:
-            content = f.read()
-            if not content.strip():
-                raise HTTPException(status_code=404, detail="Empty data file. Try running /crawl again.")
-            data = json.loads(content)
-        return JSONResponse(content=data)
-    except json.JSONDecodeError:
-        raise HTTPException(status_code=500, detail="Error decoding JSON data.")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {e}")
+        after = int(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    letter = letter.upper() if letter else None
+    if not QUOTES_DATABASE:
+        return await run_in_threadpool(get_indexed_movies, request, limit, after, letter, year, format)
+    version = await database_version()
+    if format == 'ndjson':
+        return http_cache.stream(request, version, lambda: stream_ndjson_async(database.iter_movies(letter, year)),
+                                 "application/x-ndjson")
+
+    async def stored_page():
+        rows = await database.list_movies(letter, year, limit, after)
+        next_cursor = str(rows[-1][0]) if len(rows) == limit else None
+        return movies_page([json.dumps(record) for _, record in rows], next_cursor)
+
+    return await http_cache.respond_async(request, version, stored_page)
+
+def get_indexed_movies(request, limit, after, letter, year, format):
+    version = data_version(CRAWLER_OUTPUT_DIR)
+    index = get_movie_index(version)
+    if not len(index):
+        raise HTTPException(status_code=404, detail="No data found. Run /crawl first.")
+    if format == 'ndjson':
+        return http_cache.stream(request, version, lambda: stream_ndjson(index.iter_json(letter, year)),
+                                 "application/x-ndjson")
+
+    def indexed_page():
+        rows, more = index.page(letter, year, limit, after)
+        return movies_page([record for _, record in rows], str(rows[-1][0]) if more else None)
+
+    return http_cache.respond(request, version, indexed_page)
+
+async def stored_movie(movie_id):
+    record = await database.get_movie(movie_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Movie not found")
+    return record
+
+def get_indexed_movie(movie_id, version=None):
+    index = get_movie_index(version)
+    position = index.find(movie_id)
+    if position is None:
+        raise HTTPException(status_code=404, detail="Movie not found")
+    return index, position
+
+@app.get("/movies/{movie_id}")
+async def get_movie(request: Request, movie_id: int):
+    """One movie by its quotes.net id."""
+    if QUOTES_DATABASE:
+        return await http_cache.respond_async(request, await database_version(), lambda: stored_movie(movie_id))
+
+    def indexed_movie(version):
+        # Served as stored, without decoding it
+        index, position = get_indexed_movie(movie_id, version)
+        return index.record_json(position)
+
+    return await run_in_threadpool(respond_from_output, request, indexed_movie)
+
+def movie_quotes(movie_id, record):
+    return {'movie_id': movie_id, 'title': record['title'], 'quotes': record['quotes']}
+
+@app.get("/movies/{movie_id}/quotes")
+async def get_movie_quotes(request: Request, movie_id: int):
+    """The quotes of one movie."""
+    if QUOTES_DATABASE:
+        async def stored_quotes():
+            return movie_quotes(movie_id, await stored_movie(movie_id))
+
+        return await http_cache.respond_async(request, await database_version(), stored_quotes)
+
+    def indexed_quotes(version):
+        index, position = get_indexed_movie(movie_id, version)
+        return movie_quotes(movie_id, index.record(position))
+
+    return await run_in_threadpool(respond_from_output, request, indexed_quotes)
+
+def respond_from_output(request, build):
+    """The cached response for data read from the crawler output by build(version)."""
+    version = data_version(CRAWLER_OUTPUT_DIR)
+    return http_cache.respond(request, version, lambda: build(version))
+
+# A new pick on every request, so never cached
+NO_STORE = {'Cache-Control': 'no-store'}
+
+@app.get("/quotes/random")
+async def get_random_quote():
+    """A random quote with its movie."""
+    if QUOTES_DATABASE:
+        row = await database.random_quote()
+        if row is None:
+            raise HTTPException(status_code=404, detail="No quotes found")
+        movie_id, title, url, text = row
+        return JSONResponse({'movie_id': movie_id, 'title': title, 'url': url, 'text': text}, headers=NO_STORE)
+    return await run_in_threadpool(indexed_random_quote)
+
+def indexed_random_quote():
+    picked = get_movie_index().random_quote()
+    if picked is None:
+        raise HTTPException(status_code=404, detail="No quotes found. Run /crawl first.")
+    record, quote = picked
+    title, year, title_movie_id = parse_movie_title(record['title'])
+    return JSONResponse({'movie_id': parse_movie_url(record['url']) or title_movie_id, 'title': record['title'],
+                         'url': record['url'], 'text': quote['text']}, headers=NO_STORE)
+
+@app.get("/stats")
+async def get_stats(request: Request):
+    """Movie and quote totals, and movies per title letter and per year."""
+    if QUOTES_DATABASE:
+        return await http_cache.respond_async(request, await database_version(), database.stats)
+
+    def indexed_stats(version):
+        return get_movie_index(version).stats()
+
+    return await run_in_threadpool(respond_from_output, request, indexed_stats)
 
 @app.get("/health")
 async def health_check():
-    """Health check endpoint."""
-    return {"status": "ok"}
\ No newline at end of file
+    """Health check endpoint, with the database pool's state when there is one."""
+    if database is not None:
+        return {"status": "ok", "database_pool": database.pool_state()}
+    return {"status": "ok"}
+
+@app.get("/metrics")
+async def get_metrics():
+    """Database pool and query metrics in the Prometheus text format."""
+    if database is None:
+        raise HTTPException(status_code=404, detail="No database configured")
+    return PlainTextResponse(database.render_metrics(), media_type='text/plain; version=0.0.4; charset=utf-8')
+
+_search_lock = threading.Lock()
+_search_index = {'generation': None, 'index': None}
+_movie_lock = threading.Lock()
+_movie_index = {'version': None, 'index': None}
+
+def get_quote_index():
+    """The in-process search index, rebuilt when the output manifest changes."""
+    generation = load_manifest(CRAWLER_OUTPUT_DIR).get('generation')
+    with _search_lock:
+        if _search_index['index'] is None or _search_index['generation'] != generation:
+            _search_index['index'] = QuoteIndex.from_records(iter_directory_records(CRAWLER_OUTPUT_DIR))
+            _search_index['generation'] = generation
+        return _search_index['index']
+
+def get_movie_index(version=None):
+    """The in-process movie index, rebuilt when the crawler output changes."""
+    version = version or data_version(CRAWLER_OUTPUT_DIR)
+    with _movie_lock:
+        if _movie_index['index'] is None or _movie_index['version'] != version:
+            _movie_index['index'] = MovieIndex.from_directory(CRAWLER_OUTPUT_DIR)
+            _movie_index['version'] = version
+        return _movie_index['index']
+
+@app.get("/search")
+async def search(
+    request: Request,
+    q: str = Query(..., min_length=1, description='Words, "quoted phrases"'),
+    movie_id: Optional[int] = None,
+    year: Optional[int] = None,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    collapse: bool = False,
+):
+    """
+    Full-text search over the quotes, best matches first. Pass next_cursor back
+    as cursor for the next page; collapse keeps one hit per near-duplicate cluster.
+    """
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    def search_results(rows):
+        results = [
+            {'quote_id': quote_id, 'movie_id': movie, 'title': title, 'year': movie_year, 'url': url,
+             'text': text, 'rank': rank}
+            for quote_id, movie, title, movie_year, url, text, rank in rows
+        ]
+        next_cursor = encode_cursor(results[-1]['rank'], results[-1]['quote_id']) if len(results) == limit else None
+        return {'query': q, 'results': results, 'next_cursor': next_cursor}
+
+    if QUOTES_DATABASE:
+        async def stored_results():
+            return search_results(await database.search_quotes(q, movie_id, year, limit, after, collapse))
+
+        return await http_cache.respond_async(request, await database_version(), stored_results)
+
+    def indexed_results():
+        if not load_manifest(CRAWLER_OUTPUT_DIR)['segments']:
+            raise HTTPException(status_code=404, detail="No data found. Run /crawl first.")
+        return http_cache.respond(request, data_version(CRAWLER_OUTPUT_DIR), lambda: search_results(
+            get_quote_index().search(q, movie_id, year, limit, after, collapse)))
+
+    return await run_in_threadpool(indexed_results)
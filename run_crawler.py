@@ -1,10 +1,12 @@
 import subprocess
 import os
 import sys
-import json
 import argparse
 from datetime import datetime
 
+from crawler.readers import iter_movie_records
+from crawler.segments import load_manifest, segment_paths
+
 def run_crawler(batch_size=20, start_index=0, max_movies=0, display_quotes=True):
     """
     Runs the Scrapy crawler with batch processing.
@@ -23,9 +25,9 @@ def run_crawler(batch_size=20, start_index=0, max_movies=0, display_quotes=True)
         jobs_dir = os.path.join("crawler", "jobs")
         os.makedirs(jobs_dir, exist_ok=True)
         
-        # Determine output path
-        output_filename = "movies.json"
-        output_path = os.path.join("crawler", output_filename)
+        # Output segments are listed in the manifest of this directory
+        output_dir = os.path.join("crawler", "output")
+        segments_before = len(load_manifest(output_dir)['segments']) if os.path.isdir(output_dir) else 0
             
         # Build command with arguments
         cmd = [
@@ -37,62 +39,45 @@ def run_crawler(batch_size=20, start_index=0, max_movies=0, display_quotes=True)
         if max_movies > 0:
             cmd.extend(["--max-movies", str(max_movies)])
             
-        # Always append to movies.json
+        # Ignored by run.py; output segments are always added to the manifest
         cmd.append("--append")
             
         # Run the crawler using the run.py script with Poetry
         print(f"Starting crawler with batch_size={batch_size}, start_index={start_index}, max_movies={max_movies}")
-        print(f"Output will be saved to: {output_path}")
-        
-        result = subprocess.run(
-            cmd,
-            check=True,
-            capture_output=True,
-            text=True
-        )
-        
-        print(f"Scrapy command output: {result.stdout}")
+        print(f"Output will be saved to: {output_dir}")
         
-        if result.stderr:
-            print(f"Scrapy error output: {result.stderr}")
+        # Let the crawler's output stream straight to the terminal instead of buffering it
+        subprocess.run(cmd, check=True)
         
-        # Check if the output file was created
-        if os.path.exists(output_path):
-            print(f"Output file created at: {output_path}")
+        # Check if the crawler finished any output segments
+        if os.path.isdir(output_dir) and load_manifest(output_dir)['segments']:
+            print(f"Output segments in: {output_dir}")
             
             # Display quotes if requested
             if display_quotes:
-                with open(output_path, "r") as f:
-                    content = f.read()
-                    if content.strip():
-                        print(f"Successfully scraped data")
-                        
-                        # Print out the quote list
-                        print("\n===== MOVIE QUOTES =====\n")
-                        try:
-                            movies = json.loads(content)
-                            for movie in movies:
-                                print(f"Movie: {movie['title']}")
-                                print(f"URL: {movie['url']}")
-                                print(f"Quotes ({len(movie['quotes'])}):")
-                                
-                                for i, quote in enumerate(movie['quotes'], 1):
-                                    print(f"  {i}. {quote['text'][:100]}..." if len(quote['text']) > 100 else f"  {i}. {quote['text']}")
-                                
-                                print("\n" + "-" * 50 + "\n")
-                        except json.JSONDecodeError:
-                            print("Error: Could not parse JSON data")
-                    else:
-                        print("Warning: Output file is empty")
+                print(f"Successfully scraped data")
+                
+                # Print out the quote list, streaming the segments written by this batch
+                print("\n===== MOVIE QUOTES =====\n")
+                new_segments = segment_paths(output_dir)[segments_before:]
+                for movie in (movie for path in new_segments for movie in iter_movie_records(path)):
+                    print(f"Movie: {movie['title']}")
+                    print(f"URL: {movie['url']}")
+                    print(f"Quotes ({len(movie['quotes'])}):")
+                    
+                    for i, quote in enumerate(movie['quotes'], 1):
+                        print(f"  {i}. {quote['text'][:100]}..." if len(quote['text']) > 100 else f"  {i}. {quote['text']}")
+                    
+                    print("\n" + "-" * 50 + "\n")
             
             # Calculate next batch information
             next_start = start_index + batch_size
             print(f"\nTo process the next batch, run with: --start-index {next_start}")
         else:
-            print(f"Warning: Output file not found at {output_path}")
+            print(f"Warning: No output segments found in {output_dir}")
             
     except subprocess.CalledProcessError as e:
-        print(f"Error running Scrapy: {e.stderr}")
+        print(f"Error running Scrapy: exit code {e.returncode}")
         return 1
     except FileNotFoundError:
         print("Scrapy command not found. Ensure Scrapy is installed.")
@@ -114,7 +99,7 @@ def main():
                         help='Maximum number of movies to process, 0 for no limit (default: 0)')
     # --append flag is no longer needed but kept for backward compatibility
     parser.add_argument('--append', action='store_true',
-                        help='[Deprecated] Always appends to movies.json')
+                        help='[Deprecated] Output segments are always added to crawler/output')
     parser.add_argument('--no-display', action='store_true',
                         help='Do not display quotes in the terminal')
     